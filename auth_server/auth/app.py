@@ -0,0 +1,193 @@
+"""Token endpoints of the auth server.
+
+`POST /token` with a JSON body answers `{"access_token": ...,
+"token_type": "bearer", "expires_in": ..., "refresh_token": ...}`, for
+the grants:
+
+- `{"grant_type": "password", "email": ..., "password": ...}`, 401 when
+  the email or the password is wrong,
+- `{"grant_type": "refresh_token", "refresh_token": ...}`, 401 when the
+  token is invalid or expired, or its user is gone.
+
+`POST /login` is the password grant without `grant_type`. Tokens are
+signed by a `TokenIssuer`, with a key kept in memory (see `auth.tokens`),
+and users are read through a pool of connections set by the `db_pool`
+config entry, so refreshing tokens costs a query and a signature.
+
+Passwords are checked by the worker processes of a `PasswordHasher`, the
+event loop only waits for them: when too many logins are in progress, new
+ones are answered 503 right away, before reaching the database.
+
+Passwords hashed with other parameters than the current ones are hashed
+again on login, in the same worker call, and their new hash is saved unless
+the password was changed in the meantime.
+
+    % PYTHONPATH=.:.. AUTH_SERVER_CONFIG=./config.json uvicorn auth.app:app
+"""
+import json
+import logging
+
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.orm import sessionmaker
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from auth.hashing import Overloaded, PasswordHasher
+from auth.lib import get_config
+from auth.model import User
+from auth.tokens import InvalidRefreshToken, TokenIssuer
+from common.config import check, complete
+
+
+log = logging.getLogger(__name__)
+
+# seconds
+RETRY_AFTER = 1
+
+# settings of the "db_pool" config entry, see sqlalchemy `create_engine`
+DB_POOL_DEFAULTS = {
+    "pool_size": 20,
+    "max_overflow": 10,
+    # seconds
+    "pool_timeout": 5,
+    "pool_recycle": 3600,
+}
+
+
+def db_pool_config(config):
+    """Connection pool arguments of the `db_pool` entry."""
+    settings = complete("db_pool", config, DB_POOL_DEFAULTS)
+    check("db_pool", settings, "pool_size", int, 1)
+    # -1: no limit, and no recycling
+    check("db_pool", settings, "max_overflow", int, -1)
+    check("db_pool", settings, "pool_timeout", float, 0)
+    check("db_pool", settings, "pool_recycle", int, -1)
+    return settings
+
+
+def error(message, status_code, headers=None):
+    return JSONResponse({"error": message}, status_code=status_code, headers=headers)
+
+
+def overloaded():
+    return error("overloaded", 503, {"Retry-After": str(RETRY_AFTER)})
+
+
+async def read_body(request):
+    """JSON object of a request body, None if it isn't one."""
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def read_credentials(body):
+    """`(email, password)` of a password grant, None if it has none."""
+    email, password = body.get("email"), body.get("password")
+    if not isinstance(email, str) or not isinstance(password, str):
+        return None
+    return email, password.encode()
+
+
+async def save_rehash(state, user, rehashed):
+    async with state.session() as s:
+        await s.execute(
+            update(User)
+            .where(User.id == user.id, User.password == user.password)
+            .values(password=rehashed)
+        )
+        await s.commit()
+    log.info(f"password of {user.email} hashed again")
+
+
+async def password_grant(state, body):
+    if (credentials := read_credentials(body)) is None:
+        return error("invalid_request", 400)
+    if state.hasher.full:
+        return overloaded()
+    email, password = credentials
+    async with state.session() as s:
+        user = (await s.execute(select(User).filter(User.email == email))).scalar()
+    try:
+        valid, rehashed = await state.hasher.check(
+            password, user.password if user else None
+        )
+    except Overloaded:
+        return overloaded()
+    except ValueError as e:
+        # a stored hash which can't be read, the password can't be checked
+        log.error(f"password of {email} not checked: {e}")
+        return error("invalid_grant", 401)
+    if not valid:
+        log.debug(f"login of {email} failed")
+        return error("invalid_grant", 401)
+    if rehashed is not None:
+        await save_rehash(state, user, rehashed)
+    return JSONResponse(state.issuer.issue(user))
+
+
+async def refresh_token_grant(state, body):
+    if not isinstance(token := body.get("refresh_token"), str):
+        return error("invalid_request", 400)
+    try:
+        user_id = state.issuer.refreshed_user_id(token)
+    except InvalidRefreshToken as e:
+        log.debug(str(e))
+        return error("invalid_grant", 401)
+    async with state.session() as s:
+        if (user := await s.get(User, user_id)) is None:
+            return error("invalid_grant", 401)
+    return JSONResponse(state.issuer.issue(user))
+
+
+GRANTS = {"password": password_grant, "refresh_token": refresh_token_grant}
+
+
+async def token(request):
+    if (body := await read_body(request)) is None:
+        return error("invalid_request", 400)
+    if (grant := GRANTS.get(body.get("grant_type"))) is None:
+        return error("unsupported_grant_type", 400)
+    return await grant(request.app.state, body)
+
+
+async def login(request):
+    if (body := await read_body(request)) is None:
+        return error("invalid_request", 400)
+    return await password_grant(request.app.state, body)
+
+
+def create_app(config=None):
+    app = Starlette(
+        routes=[
+            Route("/token", token, methods=["POST"]),
+            Route("/login", login, methods=["POST"]),
+        ]
+    )
+
+    @app.on_event("startup")
+    async def startup():
+        settings = config or get_config()
+        app.state.issuer = TokenIssuer.from_config(settings.get("tokens", {}))
+        app.state.eng = create_async_engine(
+            settings["db_url"], **db_pool_config(settings.get("db_pool", {}))
+        )
+        app.state.session = sessionmaker(
+            app.state.eng, expire_on_commit=False, class_=AsyncSession
+        )
+        app.state.hasher = PasswordHasher.from_config(settings.get("hashing", {}))
+        await app.state.hasher.start()
+
+    @app.on_event("shutdown")
+    async def shutdown():
+        app.state.hasher.close()
+        await app.state.eng.dispose()
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,253 @@
+"""Password hashing off the event loop.
+
+scrypt is made to be slow and to need memory: run in the thread serving
+requests, a burst of logins would block every other one. `PasswordHasher`
+runs it in a pool of processes, one per core by default, and bounds the
+number of hashes waiting for a worker: past `max_pending`, logins are
+rejected at once with `Overloaded` rather than queued for longer than a
+client would wait.
+
+Hashes describe themselves, in the PHC string format:
+
+    $scrypt$ln=14,r=8,p=1$<base64 salt>$<base64 hash>
+
+where `ln` is the base 2 logarithm of N. They are checked with the
+parameters they record, so the cost of new hashes (the parameters of the
+configured `version`) can change without breaking the existing ones.
+Hashes of other parameters are computed again, with the target ones, on
+the next successful login. Hashes from before this format, raw salt then
+hash bytes, are read as ones of version 1.
+"""
+import asyncio
+import base64
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import scrypt
+import hmac
+import logging
+import multiprocessing
+import os
+
+from common.config import check, complete
+
+
+log = logging.getLogger(__name__)
+
+SALT_SIZE = 16
+HASH_SIZE = 64
+
+PREFIX = b"$scrypt$"
+
+# OpenSSL takes the memory limit of scrypt as a C int
+MAX_MEMORY = 2**31 - 1
+# over the blocks of scrypt, capped at MAX_MEMORY
+MEMORY_HEADROOM = 2**20
+
+
+def scrypt_memory(n, r, p):
+    """Bytes of the blocks OpenSSL allocates for scrypt."""
+    return 128 * r * (n + p + 2)
+
+
+def check_params(version, params):
+    """Refuse scrypt parameters OpenSSL wouldn't compute."""
+    if set(params) != {"n", "r", "p"}:
+        raise ValueError(f"hashing version {version} needs n, r and p.")
+    if any(not isinstance(v, int) or isinstance(v, bool) for v in params.values()):
+        raise ValueError(f"hashing version {version} parameters should be int.")
+    if params["n"] < 2 or params["n"] & (params["n"] - 1):
+        raise ValueError(f"hashing version {version} n should be a power of 2.")
+    if params["r"] < 1 or params["p"] < 1:
+        raise ValueError(f"hashing version {version} r and p should be at least 1.")
+    if scrypt_memory(**params) > MAX_MEMORY:
+        raise ValueError(
+            f"hashing version {version} needs more than {MAX_MEMORY} bytes."
+        )
+    return params
+
+
+def check_versions(versions):
+    for version, params in versions.items():
+        check_params(version, params)
+    return versions
+
+
+# version -> scrypt parameters, version 1 is the one of the raw hashes
+VERSIONS = check_versions({1: {"n": 8, "r": 16384, "p": 1}})
+
+# settings of the "hashing" config entry
+HASHING_DEFAULTS = {
+    # version of the new hashes
+    "version": 1,
+    # completes or overrides VERSIONS, keys are versions
+    "versions": {},
+    # one worker process per core when not given
+    "workers": None,
+    # hashes being computed or waiting for a worker
+    "max_pending": 64,
+}
+
+
+class Overloaded(Exception):
+    pass
+
+
+def hashing_config(config):
+    """Hash versions and worker pool settings of the `hashing` entry."""
+    settings = complete("hashing", config, HASHING_DEFAULTS)
+    versions = dict(VERSIONS)
+    for version, params in settings["versions"].items():
+        versions[int(version)] = dict(params)
+    settings["versions"] = check_versions(versions)
+    if settings["version"] not in versions:
+        raise ValueError(f"unknown hashing version {settings['version']}.")
+    if settings["workers"] is None:
+        settings["workers"] = os.cpu_count() or 1
+    for key in ("workers", "max_pending"):
+        check("hashing", settings, key, int, 1)
+    return settings
+
+
+def current_params(config):
+    """scrypt parameters of new hashes, given the `hashing` config entry."""
+    settings = hashing_config(config)
+    return settings["versions"][settings["version"]]
+
+
+def scrypt_hash(password, salt, n, r, p, size=HASH_SIZE):
+    maxmem = min(scrypt_memory(n, r, p) + MEMORY_HEADROOM, MAX_MEMORY)
+    return scrypt(password, salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=size)
+
+
+def _b64encode(data):
+    return base64.b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data):
+    return base64.b64decode(data + b"=" * (-len(data) % 4), validate=True)
+
+
+def encode(params, salt, digest):
+    ln = params["n"].bit_length() - 1
+    return b"%sln=%d,r=%d,p=%d$%s$%s" % (
+        PREFIX,
+        ln,
+        params["r"],
+        params["p"],
+        _b64encode(salt),
+        _b64encode(digest),
+    )
+
+
+def decode(hashed):
+    """`(params, salt, hash)` of a stored hash."""
+    if not hashed.startswith(PREFIX):
+        return VERSIONS[1], hashed[:SALT_SIZE], hashed[SALT_SIZE:]
+    try:
+        settings, salt, digest = hashed[len(PREFIX) :].split(b"$")
+        settings = dict(item.split(b"=") for item in settings.split(b","))
+        params = {
+            "n": 1 << int(settings[b"ln"]),
+            "r": int(settings[b"r"]),
+            "p": int(settings[b"p"]),
+        }
+        return check_params(None, params), _b64decode(salt), _b64decode(digest)
+    except (ValueError, KeyError) as e:
+        raise ValueError("malformed password hash.") from e
+
+
+def hash_password(password, params, salt=None):
+    """Encoded hash of `password` with the scrypt `params`."""
+    salt = salt or os.urandom(SALT_SIZE)
+    return encode(params, salt, scrypt_hash(password, salt, **params))
+
+
+def check_password(password, hashed):
+    """Whether `password` matches `hashed`, checked with its own parameters."""
+    params, salt, expected = decode(hashed)
+    digest = scrypt_hash(password, salt, **params, size=len(expected))
+    return hmac.compare_digest(digest, expected)
+
+
+def needs_rehash(hashed, params):
+    return not hashed.startswith(PREFIX) or decode(hashed)[0] != params
+
+
+def check_and_rehash(password, hashed, params):
+    """`(valid, new hash)`, the new hash being None unless a rehash is due."""
+    if not check_password(password, hashed):
+        return False, None
+    if not needs_rehash(hashed, params):
+        return True, None
+    return True, hash_password(password, params)
+
+
+def _ready():
+    return True
+
+
+class PasswordHasher:
+    def __init__(self, versions=VERSIONS, version=1, workers=1, max_pending=64):
+        self.versions = versions
+        self.version = version
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        # workers don't inherit the event loop, the sockets or the db pool
+        self.pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+        )
+        self.workers = workers
+        # checked when the user is unknown, so that it takes as long
+        self.dummy = hash_password(b"", versions[version])
+
+    @classmethod
+    def from_config(cls, config):
+        settings = hashing_config(config)
+        return cls(
+            settings["versions"],
+            settings["version"],
+            settings["workers"],
+            settings["max_pending"],
+        )
+
+    async def start(self):
+        """Start the workers before the first login."""
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(loop.run_in_executor(self.pool, _ready) for _ in range(self.workers))
+        )
+
+    @property
+    def full(self):
+        return self.pending >= self.max_pending
+
+    async def _run(self, fn, *args):
+        if self.full:
+            self.rejected += 1
+            raise Overloaded("too many logins in progress.")
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.pool, fn, *args
+            )
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password):
+        """Encoded hash of `password` with the current version parameters."""
+        return await self._run(hash_password, password, self.versions[self.version])
+
+    async def check(self, password, hashed):
+        """Whether `password` matches `hashed`, None standing for no user.
+
+        Return `(valid, new hash)`: a valid password is hashed again when
+        `hashed` wasn't done with the current parameters.
+        """
+        params = self.versions[self.version]
+        if hashed is None:
+            await self._run(check_password, password, self.dummy)
+            return False, None
+        return await self._run(check_and_rehash, password, hashed, params)
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
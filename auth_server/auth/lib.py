@@ -0,0 +1,9 @@
+import os
+import json
+
+
+def get_config():
+    config_path = os.environ["AUTH_SERVER_CONFIG"]
+    with open(config_path) as f:
+        config = json.load(f)
+    return config
@@ -1,6 +1,5 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import os
-from hashlib import scrypt
 
 from email_validator import validate_email, EmailNotValidError
 import jwt
@@ -13,12 +12,12 @@ from sqlalchemy import (
 )
 from sqlalchemy.orm import declarative_base, validates
 
+from auth.hashing import check_password, current_params, hash_password
+from auth.tokens import CLOCK_SKEW, SECRET_PATH_ENV
+from common.keyfile import read_key
 
-Base = declarative_base()
 
-_SCRYPT_N = 8
-_SCRYPT_R = 16384
-_SCRYPT_P = 1
+Base = declarative_base()
 
 
 class User(Base):
@@ -38,13 +37,26 @@ class User(Base):
         return pw
 
     @classmethod
-    def make_new(cls, email, password, first_name=None, last_name=None, is_admin=False):
-        salt = os.urandom(16)
+    def make_new(
+        cls,
+        email,
+        password,
+        first_name=None,
+        last_name=None,
+        is_admin=False,
+        *,
+        params=None,
+    ):
+        """New user, its password hashed with the scrypt `params`.
+
+        Those of the configured version are given by `hashing.current_params`,
+        the default version ones are used when not given.
+        """
+        params = params or current_params({})
         cls.check_pw_syntax(password)
-        hpwd = scrypt(password, salt=salt, n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P)
         return User(
             email=email,
-            password=salt + hpwd,
+            password=hash_password(password, params),
             first_name=first_name,
             last_name=last_name,
             is_admin=is_admin,
@@ -66,19 +78,26 @@ class User(Base):
             return "urn:user"
 
     def check_password(self, pw):
-        salt = self.password[:16]
-        hpwd = self.password[16:]
-        return scrypt(pw, salt=salt, n=_SCRYPT_N, r=_SCRYPT_R, p=_SCRYPT_P) == hpwd
+        return check_password(pw, self.password)
+
+    def generate_token(
+        self, secret=None, lifetime=timedelta(minutes=1), algorithm="HS256"
+    ):
+        """Access token of the user, signed with `secret`.
 
-    def generate_token(self):
-        if not (secret_path := os.environ.get("AUTH_SERVER_SECRET_PATH", False)):
-            raise RuntimeError("no path to secret. please set AUTH_SERVER_SECRET_PATH.")
-        with open(secret_path) as f:
-            secret = f.readline()
+        The secret is read from AUTH_SERVER_SECRET_PATH when not given.
+        """
+        if secret is None:
+            if not (secret_path := os.environ.get(SECRET_PATH_ENV, False)):
+                raise RuntimeError(
+                    "no path to secret. please set AUTH_SERVER_SECRET_PATH."
+                )
+            secret = read_key(secret_path, algorithm)
+        now = datetime.now(timezone.utc)
         payload = {
-            "exp": (datetime.utcnow() + timedelta(minutes=1)).timestamp(),
-            "nbf": (datetime.utcnow() - timedelta(minutes=1)).timestamp(),
+            "exp": (now + lifetime).timestamp(),
+            "nbf": (now - CLOCK_SKEW).timestamp(),
             "aud": self.audience_urn,
             "email": self.email,
         }
-        return jwt.encode(payload, secret, algorithm="HS256")
+        return jwt.encode(payload, secret, algorithm=algorithm)
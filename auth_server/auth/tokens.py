@@ -0,0 +1,112 @@
+"""Signing of the access and refresh tokens.
+
+The signing key is read once, at startup, and again when its file changes,
+checked at most every `key_check_interval` seconds. Access tokens last
+`access_lifetime` seconds. Refresh tokens last `refresh_lifetime` seconds
+and can only be traded for new tokens: their audience isn't one of the
+APIs, and they only name the user, whose current email and audience are
+read again on refresh.
+"""
+from datetime import datetime, timedelta, timezone
+import os
+import time
+
+import jwt
+
+from common.config import check, complete
+from common.keyfile import KeyFile
+
+
+SECRET_PATH_ENV = "AUTH_SERVER_SECRET_PATH"
+
+REFRESH_AUDIENCE = "urn:refresh"
+
+# tokens are valid a bit before they are issued, for the clocks of the APIs
+CLOCK_SKEW = timedelta(minutes=1)
+
+# settings of the "tokens" config entry
+TOKENS_DEFAULTS = {
+    # defaults to the AUTH_SERVER_SECRET_PATH environment variable
+    "secret_path": None,
+    "algorithm": "HS256",
+    # seconds
+    "access_lifetime": 60,
+    "refresh_lifetime": 14 * 24 * 3600,
+    "key_check_interval": 10,
+}
+
+
+class InvalidRefreshToken(Exception):
+    pass
+
+
+def tokens_config(config):
+    """Signing settings of the `tokens` entry."""
+    settings = complete("tokens", config, TOKENS_DEFAULTS)
+    if settings["secret_path"] is None:
+        settings["secret_path"] = os.environ.get(SECRET_PATH_ENV)
+    if not settings["secret_path"]:
+        raise ValueError(f"tokens needs a secret_path or {SECRET_PATH_ENV}.")
+    if not settings["algorithm"].startswith("HS"):
+        raise ValueError(f"unsupported tokens algorithm {settings['algorithm']}.")
+    for key in ("access_lifetime", "refresh_lifetime"):
+        check("tokens", settings, key, float, 1)
+    check("tokens", settings, "key_check_interval", float, 0)
+    return settings
+
+
+class TokenIssuer:
+    def __init__(self, settings, clock=time.monotonic):
+        self.algorithm = settings["algorithm"]
+        self.access_lifetime = timedelta(seconds=settings["access_lifetime"])
+        self.refresh_lifetime = timedelta(seconds=settings["refresh_lifetime"])
+        self.key = KeyFile(
+            settings["secret_path"],
+            self.algorithm,
+            settings["key_check_interval"],
+            clock,
+        )
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(tokens_config(config))
+
+    def _encode(self, payload, lifetime):
+        now = datetime.now(timezone.utc)
+        payload = {
+            **payload,
+            "exp": (now + lifetime).timestamp(),
+            "nbf": (now - CLOCK_SKEW).timestamp(),
+        }
+        return jwt.encode(payload, self.key.current, algorithm=self.algorithm)
+
+    def access_token(self, user):
+        return user.generate_token(
+            self.key.current, self.access_lifetime, self.algorithm
+        )
+
+    def refresh_token(self, user):
+        payload = {"aud": REFRESH_AUDIENCE, "sub": str(user.id)}
+        return self._encode(payload, self.refresh_lifetime)
+
+    def issue(self, user):
+        """Token response for `user`."""
+        return {
+            "access_token": self.access_token(user),
+            "token_type": "bearer",
+            "expires_in": int(self.access_lifetime.total_seconds()),
+            "refresh_token": self.refresh_token(user),
+        }
+
+    def refreshed_user_id(self, token):
+        """Id of the user of a refresh token."""
+        try:
+            claims = jwt.decode(
+                token,
+                self.key.current,
+                algorithms=[self.algorithm],
+                audience=REFRESH_AUDIENCE,
+            )
+            return int(claims["sub"])
+        except (jwt.InvalidTokenError, KeyError, ValueError) as e:
+            raise InvalidRefreshToken(f"invalid refresh token: {e}.") from e
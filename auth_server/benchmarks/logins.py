@@ -0,0 +1,56 @@
+"""Password checks per second through `PasswordHasher`, by number of workers.
+
+Each run keeps `2 x workers` logins in flight for `DURATION` seconds, with
+the cost parameters of the current hash version, and reports the logins per
+second, per worker process (so per core, up to the number of cores) and
+the latency of the logins.
+
+    % PYTHONPATH=.:.. python benchmarks/logins.py 4
+"""
+from statistics import median, quantiles
+from time import perf_counter
+import asyncio
+import os
+import sys
+
+from auth.hashing import VERSIONS, PasswordHasher
+
+
+DURATION = 5
+
+
+async def client(hasher, hashed, deadline, timings):
+    while (start := perf_counter()) < deadline:
+        assert (await hasher.check(b"password", hashed))[0]
+        timings.append(perf_counter() - start)
+
+
+async def run(workers):
+    hasher = PasswordHasher(VERSIONS, workers=workers, max_pending=2 * workers)
+    try:
+        await hasher.start()
+        hashed = await hasher.hash(b"password")
+        timings = []
+        start = perf_counter()
+        await asyncio.gather(
+            *(
+                client(hasher, hashed, start + DURATION, timings)
+                for _ in range(2 * workers)
+            )
+        )
+        elapsed = perf_counter() - start
+    finally:
+        hasher.close()
+    rate = len(timings) / elapsed
+    print(
+        f"{workers:>2} workers  {rate:8.1f} logins/s  {rate / workers:8.1f} per worker  "
+        f"median {median(timings) * 1000:8.1f}ms  "
+        f"p99 {quantiles(timings, n=100)[98] * 1000:8.1f}ms"
+    )
+
+
+if __name__ == "__main__":
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count() or 1
+    print(f"{os.cpu_count()} cores, scrypt {VERSIONS[1]}")
+    for workers in sorted({1, *range(2, max_workers + 1, 2), max_workers}):
+        asyncio.run(run(workers))
@@ -0,0 +1,31 @@
+"""Tokens per second of `TokenIssuer`, without the database.
+
+Measures the issue of an access and refresh token pair, and the check of a
+refresh token, for `DURATION` seconds each: the cost of the refresh grant
+besides its query. The signing key is read once, not per token.
+
+    % AUTH_SERVER_SECRET_PATH=$(pwd)/.secret PYTHONPATH=.:.. python benchmarks/tokens.py
+"""
+from time import perf_counter
+
+from auth.model import User
+from auth.tokens import TokenIssuer
+
+
+DURATION = 2
+
+
+def rate(fn):
+    count, start = 0, perf_counter()
+    while perf_counter() - start < DURATION:
+        fn()
+        count += 1
+    return count / (perf_counter() - start)
+
+
+if __name__ == "__main__":
+    issuer = TokenIssuer.from_config({})
+    user = User(id=1, email="user@example.com", is_admin=False)
+    refresh = issuer.refresh_token(user)
+    print(f"issue    {rate(lambda: issuer.issue(user)):10.1f} token pairs/s")
+    print(f"refresh  {rate(lambda: issuer.refreshed_user_id(refresh)):10.1f} checks/s")
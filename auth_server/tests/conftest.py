@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from common.database.bootstrap import create_database, drop_database
+
+
+def get_test_db_url():
+    if not (db_url := os.environ.get("AUTH_SERVER_TEST_URL", False)):
+        raise RuntimeError(
+            "cannot perform db tests without a db connexion. set AUTH_SERVER_TEST_URL env variable"
+        )
+    return db_url
+
+
+@pytest.fixture(scope="module")
+def db():
+    from auth.model import Base
+
+    eng = create_engine(get_test_db_url(), poolclass=StaticPool)
+    create_database(eng)
+    Base.metadata.create_all(eng)
+    yield eng
+    Base.metadata.drop_all(eng)
+    drop_database(eng)
@@ -0,0 +1,188 @@
+import asyncio
+import json
+
+import jwt
+import pytest
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from auth.app import DB_POOL_DEFAULTS, create_app, db_pool_config
+from auth.hashing import VERSIONS, decode, scrypt_hash
+from auth.model import User
+
+from tests.conftest import get_test_db_url
+
+
+def asyncpg_url():
+    return str(make_url(get_test_db_url()).set(drivername="postgresql+asyncpg"))
+
+
+async def post(app, body, path="/login"):
+    scope = {
+        "type": "http",
+        "method": "POST",
+        "path": path,
+        "query_string": b"",
+        "headers": [(b"content-type", b"application/json")],
+    }
+    messages = [{"type": "http.request", "body": body}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+async def lifespan(app, scenario):
+    events, sent = asyncio.Queue(), asyncio.Queue()
+    task = asyncio.create_task(app({"type": "lifespan"}, events.get, sent.put))
+    await events.put({"type": "lifespan.startup"})
+    assert (await sent.get())["type"] == "lifespan.startup.complete"
+    try:
+        return await scenario()
+    finally:
+        await events.put({"type": "lifespan.shutdown"})
+        await sent.get()
+        await task
+
+
+def login(email, password):
+    return json.dumps({"email": email, "password": password}).encode()
+
+
+@pytest.fixture
+def secret(tmp_path, monkeypatch):
+    path = tmp_path / "secret"
+    path.write_text("secret")
+    monkeypatch.setenv("AUTH_SERVER_SECRET_PATH", str(path))
+    return path
+
+
+def test_db_pool_config():
+    assert db_pool_config({}) == DB_POOL_DEFAULTS
+    assert db_pool_config({"pool_recycle": -1})["pool_recycle"] == -1
+    with pytest.raises(ValueError, match="unknown db_pool settings"):
+        db_pool_config({"size": 2})
+    with pytest.raises(ValueError, match="pool_size should be an int of at least 1"):
+        db_pool_config({"pool_size": 0})
+    with pytest.raises(ValueError, match="pool_timeout should be a number of at"):
+        db_pool_config({"pool_timeout": "5"})
+
+
+def test_login(db, secret):
+    with Session(db) as s:
+        s.add(User.make_new("user@test.example", b"toto"))
+        s.add(User(email="broken@test.example", password=b"$scrypt$ln=4$c2FsdA"))
+        s.commit()
+    app = create_app({"db_url": asyncpg_url(), "hashing": {"workers": 1}})
+
+    async def scenario():
+        return await asyncio.gather(
+            post(app, login("user@test.example", "toto")),
+            post(app, login("user@test.example", "titi")),
+            post(app, login("nobody@test.example", "toto")),
+            post(app, b"{}"),
+            post(app, login("broken@test.example", "toto")),
+        )
+
+    ok, wrong, unknown, invalid, broken = asyncio.run(lifespan(app, scenario))
+    assert ok[0] == 200 and ok[1]["token_type"] == "bearer"
+    # malformed stored hashes are refused, not answered 500
+    assert wrong == unknown == broken == (401, {"error": "invalid_grant"})
+    assert invalid == (400, {"error": "invalid_request"})
+
+
+def test_rehash_on_login(db, secret):
+    salt = b"0123456789abcdef"
+    with Session(db) as s:
+        user = User.make_new("older@test.example", b"toto", params=VERSIONS[1])
+        # hashed before hashes recorded their parameters
+        user.password = salt + scrypt_hash(b"toto", salt, **VERSIONS[1])
+        s.add(user)
+        s.commit()
+    fast = {"n": 16, "r": 8, "p": 1}
+    hashing = {"workers": 1, "version": 2, "versions": {"2": fast}}
+    app = create_app({"db_url": asyncpg_url(), "hashing": hashing})
+
+    def password():
+        with Session(db) as s:
+            return s.execute(
+                select(User.password).filter(User.email == "older@test.example")
+            ).scalar()
+
+    async def scenario():
+        first = await post(app, login("older@test.example", "toto"))
+        rehashed = password()
+        second = await post(app, login("older@test.example", "toto"))
+        return first, second, rehashed
+
+    first, second, rehashed = asyncio.run(lifespan(app, scenario))
+    assert first[0] == second[0] == 200
+    assert decode(rehashed)[0] == fast
+    # not hashed again once up to date
+    assert password() == rehashed
+
+
+def test_token_grants(db, secret):
+    with Session(db) as s:
+        s.add(User.make_new("granted@test.example", b"toto"))
+        s.commit()
+    app = create_app(
+        {
+            "db_url": asyncpg_url(),
+            "hashing": {"workers": 1},
+            "tokens": {"access_lifetime": 900},
+        }
+    )
+
+    def grant(grant_type, **body):
+        return json.dumps({"grant_type": grant_type, **body}).encode()
+
+    async def scenario():
+        status, tokens = await post(
+            app,
+            grant("password", email="granted@test.example", password="toto"),
+            "/token",
+        )
+        assert status == 200
+        refresh = tokens["refresh_token"]
+        return tokens, await asyncio.gather(
+            post(app, grant("refresh_token", refresh_token=refresh), "/token"),
+            post(
+                app,
+                grant("refresh_token", refresh_token=tokens["access_token"]),
+                "/token",
+            ),
+            post(app, grant("refresh_token"), "/token"),
+            post(app, grant("client_credentials"), "/token"),
+        )
+
+    tokens, (refreshed, access, missing, unsupported) = asyncio.run(
+        lifespan(app, scenario)
+    )
+    assert tokens["expires_in"] == 900 and tokens["token_type"] == "bearer"
+    claims = jwt.decode(
+        tokens["access_token"], "secret", algorithms=["HS256"], audience="urn:user"
+    )
+    assert claims["email"] == "granted@test.example"
+    assert refreshed[0] == 200 and set(refreshed[1]) == set(tokens)
+    assert access == (401, {"error": "invalid_grant"})
+    assert missing == (400, {"error": "invalid_request"})
+    assert unsupported == (400, {"error": "unsupported_grant_type"})
+
+
+def test_login_overloaded(db, secret):
+    app = create_app({"db_url": asyncpg_url(), "hashing": {"max_pending": 1}})
+
+    async def scenario():
+        app.state.hasher.pending = 1
+        return await post(app, login("user@test.example", "toto"))
+
+    assert asyncio.run(lifespan(app, scenario)) == (503, {"error": "overloaded"})
@@ -0,0 +1,134 @@
+import asyncio
+
+import pytest
+
+from auth import hashing
+from auth.hashing import (
+    HASHING_DEFAULTS,
+    Overloaded,
+    PasswordHasher,
+    check_password,
+    current_params,
+    decode,
+    hash_password,
+    hashing_config,
+    needs_rehash,
+    scrypt_hash,
+)
+from auth.model import User
+
+
+# cheap parameters: tests check the plumbing, not the cost
+FAST = {"n": 16, "r": 8, "p": 1}
+
+
+def test_hashing_config():
+    settings = hashing_config({"workers": 2})
+    assert settings == {**HASHING_DEFAULTS, "versions": hashing.VERSIONS, "workers": 2}
+    settings = hashing_config({"version": 2, "versions": {"2": FAST}})
+    assert settings["versions"] == {**hashing.VERSIONS, 2: FAST}
+    with pytest.raises(ValueError, match="unknown hashing settings"):
+        hashing_config({"cost": 2})
+    with pytest.raises(ValueError, match="unknown hashing version 2"):
+        hashing_config({"version": 2})
+    with pytest.raises(ValueError, match="version 2 needs n, r and p"):
+        hashing_config({"versions": {"2": {"n": 16}}})
+    with pytest.raises(ValueError, match="n should be a power of 2"):
+        hashing_config({"versions": {"2": {**FAST, "n": 12}}})
+    with pytest.raises(ValueError, match="version 2 r and p should be at least 1"):
+        hashing_config({"versions": {"2": {**FAST, "p": 0}}})
+    # strong parameters fit in OpenSSL's limit, up to 2 GiB
+    hashing_config({"versions": {"2": {"n": 2**20, "r": 8, "p": 1}}})
+    with pytest.raises(ValueError, match="version 2 needs more than 2147483647 bytes"):
+        hashing_config({"versions": {"2": {"n": 2**21, "r": 8, "p": 1}}})
+    with pytest.raises(ValueError, match="max_pending should be an int of at least 1"):
+        hashing_config({"max_pending": 0})
+
+
+def test_current_params():
+    assert current_params({}) == hashing.VERSIONS[1]
+    assert current_params({"version": 2, "versions": {"2": FAST}}) == FAST
+    user = User.make_new("a@b.example", b"toto", params=FAST)
+    assert decode(user.password)[0] == FAST
+    # the default version ones otherwise, names still positional
+    user = User.make_new("a@b.example", b"toto", "First", "Last")
+    assert decode(user.password)[0] == hashing.VERSIONS[1]
+    assert (user.first_name, user.last_name) == ("First", "Last")
+
+
+def test_self_describing_hash():
+    hashed = hash_password(b"toto", FAST, b"0123456789abcdef")
+    assert hashed.startswith(b"$scrypt$ln=4,r=8,p=1$MDEyMzQ1Njc4OWFiY2RlZg$")
+    assert decode(hashed) == (
+        FAST,
+        b"0123456789abcdef",
+        scrypt_hash(b"toto", b"0123456789abcdef", **FAST),
+    )
+    # checked with the parameters it records
+    assert check_password(b"toto", hashed)
+    assert not check_password(b"titi", hashed)
+    assert not needs_rehash(hashed, FAST)
+    assert needs_rehash(hashed, {**FAST, "n": 32})
+    with pytest.raises(ValueError, match="malformed password hash"):
+        decode(b"$scrypt$ln=4,r=8$c2FsdA$aGFzaA")
+    with pytest.raises(ValueError, match="malformed password hash"):
+        decode(b"$scrypt$ln=4,r=0,p=1$c2FsdA$aGFzaA")
+
+
+def test_raw_hash():
+    salt = b"0123456789abcdef"
+    raw = salt + scrypt_hash(b"toto", salt, **hashing.VERSIONS[1])
+    assert decode(raw)[0] == hashing.VERSIONS[1]
+    assert check_password(b"toto", raw)
+    assert not check_password(b"titi", raw)
+    assert needs_rehash(raw, hashing.VERSIONS[1])
+
+
+def test_check_in_workers():
+    async def scenario():
+        hasher = PasswordHasher({1: hashing.VERSIONS[1], 2: FAST}, 2, workers=2)
+        try:
+            await hasher.start()
+            hashed = await hasher.hash(b"toto")
+            assert hashed == hash_password(b"toto", FAST, decode(hashed)[1])
+            older = User.make_new(
+                "a@b.example", b"toto", params=hashing.VERSIONS[1]
+            ).password
+            checks = await asyncio.gather(
+                hasher.check(b"toto", hashed),
+                hasher.check(b"titi", hashed),
+                # hashes of older parameters
+                hasher.check(b"toto", older),
+                hasher.check(b"titi", older),
+                hasher.check(b"toto", None),
+            )
+        finally:
+            hasher.close()
+        return checks, hasher.pending
+
+    checks, pending = asyncio.run(scenario())
+    assert checks[:2] == [(True, None), (False, None)]
+    valid, rehashed = checks[2]
+    assert valid and decode(rehashed)[0] == FAST
+    assert check_password(b"toto", rehashed)
+    assert checks[3:] == [(False, None), (False, None)]
+    assert pending == 0
+
+
+def test_admission_control():
+    async def scenario():
+        hasher = PasswordHasher({1: FAST}, workers=1, max_pending=2)
+        try:
+            hashed = await hasher.hash(b"toto")
+            results = await asyncio.gather(
+                *(hasher.check(b"toto", hashed) for _ in range(3)),
+                return_exceptions=True,
+            )
+        finally:
+            hasher.close()
+        return results, hasher.rejected
+
+    results, rejected = asyncio.run(scenario())
+    assert results[:2] == [(True, None), (True, None)]
+    assert isinstance(results[2], Overloaded)
+    assert rejected == 1
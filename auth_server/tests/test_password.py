@@ -1,8 +1,12 @@
 from auth import model
+from auth.hashing import VERSIONS, decode
 
 
 def test_check_password():
-    new_user = model.User.make_new(email=b"test@test.example", password=b"toto")
+    new_user = model.User.make_new(
+        email=b"test@test.example", password=b"toto", params=VERSIONS[1]
+    )
+    assert decode(new_user.password)[0] == VERSIONS[1]
     assert new_user.check_password(b"toto")
     assert not new_user.check_password(b"foo")
     assert not new_user.check_password(b"deezdzed")
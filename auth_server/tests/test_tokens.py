@@ -0,0 +1,105 @@
+import os
+import time
+
+import jwt
+import pytest
+
+from auth.model import User
+from auth.tokens import (
+    REFRESH_AUDIENCE,
+    TOKENS_DEFAULTS,
+    InvalidRefreshToken,
+    TokenIssuer,
+    tokens_config,
+)
+from common.keyfile import KeyFile
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def secret(tmp_path):
+    path = tmp_path / "secret"
+    path.write_text("first\nignored")
+    return path
+
+
+def test_tokens_config(secret, monkeypatch):
+    monkeypatch.setenv("AUTH_SERVER_SECRET_PATH", str(secret))
+    assert tokens_config({}) == {**TOKENS_DEFAULTS, "secret_path": str(secret)}
+    with pytest.raises(ValueError, match="unknown tokens settings"):
+        tokens_config({"lifetime": 60})
+    with pytest.raises(ValueError, match="unsupported tokens algorithm"):
+        tokens_config({"algorithm": "none"})
+    with pytest.raises(ValueError, match="access_lifetime should be a number of at"):
+        tokens_config({"access_lifetime": 0})
+    with pytest.raises(ValueError, match="key_check_interval should be a number"):
+        tokens_config({"key_check_interval": True})
+    monkeypatch.delenv("AUTH_SERVER_SECRET_PATH")
+    with pytest.raises(ValueError, match="tokens needs a secret_path"):
+        tokens_config({})
+
+
+def test_signing_key_reload(secret):
+    clock = Clock()
+    key = KeyFile(str(secret), "HS256", 10, clock)
+    assert key.current == "first\n"
+    secret.write_text("second\n")
+    os.utime(secret, ns=(0, 0))
+    # not checked before the interval
+    assert key.current == "first\n"
+    clock.now = 10
+    assert key.current == "second\n"
+
+
+def test_issue_and_refresh(secret):
+    issuer = TokenIssuer(
+        {**TOKENS_DEFAULTS, "secret_path": str(secret), "access_lifetime": 900}
+    )
+    user = User(id=3, email="user@test.example", is_admin=False)
+    tokens = issuer.issue(user)
+    assert tokens["token_type"] == "bearer" and tokens["expires_in"] == 900
+    claims = jwt.decode(
+        tokens["access_token"], "first\n", algorithms=["HS256"], audience="urn:user"
+    )
+    assert claims["email"] == "user@test.example"
+    assert 899 <= claims["exp"] - claims["nbf"] - 60 <= 900
+    assert issuer.refreshed_user_id(tokens["refresh_token"]) == 3
+
+    # access tokens don't refresh, refresh tokens don't give access
+    with pytest.raises(InvalidRefreshToken):
+        issuer.refreshed_user_id(tokens["access_token"])
+    with pytest.raises(jwt.InvalidAudienceError):
+        jwt.decode(
+            tokens["refresh_token"],
+            "first\n",
+            algorithms=["HS256"],
+            audience=["urn:admin", "urn:user"],
+        )
+    expired = jwt.encode(
+        {"aud": REFRESH_AUDIENCE, "sub": "3", "exp": 0}, "first\n", algorithm="HS256"
+    )
+    with pytest.raises(InvalidRefreshToken, match="expired"):
+        issuer.refreshed_user_id(expired)
+
+
+def test_token_times_are_utc(secret, monkeypatch):
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        issuer = TokenIssuer({**TOKENS_DEFAULTS, "secret_path": str(secret)})
+        user = User(id=3, email="user@test.example", is_admin=False)
+        for token in (issuer.access_token(user), user.generate_token("first\n")):
+            claims = jwt.decode(
+                token, "first\n", algorithms=["HS256"], audience="urn:user"
+            )
+            assert abs(claims["exp"] - 60 - time.time()) < 5
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -6,6 +6,8 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import Session
 from sqlalchemy.pool import StaticPool
 
+from auth.hashing import current_params
+from auth.lib import get_config
 from auth.model import User
 
 
@@ -21,6 +23,9 @@ if __name__ == "__main__":
         print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
         sys.exit(1)
 
+    # new hashes use the version set by the app config, when there is one
+    config = get_config() if os.environ.get("AUTH_SERVER_CONFIG") else {}
+
     print(f"connect to {db_url}")
     eng = create_engine(
         db_url, connect_args={"password": db_password}, poolclass=StaticPool
@@ -29,6 +34,7 @@ if __name__ == "__main__":
         new_user = User.make_new(
             email,
             password=password,
+            params=current_params(config.get("hashing", {})),
             last_name=last_name,
             first_name=first_name,
             is_admin=is_admin,
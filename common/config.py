@@ -0,0 +1,36 @@
+"""Validation of the config entries of the services.
+
+Each entry has a dict of defaults, listing its settings: `complete` fills
+in the missing ones and refuses unknown ones, so a misspelt setting isn't
+silently replaced by its default, and `check` refuses values of the wrong
+type or below a minimum, with a message naming both.
+"""
+
+KINDS = {bool: "a bool", int: "an int", float: "a number"}
+
+
+def complete(entry, config, defaults):
+    """Settings of the `entry` config entry, completed with `defaults`."""
+    if unknown := set(config) - set(defaults):
+        raise ValueError(f"unknown {entry} settings {sorted(unknown)}.")
+    return {**defaults, **config}
+
+
+def check(entry, settings, key, kind, minimum=None):
+    """Refuse `settings[key]` unless it's a `kind` of at least `minimum`.
+
+    `kind` is `bool`, `int` or `float`, which accepts ints as well. Bools
+    are only accepted as `bool`, not as numbers.
+    """
+    value = settings[key]
+    accepted = (int, float) if kind is float else kind
+    if (
+        isinstance(value, bool) != (kind is bool)
+        or not isinstance(value, accepted)
+        or minimum is not None
+        and value < minimum
+    ):
+        expected = KINDS[kind]
+        if minimum is not None:
+            expected += f" of at least {minimum}"
+        raise ValueError(f"{entry} {key} should be {expected}.")
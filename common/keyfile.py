@@ -0,0 +1,52 @@
+"""Signing key of the tokens, shared by the auth server and the APIs.
+
+The key is read from a file and kept: the file is checked for a change at
+most every `check_interval` seconds, so a rotated key is picked up without
+restart and without a read of the file per token.
+"""
+import logging
+import os
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+def read_key(path, algorithm="HS256"):
+    with open(path) as f:
+        # HMAC tokens are signed with the first line of the secret file
+        return f.readline() if algorithm.startswith("HS") else f.read()
+
+
+class KeyFile:
+    """Signing key read from a file, read again when the file changes."""
+
+    def __init__(self, path, algorithm, check_interval, clock=time.monotonic):
+        self.path = path
+        self.algorithm = algorithm
+        self.check_interval = check_interval
+        self.clock = clock
+        self.key = None
+        self.stat = None
+        self.next_check = 0
+        self.refresh(force=True)
+
+    def refresh(self, force=False):
+        """Read the key again if its file changed, True if it did."""
+        now = self.clock()
+        if not force and now < self.next_check:
+            return False
+        self.next_check = now + self.check_interval
+        stat = os.stat(self.path)
+        stat = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        if stat == self.stat:
+            return False
+        self.key, self.stat = read_key(self.path, self.algorithm), stat
+        log.info(f"signing key loaded from {self.path}")
+        return True
+
+    @property
+    def current(self):
+        """The key, once checked for a change."""
+        self.refresh()
+        return self.key
@@ -0,0 +1,294 @@
+"""Latency, queries and memory of representative GraphQL operations.
+
+With `--seed`, the database is created or emptied and filled at the given scale,
+customers x sites per customer x buildings per site, by a few set based
+statements. Sites are laid out on a grid so their areas never overlap and
+buildings are spread inside their site. Then each operation is executed
+through `customers.api.schema.execute`, response cache off, and reported
+with its p50/p95/p99 latency, the statements it issued per request and the
+peak of memory allocated while executing it. Results are written as JSON,
+and compared to those of a previous run with `--compare`.
+
+    % POSTGRES_URL=postgresql+psycopg2://postgres@localhost:5432/customers_bench \
+        PYTHONPATH=.:.. python benchmarks/api.py --seed --scale 1000x4x4 \
+        --output bench.json --compare previous.json
+"""
+from argparse import ArgumentParser
+from getpass import getpass
+from random import random, seed
+from statistics import fmean, quantiles
+from time import perf_counter
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tracemalloc
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+
+from common.database.bootstrap import create_database, database_exists
+from customers import cache, datalayer, spatial
+from customers.api import schema
+from customers.model import Base
+
+
+REPEAT = 200
+WARMUP = 10
+
+# sites are laid out on a grid of GRID_COLUMNS columns, one site per cell
+GRID_COLUMNS = 3000
+CELL_SIZE = 0.1
+SITE_SIZE = 0.0002
+
+SEED = [
+    "SELECT setseed(0)",
+    """
+    INSERT INTO customers (name)
+    SELECT 'customer_' || i FROM generate_series(1, :customers) i
+    """,
+    f"""
+    INSERT INTO sites (customer_id, label, long_1, lat_1, long_2, lat_2)
+    SELECT customer_id, name || '_site_' || j, x, y, x + {SITE_SIZE}, y + {SITE_SIZE}
+    FROM (
+        SELECT c.customer_id, c.name, j,
+            -150 + ((c.customer_id - 1) * :sites + j - 1) % {GRID_COLUMNS} * {CELL_SIZE} AS x,
+            -60 + ((c.customer_id - 1) * :sites + j - 1) / {GRID_COLUMNS} * {CELL_SIZE} AS y
+        FROM customers c, generate_series(1, :sites) j
+    ) cells
+    """,
+    f"""
+    INSERT INTO buildings (site_id, label, long, lat)
+    SELECT s.site_id, s.label || '_bat_' || j,
+        round(s.long_1 + (random() * {SITE_SIZE})::numeric, 8),
+        round(s.lat_1 + (random() * {SITE_SIZE})::numeric, 8)
+    FROM sites s, generate_series(1, :buildings) j
+    """,
+    "ANALYZE",
+]
+
+AREA_QUERY = """
+query ($area: AreaInput) {
+  buildings(area: $area) { label position { long lat } }
+}
+"""
+
+
+def random_area(scale):
+    """Area covering about 10 x 10 cells of the sites grid."""
+    customers, sites, _ = scale
+    cells = customers * sites
+    rows = max(cells // GRID_COLUMNS, 1)
+    x = -150 + random() * min(cells, GRID_COLUMNS) * CELL_SIZE
+    y = -60 + random() * rows * CELL_SIZE
+    size = 10 * CELL_SIZE
+    return {
+        "area": {
+            "bottomCorner": {"long": f"{x:.8f}", "lat": f"{y:.8f}"},
+            "topCorner": {"long": f"{x + size:.8f}", "lat": f"{y + size:.8f}"},
+        }
+    }
+
+
+# name -> (query, variables of a request)
+OPERATIONS = {
+    "customers": (
+        "{ customers { name siteCount buildingCount } }",
+        lambda scale: None,
+    ),
+    "sites_page": (
+        "{ sitesConnection(first: 100) { edges { node { label "
+        "owner { name } buildingCount } } } }",
+        lambda scale: None,
+    ),
+    "buildings_page": (
+        "{ buildingsConnection(first: 100) { edges { node { label "
+        "position { long lat } site { label owner { name } } } } } }",
+        lambda scale: None,
+    ),
+    "area_search": (AREA_QUERY, random_area),
+    "stats": (
+        "{ stats { buildingCount siteCount customerCount "
+        "boundingBox { bottomCorner { long lat } } } }",
+        lambda scale: None,
+    ),
+    "search": (
+        "query ($term: String!) { search(term: $term) { kind text site { label } } }",
+        lambda scale: {"term": f"customer_{int(random() * scale[0]) + 1}_site"},
+    ),
+}
+
+
+def parse_scale(value):
+    try:
+        scale = tuple(int(n) for n in value.split("x"))
+    except ValueError:
+        scale = ()
+    if len(scale) != 3 or min(scale) < 1:
+        raise ValueError("scale should be customers x sites x buildings, as 100x4x4.")
+    return scale
+
+
+def seed_database(url, scale):
+    customers, sites, buildings = scale
+    eng = create_engine(url, poolclass=StaticPool)
+    if not database_exists(eng):
+        create_database(eng)
+    Base.metadata.drop_all(eng)
+    Base.metadata.create_all(eng)
+    start = perf_counter()
+    with eng.begin() as con:
+        for stmt in SEED:
+            con.execute(
+                text(stmt),
+                {"customers": customers, "sites": sites, "buildings": buildings},
+            )
+    eng.dispose()
+    return perf_counter() - start
+
+
+class StatementCounter:
+    def __init__(self, eng):
+        self.count = 0
+        event.listen(eng, "before_cursor_execute", self._count)
+
+    def _count(self, *_):
+        self.count += 1
+
+
+async def execute(query, variables):
+    result = await schema.execute(query, variable_values=variables, context_value={})
+    if result.errors:
+        raise RuntimeError(f"operation failed: {result.errors[0].message}.")
+
+
+async def measure(counter, query, variables, repeat):
+    for _ in range(WARMUP):
+        await execute(query, variables())
+    timings = []
+    start_count = counter.count
+    for _ in range(repeat):
+        values = variables()
+        start = perf_counter()
+        await execute(query, values)
+        timings.append(perf_counter() - start)
+    queries = (counter.count - start_count) / repeat
+
+    # traced apart: tracing slows allocations down
+    tracemalloc.start()
+    await execute(query, variables())
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p50, p95, p99 = (
+        quantiles(timings, n=100, method="inclusive")[i] for i in (49, 94, 98)
+    )
+    return {
+        "requests": repeat,
+        "mean_ms": fmean(timings) * 1000,
+        "p50_ms": p50 * 1000,
+        "p95_ms": p95 * 1000,
+        "p99_ms": p99 * 1000,
+        "queries": queries,
+        "peak_memory_kib": peak / 1024,
+    }
+
+
+async def run(url, scale, names, repeat):
+    cache.configure({"backend": "none"})
+    service = datalayer.start(
+        {"db_url": make_url(url).set(drivername="postgresql+asyncpg")}
+    )
+    counter = StatementCounter(service.eng.sync_engine)
+    results = {}
+    try:
+        await spatial.setup(service.session)
+        for name in names:
+            query, variables = OPERATIONS[name]
+            seed(0)
+            results[name] = await measure(
+                counter, query, lambda: variables(scale), repeat
+            )
+            report(name, results[name])
+    finally:
+        await datalayer.stop()
+    return results
+
+
+def report(name, result, previous=None):
+    line = (
+        f"{name:<15} p50 {result['p50_ms']:8.3f}ms  p95 {result['p95_ms']:8.3f}ms  "
+        f"p99 {result['p99_ms']:8.3f}ms  queries {result['queries']:5.1f}  "
+        f"peak {result['peak_memory_kib']:9.1f}KiB"
+    )
+    if previous:
+        line += f"  p50 x{result['p50_ms'] / previous['p50_ms']:.2f}"
+        if result["queries"] != previous["queries"]:
+            line += f"  queries was {previous['queries']:.1f}"
+    print(line)
+
+
+def revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scale", type=parse_scale, default=(100, 4, 4))
+    parser.add_argument("--seed", action="store_true", help="empty and fill the db")
+    parser.add_argument("--repeat", type=int, default=REPEAT)
+    parser.add_argument("--operation", action="append", choices=sorted(OPERATIONS))
+    parser.add_argument("--output", help="JSON file of the results")
+    parser.add_argument("--compare", help="JSON file of previous results")
+    args = parser.parse_args()
+    if args.repeat < 2:
+        parser.error("repeat should be at least 2.")
+    db_password = getpass("db password:")
+
+    if not (db_url := os.environ.get("POSTGRES_URL", False)):
+        print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
+        sys.exit(1)
+
+    url = make_url(db_url)
+    if db_password:
+        url = url.set(password=db_password)
+    print(f"connect to {db_url}")
+    if args.seed:
+        print("seed {} customers x {} sites x {} buildings".format(*args.scale))
+        print(f"seeded in {seed_database(url, args.scale):.3f}s")
+
+    results = asyncio.run(
+        run(url, args.scale, args.operation or list(OPERATIONS), args.repeat)
+    )
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        print(f"compared to {previous.get('revision')}")
+        for name, result in results.items():
+            if name in previous["operations"]:
+                report(name, result, previous["operations"][name])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "revision": revision(),
+                    "python": platform.python_version(),
+                    "scale": dict(zip(("customers", "sites", "buildings"), args.scale)),
+                    "repeat": args.repeat,
+                    "operations": results,
+                },
+                f,
+                indent=2,
+            )
+        print(f"results written to {args.output}")
@@ -0,0 +1,107 @@
+"""Compare area search with a sequential scan and with the spatial indexes.
+
+A temporary table shaped like `buildings` is filled with random positions,
+then the same random areas are searched without index, with the (long, lat)
+B-tree and, when PostGIS is available, with a GiST index on a generated
+geometry column.
+
+    % POSTGRES_URL=postgresql+psycopg2://postgres@localhost:5432/customers_2 \
+        PYTHONPATH=.:.. python benchmarks/area_search.py 1000000
+"""
+from getpass import getpass
+from random import random, seed
+from statistics import median
+from time import perf_counter
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+
+AREA_SIZE = 0.01
+REPEAT = 50
+
+CREATE_TABLE = """
+CREATE TEMP TABLE bench_buildings (
+    building_id serial PRIMARY KEY,
+    long numeric(11, 8),
+    lat numeric(11, 8)
+)
+"""
+
+FILL_TABLE = """
+INSERT INTO bench_buildings (long, lat)
+SELECT round((random() * 354 - 177)::numeric, 8), round((random() * 130 - 65)::numeric, 8)
+FROM generate_series(1, :count)
+"""
+
+BOX_FILTER = "long > :x1 AND long < :x2 AND lat > :y1 AND lat < :y2"
+
+GIST_FILTER = f"geom && ST_MakeEnvelope(:x1, :y1, :x2, :y2, 4326) AND {BOX_FILTER}"
+
+
+def random_areas(count):
+    seed(0)
+    for _ in range(count):
+        x = random() * 354 - 177
+        y = random() * 130 - 65
+        yield {"x1": x, "y1": y, "x2": x + AREA_SIZE, "y2": y + AREA_SIZE}
+
+
+def run(con, name, where):
+    stmt = text(f"SELECT building_id, long, lat FROM bench_buildings WHERE {where}")
+    plan = con.execute(
+        text(f"EXPLAIN (FORMAT JSON) {stmt.text}"), next(random_areas(1))
+    ).scalar()
+    timings = []
+    for area in random_areas(REPEAT):
+        start = perf_counter()
+        con.execute(stmt, area).all()
+        timings.append(perf_counter() - start)
+    print(
+        f"{name:<10} {plan[0]['Plan']['Node Type']:<20} "
+        f"median {median(timings) * 1000:10.3f}ms  max {max(timings) * 1000:10.3f}ms"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    db_password = getpass("db password:")
+
+    if not (db_url := os.environ.get("POSTGRES_URL", False)):
+        print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"connect to {db_url}")
+    eng = create_engine(
+        db_url, connect_args={"password": db_password}, poolclass=StaticPool
+    )
+    with eng.connect() as con:
+        print(f"fill bench_buildings with {count} rows")
+        con.execute(text(CREATE_TABLE))
+        con.execute(text(FILL_TABLE), {"count": count})
+        con.execute(text("ANALYZE bench_buildings"))
+
+        run(con, "seqscan", BOX_FILTER)
+
+        con.execute(text("CREATE INDEX ON bench_buildings (long, lat)"))
+        con.execute(text("ANALYZE bench_buildings"))
+        run(con, "btree", BOX_FILTER)
+
+        postgis = con.execute(
+            text("SELECT count(*) FROM pg_available_extensions WHERE name = 'postgis'")
+        ).scalar()
+        if not postgis:
+            print("postgis is not available, skip gist")
+            sys.exit(0)
+        con.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        con.execute(
+            text(
+                "ALTER TABLE bench_buildings ADD COLUMN geom geometry(Point, 4326) "
+                "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(long, lat), 4326)) STORED"
+            )
+        )
+        con.execute(text("CREATE INDEX ON bench_buildings USING GIST (geom)"))
+        con.execute(text("ANALYZE bench_buildings"))
+        run(con, "gist", GIST_FILTER)
@@ -0,0 +1,85 @@
+"""Compare `Area.contains` loops with `AreaIndex` and the NumPy engine.
+
+Random small areas (0.0002 degree, like dev sites) and positions, half of
+them inside an area, are generated in memory. Each position is looked up in
+the areas, by a loop on a sample of the positions, extrapolated, then by an
+`AreaIndex` and by `geo.locate`, as `tools/import_buildings.py` finds the
+site of its rows. The (position, area) pairs found are then checked again
+by `Area.contains` and by `geo.pairwise_contains`, as `upsertCustomerTree`
+checks the buildings of a tree.
+
+    % PYTHONPATH=.:.. python benchmarks/containment.py 100000 10000
+"""
+from decimal import Decimal
+from random import randint, seed
+from time import perf_counter
+import sys
+
+from customers.geo import Area, Position, locate, pairwise_contains
+from customers.geoindex import AreaIndex
+
+
+SAMPLE = 20
+
+
+def degrees(units):
+    return Decimal(units).scaleb(-8)
+
+
+def random_areas(count):
+    for _ in range(count):
+        long = randint(-177 * 10**8, 177 * 10**8)
+        lat = randint(-65 * 10**8, 65 * 10**8)
+        yield Area(
+            Position(degrees(long), degrees(lat)),
+            Position(degrees(long + 20000), degrees(lat + 20000)),
+        )
+
+
+def random_positions(count, areas):
+    for i in range(count):
+        if i % 2:
+            area = areas[randint(0, len(areas) - 1)]
+            yield Position(
+                area.bottom_corner.long + degrees(randint(0, 20000)),
+                area.bottom_corner.lat + degrees(randint(0, 20000)),
+            )
+        else:
+            yield Position(
+                degrees(randint(-177 * 10**8, 177 * 10**8)),
+                degrees(randint(-65 * 10**8, 65 * 10**8)),
+            )
+
+
+if __name__ == "__main__":
+    positions_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    areas_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10_000
+    seed(0)
+    areas = list(random_areas(areas_count))
+    positions = list(random_positions(positions_count, areas))
+
+    start = perf_counter()
+    for position in positions[:SAMPLE]:
+        next((i for i, area in enumerate(areas) if area.contains(position)), -1)
+    loop = (perf_counter() - start) * positions_count / SAMPLE
+    print(f"Area.contains loop     {loop:10.3f}s (extrapolated from {SAMPLE})")
+
+    start = perf_counter()
+    index = AreaIndex.from_areas(enumerate(areas))
+    print(f"AreaIndex build        {perf_counter() - start:10.3f}s")
+    start = perf_counter()
+    found = index.locate(positions)
+    print(f"AreaIndex.locate       {perf_counter() - start:10.3f}s")
+    start = perf_counter()
+    located = locate(positions, areas)
+    print(f"geo.locate             {perf_counter() - start:10.3f}s")
+    assert located.tolist() == [-1 if i is None else i for i in found]
+    pairs = [(p, areas[i]) for p, i in zip(positions, found) if i is not None]
+    print(f"{len(pairs)} of {positions_count} positions in an area")
+
+    start = perf_counter()
+    assert all(area.contains(position) for position, area in pairs)
+    print(f"Area.contains pairs    {perf_counter() - start:10.3f}s")
+    start = perf_counter()
+    assert pairwise_contains(*zip(*pairs)).all()
+    print(f"geo.pairwise_contains  {perf_counter() - start:10.3f}s")
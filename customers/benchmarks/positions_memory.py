@@ -0,0 +1,81 @@
+"""Memory held by the positions of loaded buildings.
+
+Positions are built from Decimal values decoded row by row, as asyncpg does
+for `Numeric(11, 8)` columns, once with a copy of the former dict based class
+keeping two Decimals, once with `customers.geo.Position`. Retained and peak
+memory are measured with tracemalloc, right after the load then once the
+coordinates were serialized as the API does, timings in a separate untraced
+run: the load, a first serialization of the coordinates, which builds the
+Decimals of `Position`, and a second one.
+
+    % PYTHONPATH=.:.. python benchmarks/positions_memory.py 1000000
+"""
+from decimal import Decimal
+from random import randint, seed
+from time import perf_counter
+import sys
+import tracemalloc
+
+from customers.geo import Position
+
+
+class DictPosition:
+    def __init__(self, long, lat):
+        self.long = Decimal(long)
+        self.lat = Decimal(lat)
+
+    @classmethod
+    def _generate(cls, long, lat):
+        if not all((long, lat)):
+            return None
+        return cls(long, lat)
+
+
+def decode(units):
+    return Decimal(units).scaleb(-8)
+
+
+def load(cls, columns):
+    return [cls._generate(decode(long), decode(lat)) for long, lat in columns]
+
+
+def serialize(positions):
+    for position in positions:
+        str(position.long), str(position.lat)
+
+
+def measure(cls, columns):
+    tracemalloc.start()
+    positions = load(cls, columns)
+    retained, peak = tracemalloc.get_traced_memory()
+    serialize(positions)
+    served, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del positions
+    start = perf_counter()
+    positions = load(cls, columns)
+    elapsed = perf_counter() - start
+    reads = []
+    for _ in range(2):
+        start = perf_counter()
+        serialize(positions)
+        reads.append(perf_counter() - start)
+    return retained, served, peak, elapsed, reads
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    seed(0)
+    # raw column values, in 10**-8 degree units
+    columns = [
+        (randint(-180 * 10**8, 180 * 10**8), randint(-90 * 10**8, 90 * 10**8))
+        for _ in range(count)
+    ]
+    for name, cls in (("dict + Decimal", DictPosition), ("slots + int", Position)):
+        retained, served, peak, elapsed, (read, reread) = measure(cls, columns)
+        print(
+            f"{name:15} retained {retained / 2**20:8.1f}MiB "
+            f"served {served / 2**20:8.1f}MiB "
+            f"peak {peak / 2**20:8.1f}MiB "
+            f"load {elapsed:6.3f}s read {read:6.3f}s reread {reread:6.3f}s"
+        )
@@ -0,0 +1,79 @@
+"""Customers a caller is allowed to read and write.
+
+Users get a role per customer in `users_customers_rel`: readers read its
+sites and buildings, writers and admins change them too. Callers are known
+by the email of their token (see `customers.auth`); those of the admin
+audience, and requests without token when authentication is off, aren't
+restricted.
+
+Reads are restricted in SQL: the root statements of a request get a
+semi-join on the caller's roles, so lists are filtered by the database
+however long they are, and the rows loaded from them (sites of a building,
+buildings of a site) belong to the same customers. Writes check their
+targets against the ids of the customers the caller may write, read once
+per request.
+"""
+import logging
+
+from sqlalchemy.future import select
+
+from customers import model
+
+
+log = logging.getLogger(__name__)
+
+ADMIN_AUDIENCE = "urn:admin"
+
+READ_ROLES = (model.Role.ADMIN, model.Role.WRITTER, model.Role.READER)
+WRITE_ROLES = (model.Role.ADMIN, model.Role.WRITTER)
+
+
+class Access:
+    """Access of a restricted caller, for the duration of one request."""
+
+    def __init__(self, email):
+        self.email = email
+        # roles -> ids of the customers, once read
+        self._customer_ids = {}
+
+    def customers(self, roles=READ_ROLES):
+        """Statement of the ids of the customers the caller has a role for."""
+        rel = model.CustomerUserRole
+        return (
+            select(rel.customer_id)
+            .join(model.User, model.User.id == rel.user_id)
+            .where(model.User.email == self.email, rel.role.in_(roles))
+        )
+
+    def filter(self, entity, roles=READ_ROLES):
+        """Filter of the rows of `entity` belonging to the caller's customers."""
+        customers = self.customers(roles)
+        if entity is model.Customer:
+            return model.Customer.id.in_(customers)
+        if entity is model.Site:
+            return model.Site.customer_id.in_(customers)
+        if entity is model.Building:
+            sites = select(model.Site.id).where(model.Site.customer_id.in_(customers))
+            return model.Building.site_id.in_(sites)
+        raise ValueError(f"no access filter for {entity.__name__}.")
+
+    async def customer_ids(self, session, roles=WRITE_ROLES):
+        """Ids of the customers the caller has a role for, read once."""
+        roles = tuple(roles)
+        if roles not in self._customer_ids:
+            ids = (await session.execute(self.customers(roles))).scalars()
+            self._customer_ids[roles] = set(ids)
+            log.debug(f"{self.email} has {len(self._customer_ids[roles])} customers")
+        return self._customer_ids[roles]
+
+
+def get_access(claims):
+    """Access of the caller of a request, None if it isn't restricted."""
+    if not claims or claims.get("aud") == ADMIN_AUDIENCE:
+        return None
+    return Access(claims.get("email"))
+
+
+def restrict(stmt, entity, access, roles=READ_ROLES):
+    """`stmt` reading `entity` restricted to the caller's customers."""
+    return stmt if access is None else stmt.filter(access.filter(entity, roles))
@@ -2,13 +2,22 @@ import logging
 import typing
 
 
+from graphql import ExecutionResult
 from sqlalchemy.future import select
 import strawberry
+from strawberry.extensions import Extension
 from strawberry.types import Info
+from strawberry.types.graphql import OperationType
 
-from customers import model, mutations
+from customers import auth, cache, model, mutations, spatial
+from customers.access import get_access
 from customers.lib import get_config
-from customers.datalayer import DbService
+from customers import datalayer
+from customers.datalayer import get_db_service
+from customers.documents import CachedDocuments
+from customers.loaders import Loaders
+from customers.pagination import DEFAULT_PAGE_SIZE, make_connection, paginate
+from customers.planner import COLUMNS, plan_connection, plan_search
 from customers.queries import (
     get_buildings_query,
     get_customer_query,
@@ -16,20 +25,92 @@ from customers.queries import (
 )
 from customers.schema import (
     Building,
+    BuildingImport,
+    BuildingImportInput,
+    Connection,
+    CustomerTree,
+    CustomerTreeInput,
+    Deletion,
+    RowError,
+    SearchHit,
+    SearchKind,
     Site,
+    Stats,
     Customer,
     AreaInput,
     PositionInput,
     SiteInput,
     CustomerInput,
 )
+from customers.search import DEFAULT_SEARCH_SIZE, search_query
 
 
-config = get_config()
-
 log = logging.getLogger(__name__)
 
 
+class DataLoaders(Extension):
+    """Give each request its session factory, its own set of batch loaders
+    and the access of its caller.
+
+    Queries read from a replica, mutations and the reads following them are
+    pinned to the primary.
+    """
+
+    def on_request_start(self):
+        if self.execution_context.context is None:
+            self.execution_context.context = {}
+
+    def on_executing_start(self):
+        context = self.execution_context
+        service = get_db_service()
+        self.caller = cache.caller_identity(context.context)
+        self.mutation = context.operation_type == OperationType.MUTATION
+        session = service.session if self.mutation else service.reader(self.caller)
+        context.context.setdefault("session", session)
+        if "access" not in context.context:
+            context.context["access"] = get_access(context.context.get("claims"))
+        if "loaders" not in context.context:
+            context.context["loaders"] = Loaders(
+                context.context["session"], context.context["access"]
+            )
+
+    def on_executing_end(self):
+        if self.mutation:
+            get_db_service().wrote(self.caller)
+
+
+class ResponseCache(Extension):
+    """Answer read queries from the response cache, and fill it."""
+
+    async def on_executing_start(self):
+        context = self.execution_context
+        self.key = None
+        if context.operation_type != OperationType.QUERY or "stream" in context.context:
+            return
+        self.key = cache.make_key(
+            context.graphql_document,
+            context.operation_name,
+            context.variables,
+            cache.caller_identity(context.context),
+        )
+        # versions before reading: a write committed meanwhile outdates the entry
+        self.versions = await cache.get_cache().versions(map(cache.tag, COLUMNS))
+        if (data := await cache.get_cache().get(self.key)) is not None:
+            context.result = ExecutionResult(data=data)
+            self.key = None
+
+    async def on_executing_end(self):
+        context = self.execution_context
+        if self.key is None or context.result is None or context.result.errors:
+            return
+        entities = context.context["loaders"].plan.entities()
+        await cache.get_cache().set(
+            self.key,
+            context.result.data,
+            {tag: self.versions[tag] for tag in map(cache.tag, entities)},
+        )
+
+
 @strawberry.type
 class Query:
     @strawberry.field
@@ -42,8 +123,10 @@ class Query:
     ) -> typing.List[Building]:
 
         stmt = get_buildings_query(info, label, area, customer_name)
+        if (stream := info.context.get("stream")) is not None:
+            return await stream.next(info.context["session"], stmt)
 
-        async with DbService(config).session() as s:
+        async with info.context["session"]() as s:
             try:
                 result = await s.execute(stmt)
                 return result.scalars().all()
@@ -59,8 +142,10 @@ class Query:
     ) -> typing.List[Site]:
 
         stmt = get_sites_query(info, label, customer_name)
+        if (stream := info.context.get("stream")) is not None:
+            return await stream.next(info.context["session"], stmt)
 
-        async with DbService(config).session() as s:
+        async with info.context["session"]() as s:
             try:
                 result = await s.execute(stmt)
                 return result.scalars().all()
@@ -75,65 +160,236 @@ class Query:
     ) -> typing.List[Customer]:
         stmt = get_customer_query(info, name)
 
-        async with DbService(config).session() as s:
+        async with info.context["session"]() as s:
             try:
                 result = await s.execute(stmt)
                 return result.scalars().all()
             except Exception as e:
                 await s.rollback()
 
+    @strawberry.field
+    async def buildings_connection(
+        self,
+        info: Info,
+        first: int = DEFAULT_PAGE_SIZE,
+        after: typing.Optional[str] = None,
+        label: typing.Optional[str] = None,
+        area: typing.Optional[AreaInput] = None,
+        customer_name: typing.Optional[str] = None,
+    ) -> Connection[Building]:
+
+        plan = plan_connection(info, model.Building)
+        stmt = get_buildings_query(info, label, area, customer_name, plan)
+        stmt = paginate(stmt, model.Building, first, after)
+
+        async with info.context["session"]() as s:
+            try:
+                result = await s.execute(stmt)
+                rows = result.scalars().all()
+            except Exception:
+                await s.rollback()
+                raise
+        return make_connection(model.Building, rows, first, after)
+
+    @strawberry.field
+    async def sites_connection(
+        self,
+        info: Info,
+        first: int = DEFAULT_PAGE_SIZE,
+        after: typing.Optional[str] = None,
+        label: typing.Optional[str] = None,
+        customer_name: typing.Optional[str] = None,
+    ) -> Connection[Site]:
+
+        plan = plan_connection(info, model.Site)
+        stmt = get_sites_query(info, label, customer_name, plan)
+        stmt = paginate(stmt, model.Site, first, after)
+
+        async with info.context["session"]() as s:
+            try:
+                result = await s.execute(stmt)
+                rows = result.scalars().all()
+            except Exception:
+                await s.rollback()
+                raise
+        return make_connection(model.Site, rows, first, after)
+
+    @strawberry.field
+    async def customers_connection(
+        self,
+        info: Info,
+        first: int = DEFAULT_PAGE_SIZE,
+        after: typing.Optional[str] = None,
+        name: typing.Optional[str] = None,
+    ) -> Connection[Customer]:
+
+        plan = plan_connection(info, model.Customer)
+        stmt = get_customer_query(info, name, plan)
+        stmt = paginate(stmt, model.Customer, first, after)
+
+        async with info.context["session"]() as s:
+            try:
+                result = await s.execute(stmt)
+                rows = result.scalars().all()
+            except Exception:
+                await s.rollback()
+                raise
+        return make_connection(model.Customer, rows, first, after)
+
+    @strawberry.field
+    async def stats(self, info: Info, area: typing.Optional[AreaInput] = None) -> Stats:
+        loaders = info.context["loaders"]
+        loaders.plan.join(model.Building, model.Site)
+        if area:
+            area = model.Area(
+                model.Position(area.bottom_corner.long, area.bottom_corner.lat),
+                model.Position(area.top_corner.long, area.top_corner.lat),
+            )
+        buildings, sites, customers, *corners = await loaders.stats.load(area)
+        box = None
+        if corners[0] is not None:
+            box = model.Area(model.Position(*corners[:2]), model.Position(*corners[2:]))
+        return Stats(
+            building_count=buildings,
+            site_count=sites,
+            customer_count=customers,
+            bounding_box=box,
+        )
+
+    @strawberry.field
+    async def search(
+        self, info: Info, term: str, first: int = DEFAULT_SEARCH_SIZE
+    ) -> typing.List[SearchHit]:
+        """Customers, sites and buildings whose name or label contain `term`."""
+        info.context["loaders"].plan.update(plan_search(info))
+        stmt = search_query(term, first, info.context["access"])
+        async with info.context["session"]() as s:
+            rows = (await s.execute(stmt)).all()
+        return [
+            SearchHit(kind=SearchKind(kind), id=id, text=text, score=score)
+            for kind, id, text, score in rows
+        ]
+
 
 @strawberry.type
 class Mutation:
     @strawberry.mutation
     async def add_new_building_for_site(
-        self, label: str, site_id: int, position: typing.Optional[PositionInput] = None
+        self,
+        info: Info,
+        label: str,
+        site_id: int,
+        position: typing.Optional[PositionInput] = None,
     ) -> Building:
-        async with DbService(config).session() as s:
+        async with get_db_service().session() as s:
             building = await mutations.add_new_building_for_site(
-                s, label, position, site_id
+                s, label, position, site_id, info.context["access"]
             )
-            await s.commit()
+            await cache.commit(s)
             s.expunge(building)
             return building
 
     @strawberry.mutation
     async def add_new_building_for_new_site(
         self,
+        info: Info,
         label: str,
         site: SiteInput,
         customer_id: int,
         position: typing.Optional[PositionInput] = None,
     ) -> Building:
-        async with DbService(config).session() as s:
+        async with get_db_service().session() as s:
             building = await mutations.add_new_building_for_new_site(
-                s, label, position, site, customer_id
+                s, label, position, site, customer_id, info.context["access"]
             )
-            await s.commit()
+            await cache.commit(s)
             s.expunge(building)
             return building
 
     @strawberry.mutation
     async def add_new_building_for_new_customer(
         self,
+        info: Info,
         label: str,
         site: SiteInput,
         customer: CustomerInput,
         position: typing.Optional[PositionInput] = None,
     ) -> Building:
-        async with DbService(config).session() as s:
+        async with get_db_service().session() as s:
             building = await mutations.add_new_building_for_new_customer(
-                s, label, position, site, customer
+                s, label, position, site, customer, info.context["access"]
             )
-            await s.commit()
+            await cache.commit(s)
             s.expunge(building)
             return building
 
     @strawberry.mutation
-    async def delete_building(self, id: int) -> None:
-        async with DbService(config).session() as s:
-            await mutations.delete_building(s, id)
-            await s.commit()
+    async def delete_building(self, info: Info, id: int) -> None:
+        async with get_db_service().session() as s:
+            await mutations.delete_building(s, id, info.context["access"])
+            await cache.commit(s)
+
+    @strawberry.mutation
+    async def delete_buildings(self, info: Info, ids: typing.List[int]) -> Deletion:
+        async with get_db_service().session() as s:
+            buildings, sites, customers = await mutations.delete_buildings(
+                s, ids, info.context["access"]
+            )
+            await cache.commit(s)
+        return Deletion(buildings=buildings, sites=sites, customers=customers)
+
+    @strawberry.mutation
+    async def upsert_customer_tree(
+        self, info: Info, customer: CustomerTreeInput
+    ) -> CustomerTree:
+        async with get_db_service().session() as s:
+            customer, sites, buildings = await mutations.upsert_customer_tree(
+                s, customer, info.context["access"]
+            )
+            await cache.commit(s)
+        return CustomerTree(customer=customer, sites=sites, buildings=buildings)
+
+    @strawberry.mutation
+    async def import_buildings(
+        self, info: Info, buildings: typing.List[BuildingImportInput]
+    ) -> BuildingImport:
+        rows = (
+            (
+                building.label,
+                building.site_id,
+                building.position.long if building.position else None,
+                building.position.lat if building.position else None,
+            )
+            for building in buildings
+        )
+        async with get_db_service().session() as s:
+            ids, errors = await mutations.import_buildings(
+                s, rows, info.context["access"]
+            )
+            await cache.commit(s)
+        return BuildingImport(
+            imported=len(ids) - len(errors),
+            building_ids=ids,
+            errors=[RowError(index=i, message=message) for i, message in errors],
+        )
+
+
+schema = strawberry.Schema(
+    query=Query,
+    mutation=Mutation,
+    extensions=[CachedDocuments, DataLoaders, ResponseCache],
+)
+
+
+async def startup(config=None):
+    """Set the app up from its config: database, spatial backend, cache and auth."""
+    config = config or get_config()
+    cache.configure(config.get("cache", {}))
+    auth.configure(config.get("auth"))
+    service = datalayer.start(config)
+    await spatial.setup(service.session)
+    return service
 
 
-schema = strawberry.Schema(query=Query, mutation=Mutation)
+async def shutdown():
+    await datalayer.stop()
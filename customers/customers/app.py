@@ -0,0 +1,222 @@
+"""ASGI application serving the schema, with automatic persisted queries.
+
+Clients accepting `application/x-ndjson` get the `buildings` and `sites`
+lists streamed by chunks, see `customers.streaming`.
+
+With an "auth" entry in the config, requests need a bearer token issued by
+the auth server: it is verified before anything else, see `customers.auth`,
+and its claims are in the context of the operation. Requests without valid
+token are answered 401.
+
+The database engine is created on the ASGI startup event and disposed on
+shutdown. Connection pool metrics are exported in the Prometheus text
+format on `/metrics`, authenticated as the other paths.
+
+    % PYTHONPATH=.:.. CUSTOMERS_APP_CONFIG=./config.json uvicorn customers.app:app
+"""
+import json
+import logging
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from strawberry.asgi import GraphQL as BaseGraphQL
+from strawberry.asgi.handlers import HTTPHandler
+from strawberry.exceptions import MissingQueryError
+from strawberry.http import parse_query_params, parse_request_data
+from strawberry.schema.exceptions import InvalidOperationTypeError
+from strawberry.types.graphql import OperationType
+
+from customers.api import schema, shutdown, startup
+from customers.auth import AuthenticationError, get_authenticator
+from customers.datalayer import get_db_service
+from customers.documents import PersistedQueryError, resolve_persisted_query
+from customers.lib import configure_logging, get_config
+from customers.streaming import NDJSON, execute_stream
+
+
+log = logging.getLogger(__name__)
+
+METRICS_PATH = "/metrics"
+
+
+class PersistedQueryHandler(HTTPHandler):
+    async def get_payload(self, request):
+        """GraphQL payload of a GET or JSON POST request, None otherwise."""
+        content_type = request.headers.get("Content-Type", "")
+        if request.method == "GET" and request.query_params:
+            # a copy: strawberry parses the variables in place
+            return parse_query_params(dict(request.query_params))
+        if request.method == "POST" and "application/json" in content_type:
+            try:
+                data = await request.json()
+            except json.JSONDecodeError:
+                return None
+            return data if isinstance(data, dict) else None
+        return None
+
+    async def get_http_response(
+        self, request, execute, process_result, root_value, context
+    ):
+        # graphiql, multipart uploads and invalid bodies are strawberry's
+        if (data := await self.get_payload(request)) is None:
+            return await super().get_http_response(
+                request, execute, process_result, root_value, context
+            )
+        try:
+            data = resolve_persisted_query(data)
+        except PersistedQueryError as e:
+            log.debug(f"persisted query: {e}")
+            return JSONResponse(e.as_response())
+        if (
+            request.method == "POST"
+            and NDJSON in request.headers.get("Accept", "")
+            and data.get("query")
+        ):
+            return self.get_stream_response(request, data)
+        return await self.execute_payload(
+            request, data, execute, process_result, root_value, context
+        )
+
+    async def execute_payload(
+        self, request, data, execute, process_result, root_value, context
+    ):
+        """Response to `data`, as strawberry answers the payloads it reads."""
+        try:
+            request_data = parse_request_data(data)
+        except MissingQueryError:
+            return PlainTextResponse(
+                "No GraphQL query found in the request", status_code=400
+            )
+        allowed_operation_types = OperationType.from_http(request.method)
+        if not self.allow_queries_via_get and request.method == "GET":
+            allowed_operation_types = allowed_operation_types - {OperationType.QUERY}
+        try:
+            result = await execute(
+                request_data.query,
+                variables=request_data.variables,
+                context=context,
+                operation_name=request_data.operation_name,
+                root_value=root_value,
+                allowed_operation_types=allowed_operation_types,
+            )
+        except InvalidOperationTypeError as e:
+            return PlainTextResponse(
+                e.as_http_error_reason(request.method), status_code=400
+            )
+        response_data = await process_result(request=request, result=result)
+        return JSONResponse(response_data)
+
+    def get_stream_response(self, request, data):
+        lines = execute_stream(
+            self.schema,
+            data["query"],
+            data.get("variables"),
+            data.get("operationName"),
+            {"request": request, "claims": request.scope.get("claims")},
+        )
+        return StreamingResponse(lines, media_type=NDJSON)
+
+
+def pool_metrics():
+    """Metrics of the db pool, empty before startup and after shutdown."""
+    try:
+        return get_db_service().metrics()
+    except RuntimeError:
+        return {}
+
+
+def render_metrics(metrics):
+    """Pool metrics in the Prometheus text format."""
+    if not metrics:
+        return ""
+    lines = [
+        "# TYPE db_pool_size gauge",
+        f"db_pool_size {metrics['size']}",
+        "# TYPE db_pool_checked_out gauge",
+        f"db_pool_checked_out {metrics['checked_out']}",
+        "# TYPE db_pool_overflow gauge",
+        f"db_pool_overflow {metrics['overflow']}",
+        "# TYPE db_pool_overflows_total counter",
+        f"db_pool_overflows_total {metrics['overflows']}",
+        "# TYPE db_pool_timeouts_total counter",
+        f"db_pool_timeouts_total {metrics['timeouts']}",
+        "# TYPE db_pool_wait_seconds_max gauge",
+        f"db_pool_wait_seconds_max {metrics['wait_seconds_max']}",
+        "# TYPE db_pool_wait_seconds histogram",
+    ]
+    for bound, count in metrics["wait_seconds_buckets"].items():
+        lines.append(f'db_pool_wait_seconds_bucket{{le="{bound}"}} {count}')
+    lines += [
+        f'db_pool_wait_seconds_bucket{{le="+Inf"}} {metrics["checkouts"]}',
+        f"db_pool_wait_seconds_sum {metrics['wait_seconds_total']}",
+        f"db_pool_wait_seconds_count {metrics['checkouts']}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def authenticate(scope):
+    """Put the claims of the caller's token in `scope`, None if it has none."""
+    if (authenticator := get_authenticator()) is None:
+        return None
+    try:
+        scope["claims"] = authenticator.verify(
+            Headers(scope=scope).get("authorization")
+        )
+    except AuthenticationError as e:
+        log.debug(f"authentication: {e}")
+        return JSONResponse(
+            {"errors": [{"message": str(e)}]},
+            status_code=401,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return None
+
+
+class GraphQL(BaseGraphQL):
+    http_handler_class = PersistedQueryHandler
+    # app config, read from CUSTOMERS_APP_CONFIG on startup when not set
+    config = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif (response := authenticate(scope)) is not None:
+            await response(scope, receive, send)
+        elif scope["type"] == "http" and scope["path"] == METRICS_PATH:
+            response = PlainTextResponse(
+                render_metrics(pool_metrics()),
+                media_type="text/plain; version=0.0.4",
+            )
+            await response(scope, receive, send)
+        else:
+            await super().__call__(scope, receive, send)
+
+    async def get_context(self, request, response=None):
+        context = await super().get_context(request, response)
+        context["claims"] = request.scope.get("claims")
+        return context
+
+    def read_config(self):
+        """Config of an app served without `customers.server`."""
+        config = get_config()
+        configure_logging(config)
+        return config
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                try:
+                    await startup(self.config or self.read_config())
+                except Exception as e:
+                    log.exception("startup failed")
+                    await send({"type": "lifespan.startup.failed", "message": str(e)})
+                    return
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await shutdown()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+app = GraphQL(schema)
@@ -0,0 +1,146 @@
+"""Verification of the bearer tokens issued by the auth server.
+
+Tokens are verified once per request, before the operation is parsed, and
+their claims are put in the request context as "claims". The signing key is
+read once and kept: its file is checked for a change at most every
+`key_check_interval` seconds, and right away when a signature doesn't match,
+so a rotated key is picked up without restart. Decoded claims are kept in a
+small LRU cache keyed by the hash of the token, until the token expires or
+for `claims_ttl` seconds, so repeated requests of a client skip the
+signature check. Changing the key empties it.
+"""
+from collections import OrderedDict
+from hashlib import sha256
+import logging
+import os
+import time
+
+import jwt
+
+from common.config import check, complete
+from common.keyfile import KeyFile
+
+
+log = logging.getLogger(__name__)
+
+SECRET_PATH_ENV = "AUTH_SERVER_SECRET_PATH"
+
+# settings of the "auth" config entry
+AUTH_DEFAULTS = {
+    # defaults to the AUTH_SERVER_SECRET_PATH environment variable
+    "secret_path": None,
+    "algorithm": "HS256",
+    "audiences": ["urn:admin", "urn:user"],
+    # seconds
+    "leeway": 0,
+    "key_check_interval": 10,
+    "claims_cache_size": 1024,
+    "claims_ttl": 60,
+}
+
+
+class AuthenticationError(Exception):
+    pass
+
+
+def auth_config(config):
+    """Token verification settings of the `auth` entry."""
+    settings = complete("auth", config, AUTH_DEFAULTS)
+    if settings["secret_path"] is None:
+        settings["secret_path"] = os.environ.get(SECRET_PATH_ENV)
+    if not settings["secret_path"]:
+        raise ValueError(f"auth needs a secret_path or {SECRET_PATH_ENV}.")
+    algorithms = set(jwt.algorithms.get_default_algorithms()) - {"none"}
+    if settings["algorithm"] not in algorithms:
+        raise ValueError(f"unsupported auth algorithm {settings['algorithm']}.")
+    if not settings["audiences"]:
+        raise ValueError("auth audiences is empty.")
+    for key in ("leeway", "key_check_interval", "claims_ttl"):
+        check("auth", settings, key, float, 0)
+    check("auth", settings, "claims_cache_size", int, 0)
+    return settings
+
+
+class Authenticator:
+    def __init__(self, settings, clock=time.monotonic, now=time.time):
+        self.algorithm = settings["algorithm"]
+        self.audiences = settings["audiences"]
+        self.leeway = settings["leeway"]
+        self.max_size = settings["claims_cache_size"]
+        self.ttl = settings["claims_ttl"]
+        self.clock = clock
+        self.now = now
+        self.key = KeyFile(
+            settings["secret_path"],
+            self.algorithm,
+            settings["key_check_interval"],
+            clock,
+        )
+        # token hash -> (claims, end of validity on `clock`)
+        self.claims = OrderedDict()
+
+    def _decode(self, token):
+        return jwt.decode(
+            token,
+            self.key.key,
+            algorithms=[self.algorithm],
+            audience=self.audiences,
+            leeway=self.leeway,
+        )
+
+    def decode(self, token):
+        """Verified claims of `token`."""
+        try:
+            try:
+                return self._decode(token)
+            except jwt.InvalidSignatureError:
+                # signed with a key rotated since the last check
+                if not self.key.refresh(force=True):
+                    raise
+                self.claims.clear()
+                return self._decode(token)
+        except jwt.InvalidTokenError as e:
+            raise AuthenticationError(f"invalid token: {e}.") from e
+
+    def verify(self, authorization):
+        """Claims of the bearer token of an `Authorization` header."""
+        scheme, _, token = (authorization or "").partition(" ")
+        if scheme.lower() != "bearer" or not token:
+            raise AuthenticationError("bearer token required.")
+        if self.key.refresh():
+            self.claims.clear()
+        key = sha256(token.encode()).digest()
+        now = self.clock()
+        if (entry := self.claims.get(key)) is not None:
+            claims, end = entry
+            if end > now:
+                self.claims.move_to_end(key)
+                return claims
+            del self.claims[key]
+        claims = self.decode(token)
+        if self.max_size:
+            end = now + self.ttl
+            if "exp" in claims:
+                end = min(end, now + claims["exp"] + self.leeway - self.now())
+            self.claims[key] = (claims, end)
+            while len(self.claims) > self.max_size:
+                self.claims.popitem(last=False)
+        return claims
+
+
+_authenticator = None
+
+
+def configure(config):
+    """Set token verification up from the "auth" part of the app config.
+
+    Without it, requests aren't authenticated.
+    """
+    global _authenticator
+    _authenticator = None if config is None else Authenticator(auth_config(config))
+    log.info(f"authentication: {'on' if _authenticator else 'off'}")
+    return _authenticator
+
+
+def get_authenticator():
+    return _authenticator
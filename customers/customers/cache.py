@@ -0,0 +1,198 @@
+"""Response cache of read queries.
+
+Responses are keyed on the normalized query document, the variables and the
+caller identity. Each entry records the version of the tags it depends on:
+the types of the entities it read ("Building", "Site", "Customer"). Writes
+publish the tags of the types they touched once committed, which bumps
+their version, so entries read before the write are never served again.
+Tags are only types, not rows: every query reads lists, which any written
+row can change, so no entry could depend on the tag of a row. Their number
+stays the same however many rows are written.
+"""
+from collections import OrderedDict
+from hashlib import sha256
+import json
+import logging
+import time
+
+from graphql import print_ast
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 1024
+# seconds
+DEFAULT_TTL = 60
+
+TAGS_KEY = "cache_tags"
+
+
+def tag(entity):
+    return entity if isinstance(entity, str) else entity.__name__
+
+
+def caller_identity(context):
+    """Identity of the caller of a request, to be part of cache keys.
+
+    Callers authenticated by a token are known by its audience and email,
+    whatever token they use, others by their `Authorization` header.
+    """
+    if context and (claims := context.get("claims")):
+        identity = json.dumps([claims.get("aud"), claims.get("email")])
+        return sha256(identity.encode()).hexdigest()
+    request = context.get("request") if context else None
+    if request is None or not (authorization := request.headers.get("authorization")):
+        return None
+    return sha256(authorization.encode()).hexdigest()
+
+
+def make_key(document, operation_name, variables, identity):
+    payload = json.dumps(
+        [print_ast(document), operation_name, variables, identity],
+        sort_keys=True,
+        default=str,
+    )
+    return sha256(payload.encode()).hexdigest()
+
+
+class MemoryCache:
+    """In-process LRU cache, entries also expire after `ttl` seconds."""
+
+    def __init__(
+        self, max_size=DEFAULT_MAX_SIZE, ttl=DEFAULT_TTL, clock=time.monotonic
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.tag_versions = {}
+
+    async def versions(self, tags):
+        return {tag: self.tag_versions.get(tag, 0) for tag in tags}
+
+    async def get(self, key):
+        if (entry := self.entries.get(key)) is None:
+            return None
+        expires, versions, data = entry
+        if expires < self.clock() or versions != await self.versions(versions):
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return data
+
+    async def set(self, key, data, versions):
+        self.entries[key] = (self.clock() + self.ttl, versions, data)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    async def invalidate(self, tags):
+        for tag in tags:
+            self.tag_versions[tag] = self.tag_versions.get(tag, 0) + 1
+
+
+class RedisCache:
+    """Cache shared by several processes through a Redis compatible client.
+
+    Only `get`, `set`, `mget` and pipelined `incr` of the asyncio client are
+    used.
+    Entries expire after `ttl` seconds, LRU eviction is left to the server
+    `maxmemory-policy`.
+    """
+
+    def __init__(self, client, ttl=DEFAULT_TTL, prefix="customers:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _tag_key(self, tag):
+        return f"{self.prefix}tag:{tag}"
+
+    async def versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        values = await self.client.mget([self._tag_key(tag) for tag in tags])
+        return {tag: int(value or 0) for tag, value in zip(tags, values)}
+
+    async def get(self, key):
+        if (entry := await self.client.get(f"{self.prefix}response:{key}")) is None:
+            return None
+        entry = json.loads(entry)
+        if entry["versions"] != await self.versions(entry["versions"]):
+            return None
+        return entry["data"]
+
+    async def set(self, key, data, versions):
+        await self.client.set(
+            f"{self.prefix}response:{key}",
+            json.dumps({"versions": versions, "data": data}),
+            ex=self.ttl,
+        )
+
+    async def invalidate(self, tags):
+        # one round trip
+        async with self.client.pipeline(transaction=False) as pipe:
+            for tag in tags:
+                pipe.incr(self._tag_key(tag))
+            await pipe.execute()
+
+
+class NoCache:
+    async def versions(self, tags):
+        return dict.fromkeys(tags, 0)
+
+    async def get(self, key):
+        return None
+
+    async def set(self, key, data, versions):
+        pass
+
+    async def invalidate(self, tags):
+        pass
+
+
+_cache = None
+
+
+def configure(config):
+    """Set the cache from the "cache" part of the app config.
+
+    The backend is "memory" (default), "redis", which needs the `redis`
+    package and an "url", or "none".
+    """
+    global _cache
+    config = dict(config)
+    backend = config.pop("backend", "memory")
+    if backend == "memory":
+        _cache = MemoryCache(**config)
+    elif backend == "redis":
+        import redis.asyncio
+
+        client = redis.asyncio.from_url(config.pop("url"))
+        _cache = RedisCache(client, **config)
+    elif backend == "none":
+        _cache = NoCache()
+    else:
+        raise ValueError(f"unknown cache backend {backend}.")
+    log.info(f"response cache: {backend}")
+    return _cache
+
+
+def get_cache():
+    return _cache or configure({})
+
+
+def publish(session, entity):
+    """Invalidate the tag of an entity type.
+
+    Tags are kept on the session until it is committed with `commit`.
+    """
+    session.info.setdefault(TAGS_KEY, set()).add(tag(entity))
+
+
+async def commit(session):
+    await session.commit()
+    if tags := session.info.pop(TAGS_KEY, None):
+        log.debug(f"invalidate {sorted(tags)}")
+        await get_cache().invalidate(tags)
@@ -1,22 +1,223 @@
-import json
-import os
+import itertools
 import logging
+import time
+from time import perf_counter
 
+from sqlalchemy import event, exc
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
-from customers.lib import Singleton
+from common.config import check, complete
 
 
 log = logging.getLogger(__name__)
 
 
-class DbService(metaclass=Singleton):
-    def __init__(self, config):
+# settings of the "db_pool" config entry
+POOL_DEFAULTS = {
+    "pool_size": 5,
+    "max_overflow": 10,
+    # seconds waiting for a connection before giving up
+    "pool_timeout": 30,
+    "pool_pre_ping": True,
+    # seconds before a connection is replaced, -1 to keep them
+    "pool_recycle": 1800,
+    # prepared statements kept by each connection
+    "statement_cache_size": 100,
+}
+
+# settings of the "db_routing" config entry
+ROUTING_DEFAULTS = {
+    # how reads are spread over replicas: "round_robin" or "least_connections"
+    "balance": "round_robin",
+    # seconds a caller reads from the primary after a mutation, 0 to disable
+    "read_your_writes": 0,
+}
+BALANCES = ("round_robin", "least_connections")
+
+# upper bounds of the connection wait time histogram, in seconds
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+def pool_config(config):
+    """Engine pool arguments of the `db_pool` entry."""
+    settings = complete("db_pool", config, POOL_DEFAULTS)
+    check("db_pool", settings, "pool_size", int, 1)
+    # -1: no limit
+    check("db_pool", settings, "max_overflow", int, -1)
+    check("db_pool", settings, "pool_timeout", float, 0)
+    check("db_pool", settings, "pool_pre_ping", bool)
+    check("db_pool", settings, "pool_recycle", int, -1)
+    check("db_pool", settings, "statement_cache_size", int, 0)
+    return settings
+
+
+def routing_config(config):
+    """Replica routing settings of the `db_routing` entry."""
+    settings = complete("db_routing", config, ROUTING_DEFAULTS)
+    if settings["balance"] not in BALANCES:
+        raise ValueError(f"db_routing balance should be one of {list(BALANCES)}.")
+    check("db_routing", settings, "read_your_writes", float, 0)
+    return settings
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkouts = 0
+        self.overflows = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+
+    def observe(self, wait, overflow):
+        self.checkouts += 1
+        self.overflows += overflow
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if wait <= bound:
+                self.wait_buckets[i] += 1
+
+
+class MeteredPool(AsyncAdaptedQueuePool):
+    """Queue pool measuring how long checkouts wait for a connection."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        overflow = max(self.overflow(), 0)
+        start = perf_counter()
+        try:
+            conn = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.timeouts += 1
+            raise
+        self.metrics.observe(perf_counter() - start, self.overflow() > overflow)
+        return conn
+
+
+class Replica:
+    """Engine of a read replica, counting the connections in use."""
+
+    def __init__(self, eng):
+        self.eng = eng
+        self.session = sessionmaker(eng, expire_on_commit=False, class_=AsyncSession)
+        self.in_use = 0
+        event.listen(eng.sync_engine, "checkout", self._checkout)
+        event.listen(eng.sync_engine, "checkin", self._checkin)
+
+    def _checkout(self, *_):
+        self.in_use += 1
+
+    def _checkin(self, *_):
+        self.in_use -= 1
+
+
+class DbService:
+    """Engines of the primary database and of its read replicas.
+
+    `session` always binds the primary. `reader` picks the session factory
+    of a read: a replica, unless there are none or the caller has written
+    during the last `read_your_writes` seconds. Writes are only known by the
+    process which ran them, so the guarantee holds per worker, and only for
+    identified callers: anonymous ones have nothing to tell them apart.
+    """
+
+    def __init__(self, config, clock=time.monotonic):
         log.debug("initialize db service")
         self.db_url = config["db_url"]
-        self.eng_config = config.get("db_engine", {})
+        self.eng_config = dict(config.get("db_engine", {}))
+        if "poolclass" not in self.eng_config:
+            pool = pool_config(config.get("db_pool", {}))
+            connect_args = self.eng_config.setdefault("connect_args", {})
+            connect_args["prepared_statement_cache_size"] = pool.pop(
+                "statement_cache_size"
+            )
+            self.eng_config = {"poolclass": MeteredPool, **pool, **self.eng_config}
+        routing = routing_config(config.get("db_routing", {}))
+        self.balance = routing["balance"]
+        self.read_your_writes = routing["read_your_writes"]
+        self.clock = clock
         self.eng = create_async_engine(self.db_url, **self.eng_config)
         self.session = sessionmaker(
             self.eng, expire_on_commit=False, class_=AsyncSession
         )
+        self.replicas = [
+            Replica(create_async_engine(url, **self.eng_config))
+            for url in config.get("db_replicas", [])
+        ]
+        self._next_replica = itertools.cycle(self.replicas)
+        # caller -> end of its read-your-writes window
+        self.writes = {}
+
+    def wrote(self, caller):
+        """Record a write of `caller`, its next reads go to the primary."""
+        if caller is None or not self.replicas or not self.read_your_writes:
+            return
+        now = self.clock()
+        self.writes = {c: end for c, end in self.writes.items() if end > now}
+        self.writes[caller] = now + self.read_your_writes
+
+    def reader(self, caller=None):
+        """Session factory for the reads of `caller`."""
+        if not self.replicas or self.writes.get(caller, 0) > self.clock():
+            return self.session
+        if self.balance == "least_connections":
+            return min(self.replicas, key=lambda replica: replica.in_use).session
+        return next(self._next_replica).session
+
+    def metrics(self):
+        """Pool state and counters, empty when the pool isn't metered."""
+        pool = self.eng.pool
+        if not isinstance(pool, MeteredPool):
+            return {}
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": pool.metrics.checkouts,
+            "overflows": pool.metrics.overflows,
+            "timeouts": pool.metrics.timeouts,
+            "wait_seconds_total": pool.metrics.wait_total,
+            "wait_seconds_max": pool.metrics.wait_max,
+            "wait_seconds_buckets": dict(zip(WAIT_BUCKETS, pool.metrics.wait_buckets)),
+        }
+
+    async def dispose(self):
+        log.debug("dispose db service")
+        await self.eng.dispose()
+        for replica in self.replicas:
+            await replica.eng.dispose()
+
+
+_service = None
+
+
+def start(config):
+    global _service
+    if _service is not None:
+        raise RuntimeError("db service already started.")
+    _service = DbService(config)
+    return _service
+
+
+async def stop():
+    global _service
+    if _service is not None:
+        service, _service = _service, None
+        await service.dispose()
+
+
+def get_db_service():
+    if _service is None:
+        raise RuntimeError("db service is not started.")
+    return _service
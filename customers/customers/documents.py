@@ -0,0 +1,125 @@
+"""Parsed documents cache and automatic persisted queries.
+
+Validated documents are kept by the sha256 of their query text, so a query
+already seen is neither parsed nor validated again. The same hashes serve
+automatic persisted queries: a client may send only
+`{"extensions": {"persistedQuery": {"version": 1, "sha256Hash": ...}}}`
+and the variables, the query text being sent once, the first time its hash
+is unknown.
+"""
+from collections import OrderedDict
+from hashlib import sha256
+import json
+import logging
+
+from strawberry.extensions import Extension
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 512
+
+PERSISTED_QUERY_NOT_FOUND = "PersistedQueryNotFound"
+
+
+def query_hash(query):
+    return sha256(query.encode()).hexdigest()
+
+
+class DocumentCache:
+    """LRU mapping of query hashes to their query text and parsed document."""
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _get(self, key):
+        if (entry := self.entries.get(key)) is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def query(self, key):
+        entry = self._get(key)
+        return entry and entry[0]
+
+    def document(self, key):
+        entry = self._get(key)
+        return entry and entry[1]
+
+    def add(self, key, query, document=None):
+        if document is None and (entry := self.entries.get(key)):
+            document = entry[1]
+        self.entries[key] = (query, document)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+documents = DocumentCache()
+
+
+class PersistedQueryError(ValueError):
+    def __init__(self, message, code):
+        super().__init__(message)
+        self.code = code
+
+    def as_response(self):
+        return {"errors": [{"message": str(self), "extensions": {"code": self.code}}]}
+
+
+def resolve_persisted_query(data, cache=None):
+    """Request payload with its query filled from its persisted query hash.
+
+    The payload is left as is, the filled one is a copy. A payload with both
+    the query and its hash registers the query.
+    """
+    cache = documents if cache is None else cache
+    extensions = data.get("extensions") or {}
+    if isinstance(extensions, str):
+        extensions = json.loads(extensions)
+    if not (persisted := extensions.get("persistedQuery")):
+        return data
+    if persisted.get("version") != 1:
+        raise PersistedQueryError(
+            "Unsupported persisted query version.", "PERSISTED_QUERY_NOT_SUPPORTED"
+        )
+    key = persisted.get("sha256Hash")
+    if query := data.get("query"):
+        if query_hash(query) != key:
+            raise PersistedQueryError(
+                "provided sha does not match query", "INVALID_PERSISTED_QUERY"
+            )
+        cache.add(key, query)
+    elif query := cache.query(key):
+        data = {**data, "query": query}
+    else:
+        raise PersistedQueryError(
+            PERSISTED_QUERY_NOT_FOUND, "PERSISTED_QUERY_NOT_FOUND"
+        )
+    return data
+
+
+class CachedDocuments(Extension):
+    """Skip parsing and validation of documents already validated."""
+
+    def on_parsing_start(self):
+        context = self.execution_context
+        self.key = query_hash(context.query)
+        if document := documents.document(self.key):
+            context.graphql_document = document
+            self.validated = True
+        else:
+            self.validated = False
+
+    def on_validation_start(self):
+        if self.validated:
+            # validation is skipped by strawberry when errors are already set
+            self.execution_context.errors = []
+
+    def on_validation_end(self):
+        context = self.execution_context
+        if not self.validated and not context.errors:
+            documents.add(self.key, context.query, context.graphql_document)
@@ -1,8 +1,55 @@
-from decimal import Decimal
+from decimal import Context, Decimal
+from itertools import chain
+import math
+
+import numpy as np
 from sqlalchemy import sql
 from sqlalchemy.orm.properties import CompositeProperty
 
 
+# coordinates are stored as Numeric(11, 8)
+SCALE_DIGITS = 8
+
+# precise enough to scale any Decimal, even built from a float, exactly
+_EXACT = Context(prec=1100)
+# ints scaled exactly by the default context, of 28 digits
+_DEFAULT_MAX = 10**28
+_UNIT = Decimal(1).scaleb(-SCALE_DIGITS)
+
+
+def scaled(value):
+    """Coordinate counted in 10**-8 units.
+
+    An int when the coordinate fits in Numeric(11, 8), which is always the
+    case for rows loaded from the database, the exact scaled Decimal otherwise
+    so comparisons stay exact.
+    """
+    value = Decimal(value).scaleb(SCALE_DIGITS, context=_EXACT)
+    units = int(value)
+    return units if units == value else value
+
+
+def unscaled(units):
+    if type(units) is int and -_DEFAULT_MAX < units < _DEFAULT_MAX:
+        return Decimal(units) * _UNIT
+    return Decimal(units).scaleb(-SCALE_DIGITS, context=_EXACT)
+
+
+def _bounds(units):
+    if type(units) is int:
+        return units, units
+    floor = math.floor(units)
+    return floor, floor + 1
+
+
+def to_fixed(value):
+    """Floor of a coordinate counted in 10**-8 units, and if it was exact."""
+    units = scaled(value)
+    if type(units) is int:
+        return units, True
+    return math.floor(units), False
+
+
 class CoordComparator(CompositeProperty.Comparator):
     def __gt__(self, other):
         return sql.and_(
@@ -58,9 +105,17 @@ class CoordComparator(CompositeProperty.Comparator):
 
 
 class Position:
+    """Immutable position, coordinates are kept in 10**-8 degree units.
+
+    Decimal coordinates are built each time `long` or `lat` is read, with
+    the 8 decimals of the `Numeric(11, 8)` columns, and aren't kept.
+    """
+
+    __slots__ = ("_long", "_lat")
+
     def __init__(self, long, lat):
-        self.long = Decimal(long)
-        self.lat = Decimal(lat)
+        self._long = scaled(long)
+        self._lat = scaled(lat)
 
     @classmethod
     def _generate(cls, long, lat):
@@ -68,45 +123,60 @@ class Position:
             return None
         return Position(long, lat)
 
+    @property
+    def long(self):
+        return unscaled(self._long)
+
+    @property
+    def lat(self):
+        return unscaled(self._lat)
+
+    def fixed(self):
+        """Floor and ceiling of longitude then latitude, in 10**-8 units."""
+        return (*_bounds(self._long), *_bounds(self._lat))
+
     def __composite_values__(self):
         return self.long, self.lat
 
     def __repr__(self):
         return f"Position(longitude={self.long!r}, latitude={self.lat!r})"
 
+    def __hash__(self):
+        return hash((self._long, self._lat))
+
     def __eq__(self, other):
         return (
             isinstance(other, Position)
-            and other.lat == self.lat
-            and other.long == self.long
+            and other._lat == self._lat
+            and other._long == self._long
         )
 
     def __lt__(self, other):
         return (
             isinstance(other, Position)
-            and other.lat > self.lat
-            and other.long > self.long
+            and other._lat > self._lat
+            and other._long > self._long
         )
 
     def __gt__(self, other):
         return (
             isinstance(other, Position)
-            and other.lat < self.lat
-            and other.long < self.long
+            and other._lat < self._lat
+            and other._long < self._long
         )
 
     def __le__(self, other):
         return (
             isinstance(other, Position)
-            and other.lat >= self.lat
-            and other.long >= self.long
+            and other._lat >= self._lat
+            and other._long >= self._long
         )
 
     def __ge__(self, other):
         return (
             isinstance(other, Position)
-            and other.lat <= self.lat
-            and other.long <= self.long
+            and other._lat <= self._lat
+            and other._long <= self._long
         )
 
     def __ne__(self, other):
@@ -117,12 +187,14 @@ class Position:
 
 
 class Area:
+    __slots__ = ("bottom_corner", "top_corner")
+
     def __init__(self, bottom_corner, top_corner):
         self.bottom_corner = bottom_corner
         self.top_corner = top_corner
         if (
-            self.bottom_corner.lat > self.top_corner.lat
-            or self.bottom_corner.long > self.top_corner.long
+            self.bottom_corner._lat > self.top_corner._lat
+            or self.bottom_corner._long > self.top_corner._long
         ):
             raise ValueError("inconsistent area.")
 
@@ -139,6 +211,12 @@ class Area:
             Position(top_corner_long, top_corner_lat),
         )
 
+    def fixed(self):
+        """Corners in 10**-8 units, rounded inwards: (long_1, lat_1, long_2, lat_2)."""
+        _, long_1, _, lat_1 = self.bottom_corner.fixed()
+        long_2, _, lat_2, _ = self.top_corner.fixed()
+        return long_1, lat_1, long_2, lat_2
+
     def __composite_values__(self):
         return (
             self.bottom_corner.long,
@@ -150,6 +228,9 @@ class Area:
     def __repr__(self):
         return f"Area(bottom_corner={self.bottom_corner!r}, top_corner={self.top_corner!r})"
 
+    def __hash__(self):
+        return hash((self.bottom_corner, self.top_corner))
+
     def __eq__(self, other):
         return (
             isinstance(other, Area)
@@ -166,3 +247,199 @@ class Area:
             and point <= self.top_corner
             and point >= self.bottom_corner
         )
+
+
+# Batch engine: positions and areas as int64 arrays of 10**-8 degree units,
+# built from their `fixed()` coordinates.
+#
+# A position row is (long_floor, long_ceil, lat_floor, lat_ceil), both bounds
+# being equal unless the position is more precise than Numeric(11, 8). An area
+# row is (long_1, lat_1, long_2, lat_2), rounded inwards. With this layout
+# containment is exact, borders included, as with `Area.contains`.
+
+# far beyond Numeric(11, 8): positions out of it are in no area
+_LIMIT = 10**12
+_NOWHERE = (_LIMIT,) * 4
+_EMPTY = (1, 1, 0, 0)
+# areas covering more grid cells are checked against every position
+_MAX_AREA_CELLS = 16
+_MIN_CELL_SIZE = 10**5
+# number of position/area pairs compared at once by brute force checks
+_CHUNK = 2**22
+
+
+def _position_row(position):
+    if position is None:
+        return _NOWHERE
+    long, lat = position._long, position._lat
+    if type(long) is int and type(lat) is int:
+        return long, long, lat, lat
+    return position.fixed()
+
+
+def _area_row(area):
+    if area is None:
+        return _EMPTY
+    bottom, top = area.bottom_corner, area.top_corner
+    row = long_1, lat_1, long_2, lat_2 = bottom._long, bottom._lat, top._long, top._lat
+    if type(long_1) is type(lat_1) is type(long_2) is type(lat_2) is int:
+        return row
+    return area.fixed()
+
+
+def _array(rows):
+    try:
+        values = chain.from_iterable(rows)
+        return np.fromiter(values, dtype=np.int64, count=4 * len(rows)).reshape(-1, 4)
+    except OverflowError:
+        clipped = [[min(max(v, -_LIMIT), _LIMIT) for v in row] for row in rows]
+        return np.array(clipped, dtype=np.int64).reshape(-1, 4)
+
+
+def position_array(positions):
+    """Positions as an (N, 4) int64 array. `None` positions are in no area."""
+    if isinstance(positions, np.ndarray):
+        return positions
+    points = _array([_position_row(position) for position in positions])
+    points[(np.abs(points) >= _LIMIT).any(axis=1)] = _NOWHERE
+    return points
+
+
+def area_array(areas):
+    """Areas as an (M, 4) int64 array. `None` areas contain nothing."""
+    if isinstance(areas, np.ndarray):
+        return areas
+    # clipped areas still contain every position in range, and no other one
+    return np.clip(_array([_area_row(area) for area in areas]), 1 - _LIMIT, _LIMIT - 1)
+
+
+def _contains(points, boxes):
+    return (
+        (boxes[..., 0] <= points[..., 0])
+        & (points[..., 1] <= boxes[..., 2])
+        & (boxes[..., 1] <= points[..., 2])
+        & (points[..., 3] <= boxes[..., 3])
+    )
+
+
+def contains_mask(positions, areas):
+    """(N, M) boolean mask, true where position n is in area m."""
+    points = position_array(positions)
+    boxes = area_array(areas)
+    return _contains(points[:, np.newaxis, :], boxes[np.newaxis, :, :])
+
+
+def pairwise_contains(positions, areas):
+    """(N,) boolean mask, true where position n is in area n."""
+    return _contains(position_array(positions), area_array(areas))
+
+
+def within(area, positions):
+    """(N,) boolean mask, true where position n is in `area`."""
+    return _contains(position_array(positions), area_array([area])[0])
+
+
+def _first_in(points, boxes, candidates):
+    """Index in `candidates` of the first box containing each point, or -1."""
+    found = np.full(len(points), -1, dtype=np.int64)
+    if not len(candidates):
+        return found
+    step = max(1, _CHUNK // len(candidates))
+    for start in range(0, len(points), step):
+        mask = _contains(
+            points[start : start + step, np.newaxis, :],
+            boxes[np.newaxis, candidates, :],
+        )
+        hit = mask.any(axis=1)
+        found[start : start + step][hit] = candidates[mask.argmax(axis=1)[hit]]
+    return found
+
+
+def _ranges(counts):
+    """Offset of each item within its group, for groups of `counts` items."""
+    return np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+
+def locate(positions, areas):
+    """Index of the first area containing each position, -1 if none does.
+
+    Areas are spread over a regular grid sized after their median extent, so
+    each position is only compared with the few areas of its cell: the cost
+    grows with N + M rather than N * M.
+    """
+    points = position_array(positions)
+    boxes = area_array(areas)
+    n = len(points)
+    found = np.full(n, -1, dtype=np.int64)
+    valid = (boxes[:, 0] <= boxes[:, 2]) & (boxes[:, 1] <= boxes[:, 3])
+    if not n or not valid.any():
+        return found
+
+    extent = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+    cell = max(int(np.median(extent[valid])), _MIN_CELL_SIZE)
+    x_1, y_1, x_2, y_2 = (boxes[:, i] // cell for i in range(4))
+    width = x_2 - x_1 + 1
+    height = y_2 - y_1 + 1
+    covered = np.where(valid, width * height, 0)
+    small = np.flatnonzero(valid & (covered <= _MAX_AREA_CELLS))
+    large = np.flatnonzero(valid & (covered > _MAX_AREA_CELLS))
+
+    # one (cell, area) entry per cell covered by a small area
+    counts = covered[small]
+    area_of = np.repeat(small, counts)
+    offset = _ranges(counts)
+    cell_x = x_1[area_of] + offset // height[area_of]
+    cell_y = y_1[area_of] + offset % height[area_of]
+    point_x = points[:, 0] // cell
+    point_y = points[:, 2] // cell
+    origin_x = min(cell_x.min(initial=0), point_x.min())
+    origin_y = min(cell_y.min(initial=0), point_y.min())
+    rows = max(cell_y.max(initial=0), point_y.max()) - origin_y + 1
+    keys = (cell_x - origin_x) * rows + cell_y - origin_y
+    order = np.lexsort((area_of, keys))
+    keys = keys[order]
+    area_of = area_of[order]
+
+    # candidate (position, area) pairs sharing a cell, areas in index order
+    point_keys = (point_x - origin_x) * rows + point_y - origin_y
+    start = np.searchsorted(keys, point_keys, side="left")
+    counts = np.searchsorted(keys, point_keys, side="right") - start
+    point_of = np.repeat(np.arange(n), counts)
+    candidate = area_of[np.repeat(start, counts) + _ranges(counts)]
+    hit = _contains(points[point_of], boxes[candidate])
+    point_of, candidate = point_of[hit], candidate[hit]
+    first, index = np.unique(point_of, return_index=True)
+    found[first] = candidate[index]
+
+    if len(large):
+        in_large = _first_in(points, boxes, large)
+        replace = (in_large >= 0) & ((found < 0) | (in_large < found))
+        found[replace] = in_large[replace]
+    return found
+
+
+def nearest(positions, areas):
+    """Index of the nearest area of each position, -1 without position or area.
+
+    Distance is measured from the position to the area border, and is 0
+    inside the area, ties going to the first area. Every pair is compared,
+    by chunks.
+    """
+    points = position_array(positions)
+    boxes = area_array(areas)
+    found = np.full(len(points), -1, dtype=np.int64)
+    valid = (boxes[:, 0] <= boxes[:, 2]) & (boxes[:, 1] <= boxes[:, 3])
+    if not valid.any():
+        return found
+    step = max(1, _CHUNK // len(boxes))
+    for start in range(0, len(points), step):
+        chunk = points[start : start + step, np.newaxis, :]
+        dx = np.maximum(boxes[:, 0] - chunk[..., 1], chunk[..., 0] - boxes[:, 2])
+        dy = np.maximum(boxes[:, 1] - chunk[..., 3], chunk[..., 2] - boxes[:, 3])
+        distance = np.hypot(
+            np.maximum(dx, 0).astype(np.float64), np.maximum(dy, 0).astype(np.float64)
+        )
+        distance[:, ~valid] = np.inf
+        found[start : start + step] = distance.argmin(axis=1)
+    found[points[:, 0] == _LIMIT] = -1
+    return found
@@ -0,0 +1,124 @@
+from array import array
+import logging
+
+
+log = logging.getLogger(__name__)
+
+# 0.01 degree, in 10**-8 degree units
+DEFAULT_CELL_SIZE = 10**6
+# areas spreading over more cells are checked for every point instead
+MAX_AREA_CELLS = 64
+
+
+class AreaIndex:
+    """Grid index of areas, answering which areas contain a position.
+
+    Areas are stored as fixed point (10**-8 degree) integer boxes in a flat
+    array, and registered in every cell of a regular grid they cover. A
+    position is only compared with the areas of its cell, with integer
+    arithmetic.
+
+    Containment follows `Area.contains`: borders are included. It is exact
+    as long as the area corners or the position fit in `Numeric(11, 8)`,
+    which is always the case for areas and positions read from the database.
+    """
+
+    def __init__(self, cell_size=DEFAULT_CELL_SIZE):
+        self.cell_size = cell_size
+        self.keys = []
+        self.boxes = array("q")
+        self.cells = {}
+        self.large = array("q")
+
+    @classmethod
+    def from_areas(cls, areas, **kwargs):
+        """Build an index from `(key, area)` pairs."""
+        index = cls(**kwargs)
+        for key, area in areas:
+            index.add(key, area)
+        return index
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _covered(self, long_1, lat_1, long_2, lat_2):
+        size = self.cell_size
+        return (long_2 // size - long_1 // size + 1) * (
+            lat_2 // size - lat_1 // size + 1
+        )
+
+    def _cells(self, long_1, lat_1, long_2, lat_2):
+        size = self.cell_size
+        for x in range(long_1 // size, long_2 // size + 1):
+            for y in range(lat_1 // size, lat_2 // size + 1):
+                yield x, y
+
+    def add(self, key, area):
+        long_1, lat_1, long_2, lat_2 = area.fixed()
+        i = len(self.keys)
+        self.keys.append(key)
+        self.boxes.extend((long_1, lat_1, long_2, lat_2))
+        if long_1 > long_2 or lat_1 > lat_2:
+            # thinner than the coordinates precision: contains nothing
+            return
+        if self._covered(long_1, lat_1, long_2, lat_2) > MAX_AREA_CELLS:
+            self.large.append(i)
+            return
+        for cell in self._cells(long_1, lat_1, long_2, lat_2):
+            self.cells.setdefault(cell, array("q")).append(i)
+
+    def _search(self, long_lo, long_hi, lat_lo, lat_hi):
+        boxes = self.boxes
+        size = self.cell_size
+        for candidates in (
+            self.cells.get((long_lo // size, lat_lo // size), ()),
+            self.large,
+        ):
+            for i in candidates:
+                j = 4 * i
+                if (
+                    boxes[j] <= long_lo
+                    and boxes[j + 1] <= lat_lo
+                    and long_hi <= boxes[j + 2]
+                    and lat_hi <= boxes[j + 3]
+                ):
+                    yield i
+
+    def search(self, position):
+        """Keys of every area containing the position, in insertion order."""
+        found = sorted(self._search(*position.fixed()))
+        return [self.keys[i] for i in found]
+
+    def locate(self, positions):
+        """Key of an area containing each position, None when there is none.
+
+        When areas overlap, the first inserted one is returned.
+        """
+        located = []
+        for position in positions:
+            if position is None:
+                located.append(None)
+                continue
+            found = min(self._search(*position.fixed()), default=None)
+            located.append(None if found is None else self.keys[found])
+        return located
+
+    def overlaps(self, area):
+        """Keys of every area sharing at least a point with `area`."""
+        long_1, lat_1, long_2, lat_2 = area.fixed()
+        if long_1 > long_2 or lat_1 > lat_2:
+            return []
+        boxes = self.boxes
+        candidates = set(self.large)
+        if self._covered(long_1, lat_1, long_2, lat_2) > MAX_AREA_CELLS:
+            candidates.update(range(len(self.keys)))
+        else:
+            for cell in self._cells(long_1, lat_1, long_2, lat_2):
+                candidates.update(self.cells.get(cell, ()))
+        found = [
+            i
+            for i in sorted(candidates)
+            if max(long_1, boxes[4 * i]) <= min(long_2, boxes[4 * i + 2])
+            and max(lat_1, boxes[4 * i + 1]) <= min(lat_2, boxes[4 * i + 3])
+        ]
+        return [self.keys[i] for i in found]
@@ -4,15 +4,6 @@ import logging
 import logging.config
 
 
-class Singleton(type):
-    _instances = {}
-
-    def __call__(cls, *args, **kwargs):
-        if cls not in cls._instances:
-            cls._instances[cls] = super(Singleton, cls).__call__(*args, **kwargs)
-        return cls._instances[cls]
-
-
 def get_config():
     config_path = os.environ["CUSTOMERS_APP_CONFIG"]
     with open(config_path) as f:
@@ -20,5 +11,6 @@ def get_config():
     return config
 
 
-if logging_config := get_config().get("logging"):
-    logging.config.dictConfig(logging_config)
+def configure_logging(config):
+    if logging_config := config.get("logging"):
+        logging.config.dictConfig(logging_config)
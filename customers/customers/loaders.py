@@ -0,0 +1,158 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy import func, literal_column, union_all
+from sqlalchemy.future import select
+from strawberry.dataloader import DataLoader
+from strawberry.types import Info
+
+from customers import model, spatial
+from customers.access import restrict
+from customers.planner import Plan
+
+
+log = logging.getLogger(__name__)
+
+
+class Loaders:
+    """Batch loaders living for the duration of one GraphQL request.
+
+    Every relationship resolver goes through these loaders, so whatever the
+    shape of the query (fragments, aliases, nesting) a level of the response
+    costs one `IN (...)` query instead of one query per parent row. Root
+    resolvers merge their plan into `plan`, so loaders only fetch the columns
+    the request asks for. Counts are read from the summary tables, one
+    query per level and aggregate as well. Statistics only count the rows
+    `access` allows, rows loaded from allowed ones are allowed as well.
+    """
+
+    def __init__(self, session_factory, access=None):
+        self.session = session_factory
+        self.access = access
+        self.plan = Plan()
+        self.buildings = DataLoader(load_fn=self.load_buildings)
+        self.sites = DataLoader(load_fn=self.load_sites)
+        self.customers = DataLoader(load_fn=self.load_customers)
+        self.buildings_by_site = DataLoader(load_fn=self.load_buildings_by_site)
+        self.building_count_by_site = DataLoader(
+            load_fn=self.load_building_count_by_site
+        )
+        self.building_count_by_customer = DataLoader(
+            load_fn=self.load_building_count_by_customer
+        )
+        self.site_count_by_customer = DataLoader(
+            load_fn=self.load_site_count_by_customer
+        )
+        self.stats = DataLoader(load_fn=self.load_stats)
+
+    async def _fetch(self, stmt):
+        async with self.session() as s:
+            result = await s.execute(stmt)
+            return result.scalars().all()
+
+    async def _counts(self, stmt, ids):
+        async with self.session() as s:
+            counts = dict((await s.execute(stmt)).all())
+        return [counts.get(id, 0) for id in ids]
+
+    async def load_buildings(self, ids):
+        log.debug(f"load {len(ids)} buildings")
+        stmt = (
+            select(model.Building)
+            .filter(model.Building.id.in_(ids))
+            .options(*self.plan.options(model.Building))
+        )
+        buildings = {building.id: building for building in await self._fetch(stmt)}
+        return [buildings.get(id) for id in ids]
+
+    async def load_sites(self, ids):
+        log.debug(f"load {len(ids)} sites")
+        stmt = (
+            select(model.Site)
+            .filter(model.Site.id.in_(ids))
+            .options(*self.plan.options(model.Site))
+        )
+        sites = {site.id: site for site in await self._fetch(stmt)}
+        return [sites.get(id) for id in ids]
+
+    async def load_customers(self, ids):
+        log.debug(f"load {len(ids)} customers")
+        stmt = (
+            select(model.Customer)
+            .filter(model.Customer.id.in_(ids))
+            .options(*self.plan.options(model.Customer))
+        )
+        customers = {customer.id: customer for customer in await self._fetch(stmt)}
+        return [customers.get(id) for id in ids]
+
+    async def load_buildings_by_site(self, site_ids):
+        log.debug(f"load buildings of {len(site_ids)} sites")
+        stmt = (
+            select(model.Building)
+            .filter(model.Building.site_id.in_(site_ids))
+            .options(*self.plan.options(model.Building, "site_id"))
+            .order_by(model.Building.id)
+        )
+        buildings = defaultdict(list)
+        for building in await self._fetch(stmt):
+            buildings[building.site_id].append(building)
+        return [buildings[site_id] for site_id in site_ids]
+
+    async def load_building_count_by_site(self, site_ids):
+        log.debug(f"count buildings of {len(site_ids)} sites")
+        summary = model.SiteSummary
+        stmt = select(summary.site_id, summary.buildings_count).filter(
+            summary.site_id.in_(site_ids)
+        )
+        return await self._counts(stmt, site_ids)
+
+    async def load_building_count_by_customer(self, customer_ids):
+        log.debug(f"count buildings of {len(customer_ids)} customers")
+        summary = model.SiteSummary
+        stmt = (
+            select(model.Site.customer_id, func.sum(summary.buildings_count))
+            .join_from(model.Site, summary, summary.site_id == model.Site.id)
+            .filter(model.Site.customer_id.in_(customer_ids))
+            .group_by(model.Site.customer_id)
+        )
+        return await self._counts(stmt, customer_ids)
+
+    async def load_site_count_by_customer(self, customer_ids):
+        log.debug(f"count sites of {len(customer_ids)} customers")
+        summary = model.CustomerSummary
+        stmt = select(summary.customer_id, summary.sites_count).filter(
+            summary.customer_id.in_(customer_ids)
+        )
+        return await self._counts(stmt, customer_ids)
+
+    async def load_stats(self, areas):
+        """Counts and bounding box of the buildings in each area.
+
+        An area of None stands for every building. The statistics of all the
+        areas are computed by a single `UNION ALL` of aggregate queries.
+        """
+        log.debug(f"stats of {len(areas)} areas")
+        building, site = model.Building, model.Site
+        stmts = []
+        for i, area in enumerate(areas):
+            stmt = select(
+                literal_column(str(i)),
+                func.count(building.id),
+                func.count(building.site_id.distinct()),
+                func.count(site.customer_id.distinct()),
+                func.min(building.long),
+                func.min(building.lat),
+                func.max(building.long),
+                func.max(building.lat),
+            ).join(building.site)
+            if area is not None:
+                stmt = stmt.filter(spatial.get_backend().area_filter(area))
+            stmts.append(restrict(stmt, site, self.access))
+        stmt = stmts[0] if len(stmts) == 1 else union_all(*stmts)
+        async with self.session() as s:
+            rows = sorted((await s.execute(stmt)).all())
+        return [row[1:] for row in rows]
+
+
+def get_loaders(info: Info) -> Loaders:
+    return info.context["loaders"]
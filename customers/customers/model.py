@@ -1,6 +1,7 @@
 import enum
 
 from sqlalchemy import (
+    event,
     Column,
     Integer,
     String,
@@ -8,12 +9,15 @@ from sqlalchemy import (
     Numeric,
     Enum,
     ForeignKey,
+    func,
+    Index,
     PrimaryKeyConstraint,
     types,
 )
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, validates, relationship, composite
 
+from customers import summary
 from customers.geo import Area, Position, CoordComparator
 
 
@@ -63,6 +67,14 @@ class Customer(Base):
     user_roles = relationship(CustomerUserRole, back_populates="customer")
     sites = relationship("Site", back_populates="owner", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index(
+            "customers_name_lower_idx",
+            func.lower(name).label("name_lower"),
+            postgresql_ops={"name_lower": "text_pattern_ops"},
+        ),
+    )
+
     def __str__(self):
         return f"Customer({self.id}):{self.name}"
 
@@ -92,6 +104,14 @@ class Site(Base):
     owner = relationship(Customer, back_populates="sites")
     buildings = relationship("Building", back_populates="site", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index(
+            "sites_label_lower_idx",
+            func.lower(label).label("label_lower"),
+            postgresql_ops={"label_lower": "text_pattern_ops"},
+        ),
+    )
+
     area = composite(
         Area._generate,
         bottom_corner_long,
@@ -124,6 +144,16 @@ class Building(Base):
 
     site = relationship(Site, back_populates="buildings")
 
+    __table_args__ = (
+        Index("buildings_long_lat_idx", long, lat),
+        Index("buildings_site_id_long_lat_idx", site_id, long, lat),
+        Index(
+            "buildings_label_lower_idx",
+            func.lower(label).label("label_lower"),
+            postgresql_ops={"label_lower": "text_pattern_ops"},
+        ),
+    )
+
     position = composite(
         Position._generate, long, lat, comparator_factory=CoordComparator
     )
@@ -136,3 +166,38 @@ class Building(Base):
 
     def __str__(self):
         return f"Building({self.id}):{self.label}"
+
+
+class SiteSummary(Base):
+    """Buildings count and extent of a site, maintained by triggers."""
+
+    __tablename__ = "site_summaries"
+
+    site_id = Column(
+        Integer,
+        ForeignKey("sites.site_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    buildings_count = Column(Integer, nullable=False, server_default="0")
+    long_1 = Column(Numeric(11, 8))
+    lat_1 = Column(Numeric(11, 8))
+    long_2 = Column(Numeric(11, 8))
+    lat_2 = Column(Numeric(11, 8))
+
+
+class CustomerSummary(Base):
+    """Sites count of a customer, maintained by triggers."""
+
+    __tablename__ = "customer_summaries"
+
+    customer_id = Column(
+        Integer,
+        ForeignKey("customers.customer_id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    sites_count = Column(Integer, nullable=False, server_default="0")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def install_summary_triggers(target, connection, **kw):
+    summary.install(connection)
@@ -1,18 +1,40 @@
 import logging
-from sqlalchemy import func
+from sqlalchemy import func, literal_column, or_, text, update
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.future import select
 from sqlalchemy.orm import joinedload
+from strawberry import UNSET
 from customers import model
+from customers.cache import publish
+from customers.geo import pairwise_contains
 
 
 log = logging.getLogger(__name__)
 
 
-async def add_new_building_for_site(session, label, position, site_id):
-    stmt = select(model.Site).filter_by(id=site_id).options(joinedload(model.Site.owner))
+# Mutations take the `access` of their caller, None when it isn't restricted:
+# rows of customers it may not write are handled as missing ones.
+
+
+async def _writable(session, access):
+    """Ids of the customers `access` may write, None for all."""
+    return None if access is None else await access.customer_ids(session)
+
+
+async def _check_customer(session, access, customer_id, name="customer"):
+    customers = await _writable(session, access)
+    if customers is not None and customer_id not in customers:
+        raise RuntimeError(f"{name} does not exists.")
+
+
+async def add_new_building_for_site(session, label, position, site_id, access=None):
+    stmt = (
+        select(model.Site).filter_by(id=site_id).options(joinedload(model.Site.owner))
+    )
     site = (await session.execute(stmt)).one()[0]
     if not site:
         raise RuntimeError("site does not exists.")
+    await _check_customer(session, access, site.customer_id, "site")
     log.debug(f"New building {label} for {site.owner}")
     building = model.Building(
         label=label,
@@ -20,22 +42,30 @@ async def add_new_building_for_site(session, label, position, site_id):
         site=site,
     )
     session.add(building)
+    await session.flush()
+    publish(session, model.Building)
+    publish(session, model.Site)
     return building
 
 
-async def add_new_customer(session, name):
+async def add_new_customer(session, name, access=None):
+    if access is not None:
+        raise RuntimeError("not allowed to create customers.")
     log.debug(f"New customer {name}")
     customer = model.Customer(name=name)
     session.add(customer)
+    await session.flush()
+    publish(session, model.Customer)
     return customer
 
 
 async def add_new_site_for_customer(
-    session, label, area, address, zip_code, city, customer_id
+    session, label, area, address, zip_code, city, customer_id, access=None
 ):
     customer = await session.get(model.Customer, customer_id)
     if not customer:
         raise RuntimeError("customer does not exists.")
+    await _check_customer(session, access, customer_id)
 
     log.debug(f"New site {label} for {customer}")
     site = model.Site(
@@ -51,10 +81,15 @@ async def add_new_site_for_customer(
         else None,
     )
     session.add(site)
+    await session.flush()
+    publish(session, model.Site)
+    publish(session, model.Customer)
     return site
 
 
-async def add_new_building_for_new_site(session, label, position, site, customer_id):
+async def add_new_building_for_new_site(
+    session, label, position, site, customer_id, access=None
+):
     site = await add_new_site_for_customer(
         session,
         site.label,
@@ -63,6 +98,7 @@ async def add_new_building_for_new_site(session, label, position, site, customer
         site.zip_code,
         site.city,
         customer_id,
+        access,
     )
     log.debug(f"New building {label} for {site}")
     building = model.Building(
@@ -71,12 +107,16 @@ async def add_new_building_for_new_site(session, label, position, site, customer
         site=site,
     )
     session.add(building)
+    await session.flush()
+    publish(session, model.Building)
+    publish(session, model.Site)
     return building
 
 
-async def add_new_building_for_new_customer(session, label, position, site, customer):
-    customer = await add_new_customer(session, customer.name)
-    await session.flush()
+async def add_new_building_for_new_customer(
+    session, label, position, site, customer, access=None
+):
+    customer = await add_new_customer(session, customer.name, access)
     site = await add_new_site_for_customer(
         session,
         site.label,
@@ -93,44 +133,477 @@ async def add_new_building_for_new_customer(session, label, position, site, cust
         site=site,
     )
     session.add(building)
+    await session.flush()
+    publish(session, model.Building)
+    publish(session, model.Site)
     return building
 
 
-async def delete_building(session, id):
-    building = await session.get(model.Building, id)
-    if not building:
-        raise RuntimeError("building does not exists.")
-    site_id = building.site_id
-    log.debug(f"delete {building}")
-    await session.delete(building)
-    await session.flush()
-    count_site_stmt = select(func.count(model.Building.id)).filter(
-        model.Building.site_id == site_id
+# Cascading deletes are done by a single statement of data-modifying CTEs.
+# They all see the same snapshot, summaries included: a parent is left
+# without children when as many were deleted as its summary counts.
+# `{customer_allowed}` and `{site_allowed}` restrict the deleted rows to
+# those of the customers the caller may write.
+_DELETE_SITES_WITHOUT_BUILDINGS = """
+    deleted_sites AS (
+        DELETE FROM sites s
+        USING (
+            SELECT site_id, count(*) AS n FROM deleted_buildings GROUP BY site_id
+        ) d
+        JOIN site_summaries ss USING (site_id)
+        WHERE s.site_id = d.site_id AND ss.buildings_count = d.n
+        RETURNING s.site_id, s.customer_id
     )
-    count_site, *_ = (await session.execute(count_site_stmt)).one()
-    if count_site == 0:
-        await delete_site(session, site_id)
+"""
 
+_DELETE_CUSTOMERS_WITHOUT_SITES = """
+    deleted_customers AS (
+        DELETE FROM customers c
+        USING (
+            SELECT customer_id, count(*) AS n FROM deleted_sites GROUP BY customer_id
+        ) d
+        JOIN customer_summaries cs USING (customer_id)
+        WHERE c.customer_id = d.customer_id AND cs.sites_count = d.n
+        RETURNING c.customer_id
+    )
+"""
 
-async def delete_site(session, id):
-    site = await session.get(model.Site, id)
-    if not site:
+DELETE_BUILDINGS_STMT = f"""
+    deleted_buildings AS (
+        DELETE FROM buildings WHERE building_id = ANY(:ids) AND {{site_allowed}}
+        RETURNING building_id, site_id
+    ),
+    {_DELETE_SITES_WITHOUT_BUILDINGS},
+    {_DELETE_CUSTOMERS_WITHOUT_SITES}
+"""
+
+DELETE_SITES_STMT = f"""
+    deleted_buildings AS (
+        DELETE FROM buildings WHERE site_id = ANY(:ids) AND {{site_allowed}}
+        RETURNING building_id, site_id
+    ),
+    deleted_sites AS (
+        DELETE FROM sites WHERE site_id = ANY(:ids) AND {{customer_allowed}}
+        RETURNING site_id, customer_id
+    ),
+    {_DELETE_CUSTOMERS_WITHOUT_SITES}
+"""
+
+DELETE_CUSTOMERS_STMT = """
+    deleted_buildings AS (
+        DELETE FROM buildings
+        WHERE site_id IN (
+            SELECT site_id FROM sites
+            WHERE customer_id = ANY(:ids) AND {customer_allowed}
+        )
+        RETURNING building_id, site_id
+    ),
+    deleted_sites AS (
+        DELETE FROM sites WHERE customer_id = ANY(:ids) AND {customer_allowed}
+        RETURNING site_id, customer_id
+    ),
+    deleted_customers AS (
+        DELETE FROM customers WHERE customer_id = ANY(:ids) AND {customer_allowed}
+        RETURNING customer_id
+    )
+"""
+
+
+def _restriction(customers):
+    """SQL conditions on rows of the `customers` ids, always true for None."""
+    if customers is None:
+        return {"customer_allowed": "TRUE", "site_allowed": "TRUE"}
+    return {
+        "customer_allowed": "customer_id = ANY(:customers)",
+        "site_allowed": (
+            "site_id IN (SELECT site_id FROM sites WHERE customer_id = ANY(:customers))"
+        ),
+    }
+
+
+def _restricted(stmt, customers, params):
+    stmt = text(stmt.format(**_restriction(customers)))
+    if customers is not None:
+        params = {**params, "customers": list(customers)}
+    return stmt, params
+
+
+async def _delete(session, ctes, ids, access=None):
+    """Run a cascading delete, return deleted buildings, sites and customers.
+
+    The user roles of deleted customers go with them. Deleted rows and the
+    parents of deleted rows are published.
+    """
+    stmt, params = _restricted(
+        f"""
+        WITH {ctes},
+        deleted_roles AS (
+            DELETE FROM users_customers_rel
+            WHERE customer_id IN (SELECT customer_id FROM deleted_customers)
+        )
+        SELECT
+            ARRAY(SELECT building_id FROM deleted_buildings),
+            ARRAY(SELECT site_id FROM deleted_buildings),
+            ARRAY(SELECT site_id FROM deleted_sites),
+            ARRAY(SELECT customer_id FROM deleted_sites),
+            ARRAY(SELECT customer_id FROM deleted_customers)
+        """,
+        await _writable(session, access),
+        {"ids": list(ids)},
+    )
+    buildings, parent_sites, sites, parent_customers, customers = (
+        await session.execute(stmt, params)
+    ).one()
+    if buildings:
+        publish(session, model.Building)
+    if parent_sites or sites:
+        publish(session, model.Site)
+    if parent_customers or customers:
+        publish(session, model.Customer)
+    return len(buildings), len(sites), len(customers)
+
+
+async def delete_buildings(session, ids, access=None):
+    """Delete buildings, then sites and customers left empty."""
+    ids = set(ids)
+    counts = await _delete(session, DELETE_BUILDINGS_STMT, ids, access)
+    if counts[0] != len(ids):
+        raise RuntimeError("building does not exists.")
+    log.debug(f"delete {counts[0]} buildings, {counts[1]} sites, {counts[2]} customers")
+    return counts
+
+
+async def delete_building(session, id, access=None):
+    return await delete_buildings(session, [id], access)
+
+
+async def delete_site(session, id, access=None):
+    counts = await _delete(session, DELETE_SITES_STMT, [id], access)
+    if counts[1] == 0:
         raise RuntimeError("site does not exists.")
-    customer_id = site.customer_id
-    log.debug(f"delete {site}")
-    count_customer_stmt = select(func.count(model.Site.id)).filter(
-        model.Site.customer_id == customer_id
+    log.debug(f"delete site {id} with {counts[0]} buildings")
+    return counts
+
+
+async def delete_customer(session, id, access=None):
+    counts = await _delete(session, DELETE_CUSTOMERS_STMT, [id], access)
+    if counts[2] == 0:
+        raise RuntimeError("customer does not exists.")
+    log.debug(f"delete customer {id} with {counts[1]} sites")
+    return counts
+
+
+IMPORT_TABLE = "buildings_import"
+
+IMPORT_COLUMNS = ("row_number", "label", "site_id", "long", "lat")
+
+# every row gets its error, or the id of the building inserted for it
+IMPORT_STMT = f"""
+    WITH checked AS (
+        SELECT i.row_number, i.label, i.site_id, i.long, i.lat,
+            CASE
+                WHEN i.label IS NULL THEN 'label is missing.'
+                WHEN s.site_id IS NULL THEN 'site does not exists.'
+                WHEN (i.long IS NULL) <> (i.lat IS NULL)
+                    THEN 'incomplete position.'
+                WHEN abs(i.long) >= 1000 OR abs(i.lat) >= 1000
+                    THEN 'position out of range.'
+                WHEN s.long_1 IS NOT NULL AND s.lat_1 IS NOT NULL
+                    AND s.long_2 IS NOT NULL AND s.lat_2 IS NOT NULL
+                    AND (
+                        i.long IS NULL
+                        OR i.long NOT BETWEEN s.long_1 AND s.long_2
+                        OR i.lat NOT BETWEEN s.lat_1 AND s.lat_2
+                    )
+                    THEN 'building coordinates are not in site area.'
+            END AS error
+        FROM {IMPORT_TABLE} i
+        LEFT JOIN sites s ON s.site_id = i.site_id AND {{customer_allowed}}
+    ),
+    numbered AS (
+        SELECT checked.*,
+            CASE WHEN error IS NULL
+                THEN nextval(pg_get_serial_sequence('buildings', 'building_id'))
+            END AS building_id
+        FROM checked
+    ),
+    inserted AS (
+        INSERT INTO buildings (building_id, site_id, label, long, lat)
+        SELECT building_id, site_id, label, long, lat
+        FROM numbered
+        WHERE error IS NULL
     )
-    await session.delete(site)
-    await session.flush()
-    if (await session.execute(count_customer_stmt)).one()[0] == 0:
-        await delete_customer(session, customer_id)
+    SELECT row_number, building_id, site_id, error
+    FROM numbered ORDER BY row_number
+"""
 
 
-async def delete_customer(session, id):
-    customer = await session.get(model.Customer, id)
-    if not customer:
+async def import_buildings(session, buildings, access=None):
+    """Insert `(label, site_id, long, lat)` rows in bulk.
+
+    Rows are copied to a staging table, then checked against their site area
+    and inserted by a single statement. Invalid rows are not inserted and
+    don't prevent the other ones to be.
+
+    Return the id of the building inserted for each row, or None, and the
+    list of `(row index, message)` errors.
+    """
+    await session.execute(
+        text(
+            f"""
+            CREATE TEMPORARY TABLE {IMPORT_TABLE} (
+                row_number integer, label varchar, site_id integer,
+                long numeric, lat numeric
+            ) ON COMMIT DROP
+            """
+        )
+    )
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        IMPORT_TABLE,
+        records=((i, *building) for i, building in enumerate(buildings)),
+        columns=IMPORT_COLUMNS,
+    )
+    stmt, params = _restricted(IMPORT_STMT, await _writable(session, access), {})
+    ids, errors = [], []
+    for row_number, building_id, _, error in await session.execute(stmt, params):
+        ids.append(building_id)
+        if error:
+            errors.append((row_number, error))
+    await session.execute(text(f"DROP TABLE {IMPORT_TABLE}"))
+    if len(ids) > len(errors):
+        publish(session, model.Building)
+        publish(session, model.Site)
+    log.debug(f"{len(ids) - len(errors)} buildings imported, {len(errors)} errors")
+    return ids, errors
+
+
+def _next_id(table, column):
+    return func.nextval(func.pg_get_serial_sequence(table, column))
+
+
+# asyncpg accepts at most 32767 parameters by statement
+UPSERT_ROWS = 2000
+
+
+async def _upsert(session, table, pk, rows, owner):
+    """Insert or update `rows`, return their ids in order.
+
+    Rows are written by multi-row statements of `UPSERT_ROWS` rows, one per
+    set of columns: rows with an id only update the columns they have. Rows
+    without id get a new one, rows with an id update the existing row as
+    long as it still belongs to the same `owner` column value.
+    """
+    ids = [None] * len(rows)
+    groups = {}
+    for index, row in enumerate(rows):
+        groups.setdefault(tuple(row), []).append(index)
+    for columns, indexes in groups.items():
+        for start in range(0, len(indexes), UPSERT_ROWS):
+            chunk = indexes[start : start + UPSERT_ROWS]
+            stmt = insert(table).values(
+                [
+                    {
+                        **rows[index],
+                        pk: _next_id(table.name, pk)
+                        if rows[index][pk] is None
+                        else rows[index][pk],
+                    }
+                    for index in chunk
+                ]
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[pk],
+                set_={c: stmt.excluded[c] for c in columns if c != pk},
+                where=table.c[owner] == stmt.excluded[owner],
+            ).returning(table.c[pk], literal_column("xmax = 0"))
+            returned = (await session.execute(stmt)).all()
+            updated = {id for id, inserted in returned if not inserted}
+            if updated != {rows[i][pk] for i in chunk if rows[i][pk] is not None}:
+                raise RuntimeError(f"{pk.removesuffix('_id')} does not exists.")
+            # ids are drawn from the sequence in VALUES order
+            created = iter(sorted(id for id, inserted in returned if inserted))
+            for index in chunk:
+                ids[index] = rows[index][pk] or next(created)
+    return ids
+
+
+AREA_COLUMNS = ("long_1", "lat_1", "long_2", "lat_2")
+
+
+def _site_row(site, omitted=()):
+    """Columns of `site`, but those of the `omitted` fields."""
+    area = site.area
+    row = {
+        "site_id": site.id,
+        "customer_id": site.customer_id,
+        "label": site.label,
+        "address": site.address,
+        "zip_code": site.zip_code,
+        "city": site.city,
+        "long_1": area.bottom_corner.long if area else None,
+        "lat_1": area.bottom_corner.lat if area else None,
+        "long_2": area.top_corner.long if area else None,
+        "lat_2": area.top_corner.lat if area else None,
+    }
+    for field in omitted:
+        for column in AREA_COLUMNS if field == "area" else (field,):
+            del row[column]
+    return row
+
+
+def _building_row(building, position_omitted=False):
+    position = building.position
+    row = {
+        "building_id": building.id,
+        "site_id": building.site_id,
+        "label": building.label,
+        "long": position.long if position else None,
+        "lat": position.lat if position else None,
+    }
+    if position_omitted:
+        del row["long"], row["lat"]
+    return row
+
+
+SITE_FIELDS = ("area", "address", "zip_code", "city")
+
+
+def _omitted(tree_input, fields):
+    """Fields left out of the input of an existing row, kept as they are."""
+    if tree_input.id is None:
+        return ()
+    return tuple(field for field in fields if getattr(tree_input, field) is UNSET)
+
+
+def _given(value):
+    return None if value is UNSET else value
+
+
+async def _check_areas(session, site_ids):
+    """Check that the buildings of sites `site_ids` are in their area."""
+    sites, buildings = model.Site.__table__, model.Building.__table__
+    stmt = (
+        select(buildings.c.building_id)
+        .join(sites, sites.c.site_id == buildings.c.site_id)
+        .where(
+            sites.c.site_id.in_(site_ids),
+            sites.c.long_1.is_not(None),
+            or_(
+                buildings.c.long.is_(None),
+                buildings.c.lat.is_(None),
+                buildings.c.long < sites.c.long_1,
+                buildings.c.long > sites.c.long_2,
+                buildings.c.lat < sites.c.lat_1,
+                buildings.c.lat > sites.c.lat_2,
+            ),
+        )
+        .limit(1)
+    )
+    if (await session.execute(stmt)).first() is not None:
+        raise ValueError("building coordinates are not in site area.")
+
+
+async def upsert_customer_tree(session, tree, access=None):
+    """Create or update a customer with its sites and their buildings.
+
+    Sites and buildings are written by one multi-row statement each, rows
+    with an id update the matching one, but the fields their input leaves
+    out. Nothing is deleted. A tree without id is merged, by name, into the
+    customer of this name when there is one: customer names are unique.
+    Restricted callers only update the customers they may write, found by
+    name when the tree has no id.
+
+    Return the customer, sites and buildings as transient model objects.
+    """
+    customers = await _writable(session, access)
+    if tree.id is None and customers is None:
+        stmt = insert(model.Customer.__table__).values(name=tree.name)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["name"], set_={"name": stmt.excluded.name}
+        )
+    else:
+        stmt = update(model.Customer.__table__).values(name=tree.name)
+        if tree.id is None:
+            stmt = stmt.where(model.Customer.name == tree.name)
+        else:
+            stmt = stmt.where(model.Customer.id == tree.id)
+        if customers is not None:
+            stmt = stmt.where(model.Customer.id.in_(list(customers)))
+    stmt = stmt.returning(model.Customer.__table__.c.customer_id)
+    customer_id = (await session.execute(stmt)).scalar()
+    if customer_id is None:
         raise RuntimeError("customer does not exists.")
-    log.debug(f"delete {customer}")
-    await session.delete(customer)
-    await session.flush()
+    customer = model.Customer(id=customer_id, name=tree.name)
+    log.debug(f"upsert {customer} with {len(tree.sites)} sites")
+
+    sites, site_rows, buildings, building_rows = [], [], [], []
+    # (position, area) pairs given by the tree, checked at once
+    checked = []
+    for site_input in tree.sites:
+        area = _given(site_input.area)
+        site = model.Site(
+            id=site_input.id,
+            customer_id=customer_id,
+            label=site_input.label,
+            address=_given(site_input.address),
+            zip_code=_given(site_input.zip_code),
+            city=_given(site_input.city),
+            area=model.Area(
+                model.Position(area.bottom_corner.long, area.bottom_corner.lat),
+                model.Position(area.top_corner.long, area.top_corner.lat),
+            )
+            if area
+            else None,
+        )
+        sites.append(site)
+        site_rows.append((site, _omitted(site_input, SITE_FIELDS)))
+        for building_input in site_input.buildings:
+            position = _given(building_input.position)
+            building = model.Building(
+                id=building_input.id,
+                label=building_input.label,
+                position=model.Position(position.long, position.lat)
+                if position
+                else None,
+            )
+            position_omitted = bool(_omitted(building_input, ("position",)))
+            # existing sites and positions are checked once written
+            if site.area and not position_omitted:
+                checked.append((building.position, site.area))
+            buildings.append((site, building))
+            building_rows.append((building, position_omitted))
+    if checked and not pairwise_contains(*zip(*checked)).all():
+        raise ValueError("building coordinates are not in site area.")
+    publish(session, model.Customer)
+    if not sites:
+        return customer, sites, []
+
+    site_ids = await _upsert(
+        session,
+        model.Site.__table__,
+        "site_id",
+        [_site_row(site, omitted) for site, omitted in site_rows],
+        "customer_id",
+    )
+    for site, site_id in zip(sites, site_ids):
+        site.id = site_id
+    publish(session, model.Site)
+    for site, building in buildings:
+        building.site_id = site.id
+    if buildings:
+        building_ids = await _upsert(
+            session,
+            model.Building.__table__,
+            "building_id",
+            [_building_row(*row) for row in building_rows],
+            "site_id",
+        )
+        for (_, building), building_id in zip(buildings, building_ids):
+            building.id = building_id
+        publish(session, model.Building)
+    # a new area may leave out buildings not in the tree
+    if existing := [site.id for site, given in zip(sites, tree.sites) if given.id]:
+        await _check_areas(session, existing)
+    return customer, sites, [building for _, building in buildings]
@@ -0,0 +1,56 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+import logging
+import typing
+
+from customers.schema import Connection, Edge, PageInfo
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(entity, id: int) -> str:
+    return urlsafe_b64encode(f"{entity.__name__}:{id}".encode()).decode()
+
+
+def decode_cursor(entity, cursor: str) -> int:
+    try:
+        name, id = urlsafe_b64decode(cursor.encode()).decode().split(":")
+        if name == entity.__name__:
+            return int(id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        pass
+    raise ValueError(f"invalid cursor for {entity.__name__}.")
+
+
+def paginate(stmt, entity, first: int, after: typing.Optional[str] = None):
+    """Restrict a statement ordered by `entity.id` to one page.
+
+    Pages are addressed by the id of the last row seen (keyset pagination),
+    so any page costs the same primary key index range scan as the first
+    one. One extra row is fetched to know if there is a next page.
+    """
+    if not 0 < first <= MAX_PAGE_SIZE:
+        raise ValueError(f"first must be between 1 and {MAX_PAGE_SIZE}.")
+    if after:
+        stmt = stmt.filter(entity.id > decode_cursor(entity, after))
+    return stmt.limit(first + 1)
+
+
+def make_connection(
+    entity, rows, first: int, after: typing.Optional[str] = None
+) -> Connection:
+    edges = [Edge(cursor=encode_cursor(entity, row.id), node=row) for row in rows]
+    page = edges[:first]
+    return Connection(
+        edges=page,
+        page_info=PageInfo(
+            has_next_page=len(edges) > first,
+            has_previous_page=bool(after),
+            start_cursor=page[0].cursor if page else None,
+            end_cursor=page[-1].cursor if page else None,
+        ),
+    )
@@ -0,0 +1,165 @@
+import logging
+from collections import defaultdict
+
+from sqlalchemy.orm import load_only
+from strawberry.types import Info
+from strawberry.types.nodes import SelectedField
+
+from customers import model
+
+
+log = logging.getLogger(__name__)
+
+
+# mapped attributes needed to resolve each GraphQL field of an entity
+COLUMNS = {
+    model.Customer: {
+        "id": ("id",),
+        "name": ("name",),
+        "siteCount": ("id",),
+        "buildingCount": ("id",),
+    },
+    model.Site: {
+        "id": ("id",),
+        "label": ("label",),
+        "area": (
+            "bottom_corner_long",
+            "bottom_corner_lat",
+            "top_corner_long",
+            "top_corner_lat",
+        ),
+        "address": ("address",),
+        "zipCode": ("zip_code",),
+        "city": ("city",),
+        "owner": ("customer_id",),
+        "buildings": ("id",),
+        "buildingCount": ("id",),
+    },
+    model.Building: {
+        "id": ("id",),
+        "label": ("label",),
+        "position": ("long", "lat"),
+        "site": ("site_id",),
+    },
+}
+
+# GraphQL fields resolved through a loader, and the entity they lead to
+RELATIONS = {
+    model.Site: {
+        "owner": model.Customer,
+        "buildings": model.Building,
+    },
+    model.Building: {
+        "site": model.Site,
+    },
+}
+
+# aggregate GraphQL fields, and the entities they count
+AGGREGATES = {
+    model.Customer: {
+        "siteCount": (model.Site,),
+        "buildingCount": (model.Site, model.Building),
+    },
+    model.Site: {
+        "buildingCount": (model.Building,),
+    },
+}
+
+
+class Plan:
+    """Columns each entity has to load to answer a selection set.
+
+    The whole selection tree is walked: aliases resolve to their field name,
+    fragment spreads and inline fragments are flattened into the selection
+    they belong to, and relationship fields are followed so the loaders of
+    the nested levels can restrict their columns too.
+    """
+
+    def __init__(self):
+        self.columns = defaultdict(set)
+        # entities read without loading them: joined to filter, or counted
+        self.joined = set()
+
+    def add(self, entity, selections):
+        fields = COLUMNS[entity]
+        relations = RELATIONS.get(entity, {})
+        aggregates = AGGREGATES.get(entity, {})
+        self.columns[entity].add("id")
+        for selection in selections:
+            if not isinstance(selection, SelectedField):
+                self.add(entity, selection.selections)
+                continue
+            self.columns[entity].update(fields.get(selection.name, ()))
+            if related := relations.get(selection.name):
+                self.add(related, selection.selections)
+            self.join(*aggregates.get(selection.name, ()))
+        return self
+
+    def update(self, other):
+        for entity, columns in other.columns.items():
+            self.columns[entity].update(columns)
+        self.joined.update(other.joined)
+        return self
+
+    def join(self, *entities):
+        self.joined.update(entities)
+        return self
+
+    def entities(self):
+        """Every entity the planned statements read."""
+        return self.joined.union(self.columns)
+
+    def options(self, entity, *extra):
+        """Loader option deferring every column the plan doesn't need.
+
+        An entity missing from the plan is fully loaded.
+        """
+        if entity not in self.columns:
+            return ()
+        columns = sorted(self.columns[entity].union(extra))
+        log.debug(f"load {entity.__name__} with {columns}")
+        return (load_only(*(getattr(entity, column) for column in columns)),)
+
+
+def plan_query(info: Info, entity) -> Plan:
+    plan = Plan()
+    for field in info.selected_fields:
+        plan.add(entity, field.selections)
+    return plan
+
+
+def _fields(selections, name):
+    for selection in selections:
+        if not isinstance(selection, SelectedField):
+            yield from _fields(selection.selections, name)
+        elif selection.name == name:
+            yield selection
+
+
+def plan_connection(info: Info, entity) -> Plan:
+    """Plan of a connection field: entity fields are under `edges { node }`."""
+    plan = Plan()
+    plan.columns[entity].add("id")
+    for field in info.selected_fields:
+        for edges in _fields(field.selections, "edges"):
+            for node in _fields(edges.selections, "node"):
+                plan.add(entity, node.selections)
+    return plan
+
+
+# fields of a search hit leading to the entity hit
+SEARCH_HITS = {
+    "customer": model.Customer,
+    "site": model.Site,
+    "building": model.Building,
+}
+
+
+def plan_search(info: Info) -> Plan:
+    """Plan of a search field: every searched entity is read."""
+    plan = Plan().join(*SEARCH_HITS.values())
+    for field in info.selected_fields:
+        for name, entity in SEARCH_HITS.items():
+            for hit in _fields(field.selections, name):
+                plan.add(entity, hit.selections)
+    return plan
@@ -1,13 +1,15 @@
 import logging
 import typing
 
-from sqlalchemy import and_
-from sqlalchemy.orm import joinedload
 from sqlalchemy.future import select
 from strawberry.types import Info
 
-from customers import model
+from customers import model, spatial
+from customers.access import restrict
+from customers.loaders import get_loaders
+from customers.planner import Plan, plan_query
 from customers.schema import Building, AreaInput
+from customers.search import match
 
 
 log = logging.getLogger(__name__)
@@ -18,43 +20,29 @@ def get_buildings_query(
     label: typing.Optional[str] = None,
     area: typing.Optional[AreaInput] = None,
     customer_name: typing.Optional[str] = None,
+    plan: typing.Optional[Plan] = None,
 ):
 
-    stmt = select(model.Building).order_by(model.Building.id)
-
-    if "site" in (field.name for field in info.selected_fields[0].selections):
-        log.debug("join site")
-        load_site_stmt = joinedload(model.Building.site)
-        site_fields = (
-            field
-            for field in info.selected_fields[0].selections
-            if field.name == "site"
-        )
-        for site_field in site_fields:
-            if "owner" in (field.name for field in site_field.selections):
-                log.debug("join owner")
-                load_site_stmt = load_site_stmt.subqueryload(model.Site.owner)
-                break
-        stmt = stmt.options(load_site_stmt)
+    plan = get_loaders(info).plan.update(plan or plan_query(info, model.Building))
+    stmt = (
+        select(model.Building)
+        .options(*plan.options(model.Building))
+        .order_by(model.Building.id)
+    )
+    stmt = restrict(stmt, model.Building, info.context.get("access"))
 
     if area:
-        stmt = stmt.filter(
-            and_(
-                model.Building.lat > area.bottom_corner.lat,
-                model.Building.long > area.bottom_corner.long,
-                model.Building.lat < area.top_corner.lat,
-                model.Building.long < area.top_corner.long,
-            )
-        )
+        stmt = stmt.filter(spatial.get_backend().area_filter(area))
 
     if label:
-        stmt = stmt.filter(model.Building.label.ilike(label))
+        stmt = stmt.filter(match(model.Building.label, label))
 
     if customer_name:
+        plan.join(model.Site, model.Customer)
         stmt = (
             stmt.join(model.Building.site)
             .join(model.Site.owner)
-            .filter(model.Customer.name.ilike(customer_name))
+            .filter(match(model.Customer.name, customer_name))
         )
     return stmt
 
@@ -63,27 +51,32 @@ def get_sites_query(
     info: Info,
     label: typing.Optional[str] = None,
     customer_name: typing.Optional[str] = None,
+    plan: typing.Optional[Plan] = None,
 ):
 
-    stmt = select(model.Site).order_by(model.Site.id)
-
-    if "owner" in (field.name for field in info.selected_fields[0].selections):
-        log.debug("join owner")
-        load_site_stmt = joinedload(model.Site.owner)
-        stmt = stmt.options(load_site_stmt)
+    plan = get_loaders(info).plan.update(plan or plan_query(info, model.Site))
+    stmt = select(model.Site).options(*plan.options(model.Site)).order_by(model.Site.id)
+    stmt = restrict(stmt, model.Site, info.context.get("access"))
 
     if label:
-        stmt = stmt.filter(model.Site.label.ilike(label))
+        stmt = stmt.filter(match(model.Site.label, label))
 
     if customer_name:
+        plan.join(model.Customer)
         stmt = stmt.join(model.Site.owner).filter(
-            model.Customer.name.ilike(customer_name)
+            match(model.Customer.name, customer_name)
         )
     return stmt
 
 
-def get_customer_query(info, name):
-    stmt = select(model.Customer).order_by(model.Customer.id)
+def get_customer_query(info, name, plan=None):
+    plan = get_loaders(info).plan.update(plan or plan_query(info, model.Customer))
+    stmt = (
+        select(model.Customer)
+        .options(*plan.options(model.Customer))
+        .order_by(model.Customer.id)
+    )
+    stmt = restrict(stmt, model.Customer, info.context.get("access"))
     if name:
-        stmt = stmt.filter(model.Customer.name.ilike(name))
+        stmt = stmt.filter(match(model.Customer.name, name))
     return stmt
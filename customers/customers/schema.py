@@ -1,12 +1,18 @@
 from decimal import Decimal
+import enum
 import logging
 import typing
 
 import strawberry
+from strawberry.types import Info
+
+from customers.loaders import get_loaders
 
 
 log = logging.getLogger(__name__)
 
+T = typing.TypeVar("T")
+
 
 @strawberry.type
 class Position:
@@ -37,6 +43,14 @@ class Customer:
     id: int
     name: str
 
+    @strawberry.field
+    async def site_count(self, info: Info) -> int:
+        return await get_loaders(info).site_count_by_customer.load(self.id)
+
+    @strawberry.field
+    async def building_count(self, info: Info) -> int:
+        return await get_loaders(info).building_count_by_customer.load(self.id)
+
 
 @strawberry.input
 class CustomerInput:
@@ -51,7 +65,18 @@ class Site:
     address: typing.Optional[list[str]]
     zip_code: typing.Optional[str]
     city: typing.Optional[str]
-    owner: Customer
+
+    @strawberry.field
+    async def owner(self, info: Info) -> Customer:
+        return await get_loaders(info).customers.load(self.customer_id)
+
+    @strawberry.field
+    async def buildings(self, info: Info) -> typing.List["Building"]:
+        return await get_loaders(info).buildings_by_site.load(self.id)
+
+    @strawberry.field
+    async def building_count(self, info: Info) -> int:
+        return await get_loaders(info).building_count_by_site.load(self.id)
 
 
 @strawberry.input
@@ -68,4 +93,130 @@ class Building:
     id: int
     label: str
     position: typing.Optional[Position] = None
-    site: Site
+
+    @strawberry.field
+    async def site(self, info: Info) -> Site:
+        return await get_loaders(info).sites.load(self.site_id)
+
+
+@strawberry.type
+class Stats:
+    """Buildings of an area, and the sites and customers owning them."""
+
+    building_count: int
+    site_count: int
+    customer_count: int
+    # of the buildings having a position
+    bounding_box: typing.Optional[Area]
+
+
+@strawberry.enum
+class SearchKind(enum.Enum):
+    CUSTOMER = "customer"
+    SITE = "site"
+    BUILDING = "building"
+
+
+@strawberry.type
+class SearchHit:
+    kind: SearchKind
+    id: int
+    # the matching name or label
+    text: str
+    score: float
+
+    @strawberry.field
+    async def customer(self, info: Info) -> typing.Optional[Customer]:
+        if self.kind == SearchKind.CUSTOMER:
+            return await get_loaders(info).customers.load(self.id)
+
+    @strawberry.field
+    async def site(self, info: Info) -> typing.Optional[Site]:
+        if self.kind == SearchKind.SITE:
+            return await get_loaders(info).sites.load(self.id)
+
+    @strawberry.field
+    async def building(self, info: Info) -> typing.Optional[Building]:
+        if self.kind == SearchKind.BUILDING:
+            return await get_loaders(info).buildings.load(self.id)
+
+
+@strawberry.input
+class BuildingTreeInput:
+    label: str
+    id: typing.Optional[int] = None
+    # left as they are when updating, when not given
+    position: typing.Optional[PositionInput] = strawberry.UNSET
+
+
+@strawberry.input
+class SiteTreeInput:
+    label: str
+    id: typing.Optional[int] = None
+    # left as they are when updating, when not given
+    area: typing.Optional[AreaInput] = strawberry.UNSET
+    address: typing.Optional[list[str]] = strawberry.UNSET
+    zip_code: typing.Optional[str] = strawberry.UNSET
+    city: typing.Optional[str] = strawberry.UNSET
+    buildings: typing.List[BuildingTreeInput] = strawberry.field(default_factory=list)
+
+
+@strawberry.input
+class CustomerTreeInput:
+    name: str
+    id: typing.Optional[int] = None
+    sites: typing.List[SiteTreeInput] = strawberry.field(default_factory=list)
+
+
+@strawberry.type
+class CustomerTree:
+    customer: Customer
+    sites: typing.List[Site]
+    buildings: typing.List[Building]
+
+
+@strawberry.input
+class BuildingImportInput:
+    label: str
+    site_id: int
+    position: typing.Optional[PositionInput] = None
+
+
+@strawberry.type
+class RowError:
+    index: int
+    message: str
+
+
+@strawberry.type
+class BuildingImport:
+    imported: int
+    building_ids: typing.List[typing.Optional[int]]
+    errors: typing.List[RowError]
+
+
+@strawberry.type
+class Deletion:
+    buildings: int
+    sites: int
+    customers: int
+
+
+@strawberry.type
+class PageInfo:
+    has_next_page: bool
+    has_previous_page: bool
+    start_cursor: typing.Optional[str]
+    end_cursor: typing.Optional[str]
+
+
+@strawberry.type
+class Edge(typing.Generic[T]):
+    cursor: str
+    node: T
+
+
+@strawberry.type
+class Connection(typing.Generic[T]):
+    edges: typing.List[Edge[T]]
+    page_info: PageInfo
@@ -0,0 +1,101 @@
+"""Label and name search.
+
+Filters take `ILIKE` patterns. A pattern without wildcard is an exact
+match, one ending with its only `%` a prefix match: both are answered by
+the `lower(...) text_pattern_ops` B-tree indexes. Other patterns match
+substrings, answered by the `pg_trgm` GIN indexes when the extension is
+available (see the `0005_search_index.py` migration), by a scan otherwise.
+
+`search_query` looks a term up in customer names, site labels and building
+labels at once, exact matches first, then prefix and substring ones.
+"""
+import logging
+import re
+
+from sqlalchemy import Float, case, cast, func, literal_column, union_all
+from sqlalchemy.future import select
+
+from customers import model
+from customers.access import restrict
+
+
+log = logging.getLogger(__name__)
+
+EXACT = "exact"
+PREFIX = "prefix"
+PATTERN = "pattern"
+
+DEFAULT_SEARCH_SIZE = 20
+MAX_SEARCH_SIZE = 100
+
+# searched entities: kind of hit, and searched column
+SEARCHED = (
+    ("customer", model.Customer, model.Customer.name),
+    ("site", model.Site, model.Site.label),
+    ("building", model.Building, model.Building.label),
+)
+
+_TOKENS = re.compile(r"\\.|[%_]|[^\\%_]+|\\")
+
+
+def match_mode(pattern):
+    """How a pattern matches: EXACT, PREFIX or PATTERN."""
+    wildcards = [t for t in _TOKENS.findall(pattern) if t in ("%", "_")]
+    if not wildcards:
+        return EXACT
+    if wildcards == ["%"] and pattern.endswith("%") and not pattern.endswith("\\%"):
+        return PREFIX
+    return PATTERN
+
+
+def unescape(pattern):
+    return re.sub(r"\\(.)", r"\1", pattern)
+
+
+def escape(term):
+    return re.sub(r"([\\%_])", r"\\\1", term)
+
+
+def match(column, pattern):
+    """Case insensitive filter of `column` on an `ILIKE` pattern."""
+    if match_mode(pattern) == EXACT:
+        return func.lower(column) == func.lower(unescape(pattern))
+    return func.lower(column).like(func.lower(pattern))
+
+
+def search_query(term, first=DEFAULT_SEARCH_SIZE, access=None):
+    """Statement of the `first` best hits of `term`: (kind, id, text, score).
+
+    Exact matches score 2, prefix matches 1 and other substring matches 0,
+    plus the share of the text the term covers. Only the rows `access`
+    allows are searched.
+    """
+    if not 0 < first <= MAX_SEARCH_SIZE:
+        raise ValueError(f"first must be between 1 and {MAX_SEARCH_SIZE}.")
+    if not term:
+        raise ValueError("search term is empty.")
+    escaped = escape(term)
+    hits = []
+    for kind, entity, column in SEARCHED:
+        lowered = func.lower(column)
+        score = case(
+            (lowered == func.lower(term), 2),
+            (lowered.like(func.lower(escaped + "%")), 1),
+            else_=0,
+        ) + cast(func.length(term), Float) / func.greatest(func.length(column), 1)
+        hit = (
+            select(
+                literal_column(f"'{kind}'").label("kind"),
+                entity.id.label("id"),
+                column.label("text"),
+                score.label("score"),
+            )
+            .where(lowered.like(func.lower(f"%{escaped}%")))
+            .order_by(score.desc(), entity.id)
+            .limit(first)
+        )
+        hits.append(restrict(hit, entity, access))
+    hits = union_all(*hits).subquery()
+    return (
+        select(hits).order_by(hits.c.score.desc(), hits.c.kind, hits.c.id).limit(first)
+    )
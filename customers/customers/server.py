@@ -0,0 +1,183 @@
+"""Pre-fork server of the ASGI application.
+
+The master process reads the config, sets logging up, imports the
+application (schema, models) and binds the listening socket once, then
+forks the workers, which share the socket. Each worker creates its engine
+and its pool on the ASGI startup event, after the fork, so no database
+connection is ever shared between processes.
+
+On SIGTERM or SIGINT the workers stop accepting connections, finish the
+requests in flight and dispose their engine. Those still running after
+`drain_timeout` seconds are killed. A worker dying is replaced, but a
+worker failing its startup stops the server.
+
+State kept in memory by a process isn't seen by the others: with several
+workers, the response cache should be the "redis" one, the "memory" one
+being turned off.
+
+    % PYTHONPATH=.:.. CUSTOMERS_APP_CONFIG=./config.json python -m customers.server
+"""
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from common.config import check, complete
+from customers.lib import configure_logging, get_config
+
+
+log = logging.getLogger(__name__)
+
+# settings of the "server" config entry
+SERVER_DEFAULTS = {
+    "host": "0.0.0.0",
+    "port": 8000,
+    # one worker per core when not given
+    "workers": None,
+    # seconds given to the workers to finish their requests
+    "drain_timeout": 30,
+    "backlog": 2048,
+}
+
+SIGNALS = {signal.SIGTERM, signal.SIGINT, signal.SIGCHLD}
+
+# exit status of a worker which could not start
+BOOT_ERROR = 3
+
+
+def server_config(config):
+    """Listening and worker settings of the `server` entry."""
+    settings = complete("server", config, SERVER_DEFAULTS)
+    if settings["workers"] is None:
+        settings["workers"] = os.cpu_count() or 1
+    for key, minimum in (("port", 0), ("workers", 1), ("backlog", 1)):
+        check("server", settings, key, int, minimum)
+    check("server", settings, "drain_timeout", float, 0)
+    return settings
+
+
+def worker_config(config, workers):
+    """App config of the workers.
+
+    The memory cache and the read-your-writes window are kept by each
+    process: with several workers, a mutation would only be seen by the one
+    which ran it. The memory cache is turned off then, and a
+    `read_your_writes` window refused.
+    """
+    if workers == 1:
+        return config
+    if config.get("db_replicas") and config.get("db_routing", {}).get(
+        "read_your_writes"
+    ):
+        raise ValueError(
+            "db_routing read_your_writes is tracked per process, "
+            "it needs a single worker."
+        )
+    if config.get("cache", {}).get("backend", "memory") == "memory":
+        log.warning(
+            f"memory cache is per process, off with {workers} workers: "
+            "use the redis backend to share one."
+        )
+        config = {**config, "cache": {"backend": "none"}}
+    return config
+
+
+def bind(host, port, backlog):
+    sock = socket.create_server((host, port), backlog=backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock):
+    """Serve `app` on `sock` until told to stop, in a forked process."""
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, SIGNALS)
+    server = uvicorn.Server(uvicorn.Config(app, lifespan="on", log_config=None))
+    server.run(sockets=[sock])
+    return 0 if server.started else BOOT_ERROR
+
+
+class Master:
+    def __init__(self, app, sock, workers, drain_timeout):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.drain_timeout = drain_timeout
+        self.pids = set()
+        self.boot_error = False
+
+    def spawn(self):
+        if pid := os.fork():
+            self.pids.add(pid)
+            return pid
+        status = 1
+        try:
+            status = run_worker(self.app, self.sock)
+        except BaseException:
+            log.exception("worker failed")
+        finally:
+            os._exit(status)
+
+    def reap(self):
+        """Forget the exited workers."""
+        while self.pids:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                break
+            self.pids.discard(pid)
+            if (code := os.waitstatus_to_exitcode(status)) == BOOT_ERROR:
+                log.error(f"worker {pid} failed to start")
+                self.boot_error = True
+            elif code:
+                log.warning(f"worker {pid} exited with {code}")
+
+    def run(self):
+        signal.pthread_sigmask(signal.SIG_BLOCK, SIGNALS)
+        log.info(f"start {self.workers} workers on {self.sock.getsockname()}")
+        for _ in range(self.workers):
+            self.spawn()
+        while True:
+            received = signal.sigtimedwait(SIGNALS, 1)
+            self.reap()
+            if self.boot_error or received and received.si_signo != signal.SIGCHLD:
+                break
+            while len(self.pids) < self.workers:
+                self.spawn()
+        self.stop()
+        return 1 if self.boot_error else 0
+
+    def stop(self):
+        log.info(f"drain {len(self.pids)} workers")
+        for pid in self.pids:
+            os.kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.drain_timeout
+        while self.pids and (left := deadline - time.monotonic()) > 0:
+            signal.sigtimedwait({signal.SIGCHLD}, left)
+            self.reap()
+        for pid in self.pids:
+            log.warning(f"kill worker {pid}")
+            os.kill(pid, signal.SIGKILL)
+        while self.pids:
+            pid, _ = os.waitpid(-1, 0)
+            self.pids.discard(pid)
+        self.sock.close()
+
+
+def main():
+    config = get_config()
+    configure_logging(config)
+    settings = server_config(config.get("server", {}))
+    config = worker_config(config, settings["workers"])
+    # loaded once, before the fork: workers share these pages
+    from customers.app import app
+
+    app.config = config
+    sock = bind(settings["host"], settings["port"], settings["backlog"])
+    return Master(app, sock, settings["workers"], settings["drain_timeout"]).run()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
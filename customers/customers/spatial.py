@@ -0,0 +1,118 @@
+import logging
+
+from sqlalchemy import and_, func, literal_column
+from sqlalchemy.sql import column, table
+from sqlalchemy.future import select
+
+from customers import model
+
+
+log = logging.getLogger(__name__)
+
+
+def sites_in(area):
+    """Sites whose buildings extent crosses the area."""
+    summary = model.SiteSummary
+    return select(summary.site_id).where(
+        summary.long_1 < area.top_corner.long,
+        summary.long_2 > area.bottom_corner.long,
+        summary.lat_1 < area.top_corner.lat,
+        summary.lat_2 > area.bottom_corner.lat,
+    )
+
+
+class BTreeBackend:
+    """Area search on the composite (long, lat) B-tree index.
+
+    Sites whose extent misses the area are pruned first, the buildings of
+    the others can be reached by the (site_id, long, lat) index. Without the
+    `site_summaries` table of the 0004 migration, sites aren't pruned.
+    """
+
+    name = "btree"
+
+    def __init__(self, prune_sites=True):
+        self.prune_sites = prune_sites
+
+    def area_filter(self, area):
+        clauses = [
+            model.Building.long > area.bottom_corner.long,
+            model.Building.long < area.top_corner.long,
+            model.Building.lat > area.bottom_corner.lat,
+            model.Building.lat < area.top_corner.lat,
+        ]
+        if self.prune_sites:
+            clauses.insert(0, model.Building.site_id.in_(sites_in(area)))
+        return and_(*clauses)
+
+
+class PostgisBackend(BTreeBackend):
+    """Area search on the GiST index of the generated `buildings.geom` column.
+
+    The bounding box operator is only used to pick candidates from the index,
+    the exact `Numeric` comparisons of the B-tree backend are kept as a recheck
+    so both backends return the same rows.
+    """
+
+    name = "postgis"
+    srid = 4326
+
+    def area_filter(self, area):
+        envelope = func.ST_MakeEnvelope(
+            float(area.bottom_corner.long),
+            float(area.bottom_corner.lat),
+            float(area.top_corner.long),
+            float(area.top_corner.lat),
+            self.srid,
+        )
+        return and_(
+            literal_column("buildings.geom").op("&&")(envelope),
+            super().area_filter(area),
+        )
+
+
+information_schema_columns = table(
+    "columns",
+    column("table_name"),
+    column("column_name"),
+    schema="information_schema",
+)
+
+information_schema_tables = table(
+    "tables",
+    column("table_name"),
+    schema="information_schema",
+)
+
+_backend = None
+
+
+def get_backend():
+    return _backend or BTreeBackend()
+
+
+async def setup(session_factory):
+    """Pick the spatial backend matching the database schema."""
+    global _backend
+    columns = information_schema_columns.c
+    geom = select(func.count()).where(
+        columns.table_name == model.Building.__tablename__,
+        columns.column_name == "geom",
+    )
+    tables = information_schema_tables.c
+    summaries = select(func.count()).where(
+        tables.table_name == model.SiteSummary.__tablename__
+    )
+    async with session_factory() as s:
+        has_geom = (await s.execute(geom)).scalar()
+        has_summaries = (await s.execute(summaries)).scalar()
+    if not has_summaries:
+        log.warning("no site_summaries table, area searches don't prune sites")
+    backend = PostgisBackend if has_geom else BTreeBackend
+    _backend = backend(prune_sites=bool(has_summaries))
+    log.info(f"spatial backend: {_backend.name}")
+    return _backend
+
+
+def is_setup():
+    return _backend is not None
@@ -0,0 +1,122 @@
+"""Incremental delivery of the large list queries, as NDJSON.
+
+A query selecting a single streamed root field (`buildings` or `sites`) is
+executed once per chunk of rows. The rows come from a server-side cursor
+opened by the first execution and kept by a `RowStream` in the context;
+each execution resolves the fields of its chunk only, with its own
+loaders, so neither the rows nor the response are ever held whole. The
+lines follow the incremental delivery format of `@stream`:
+
+    {"data": {"buildings": [...]}, "hasNext": true}
+    {"incremental": [{"items": [...], "path": ["buildings", 500]}], "hasNext": true}
+    {"hasNext": false}
+
+Other operations are answered by a single line.
+"""
+import json
+import logging
+
+from graphql import FieldNode, GraphQLError, OperationType, parse
+from graphql.utilities import get_operation_ast
+
+
+log = logging.getLogger(__name__)
+
+NDJSON = "application/x-ndjson"
+CHUNK_SIZE = 500
+STREAMED_FIELDS = {"buildings", "sites"}
+
+
+class RowStream:
+    """Rows of a statement read by chunks from a server-side cursor."""
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.session = None
+        self.partitions = None
+        self.done = False
+
+    async def next(self, session_factory, stmt):
+        """Next chunk of rows, the cursor is opened on the first call."""
+        if self.partitions is None:
+            self.session = session_factory()
+            result = await self.session.stream(
+                stmt.execution_options(yield_per=self.chunk_size)
+            )
+            self.partitions = result.scalars().partitions(self.chunk_size)
+        chunk = await anext(self.partitions, [])
+        self.done = len(chunk) < self.chunk_size
+        return chunk
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+def streamed_field(query, operation_name=None):
+    """Name of the field streamed by a query, None if it isn't streamable."""
+    try:
+        operation = get_operation_ast(parse(query), operation_name)
+    except GraphQLError:
+        return None
+    if operation is None or operation.operation != OperationType.QUERY:
+        return None
+    selections = operation.selection_set.selections
+    if len(selections) != 1 or not isinstance(selections[0], FieldNode):
+        return None
+    name = selections[0].name.value
+    return name if name in STREAMED_FIELDS else None
+
+
+def _line(payload):
+    return json.dumps(payload).encode() + b"\n"
+
+
+def _result(result, has_next=False):
+    payload = {"data": result.data}
+    if result.errors:
+        payload["errors"] = [error.formatted for error in result.errors]
+    return {**payload, "hasNext": has_next}
+
+
+async def execute_stream(
+    schema, query, variables=None, operation_name=None, context=None, chunk_size=None
+):
+    """NDJSON lines of a query, one per chunk of its streamed field."""
+    context = context or {}
+    if streamed_field(query, operation_name) is None:
+        result = await schema.execute(
+            query,
+            variable_values=variables,
+            context_value=context,
+            operation_name=operation_name,
+        )
+        yield _line(_result(result))
+        return
+
+    stream = RowStream(chunk_size or CHUNK_SIZE)
+    sent = 0
+    try:
+        while True:
+            result = await schema.execute(
+                query,
+                variable_values=variables,
+                context_value={**context, "stream": stream},
+                operation_name=operation_name,
+            )
+            if result.errors or not result.data:
+                yield _line(_result(result))
+                return
+            ((key, items),) = result.data.items()
+            if not sent:
+                yield _line(_result(result, not stream.done))
+            elif items or not stream.done:
+                incremental = [{"items": items, "path": [key, sent]}]
+                yield _line({"incremental": incremental, "hasNext": not stream.done})
+            else:
+                yield _line({"hasNext": False})
+            sent += len(items)
+            if stream.done:
+                return
+    finally:
+        await stream.close()
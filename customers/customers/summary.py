@@ -0,0 +1,178 @@
+"""Summaries of sites and customers, maintained by triggers.
+
+`site_summaries` keeps the number of buildings of each site and the extent
+of their positions, `customer_summaries` the number of sites of each
+customer. Statement level triggers update them from the transition tables
+of every write on `buildings` and `sites`, whatever issued it (ORM, COPY
+import, cascading deletes), so they are exact within the transaction.
+A missing row stands for no building or no site. Summaries of rows deleted
+by the same statement are left alone: the foreign key cascade drops them,
+and updating them first would break the foreign key check.
+
+Counts are updated incrementally. An extent can only grow incrementally:
+sites losing or moving buildings have theirs computed again, from the
+`(site_id, long, lat)` index of their buildings.
+"""
+from sqlalchemy import text
+
+
+FUNCTIONS = [
+    """
+    CREATE OR REPLACE FUNCTION site_summaries_refresh_extent(ids integer[])
+    RETURNS void AS $$
+        UPDATE site_summaries s SET (long_1, lat_1, long_2, lat_2) = (
+            SELECT min(b.long), min(b.lat), max(b.long), max(b.lat)
+            FROM buildings b WHERE b.site_id = s.site_id
+        )
+        WHERE s.site_id = ANY(ids)
+        AND EXISTS (SELECT 1 FROM sites p WHERE p.site_id = s.site_id)
+    $$ LANGUAGE sql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION buildings_inserted() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO site_summaries AS s
+            (site_id, buildings_count, long_1, lat_1, long_2, lat_2)
+        SELECT site_id, count(*), min(long), min(lat), max(long), max(lat)
+        FROM new_buildings GROUP BY site_id
+        ON CONFLICT (site_id) DO UPDATE SET
+            buildings_count = s.buildings_count + excluded.buildings_count,
+            long_1 = least(s.long_1, excluded.long_1),
+            lat_1 = least(s.lat_1, excluded.lat_1),
+            long_2 = greatest(s.long_2, excluded.long_2),
+            lat_2 = greatest(s.lat_2, excluded.lat_2);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION buildings_deleted() RETURNS trigger AS $$
+    BEGIN
+        UPDATE site_summaries s SET buildings_count = s.buildings_count - d.n
+        FROM (
+            SELECT site_id, count(*) AS n FROM old_buildings GROUP BY site_id
+        ) d
+        WHERE s.site_id = d.site_id AND EXISTS (
+            SELECT 1 FROM sites p WHERE p.site_id = s.site_id
+        );
+        PERFORM site_summaries_refresh_extent(
+            ARRAY(SELECT DISTINCT site_id FROM old_buildings)
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION buildings_updated() RETURNS trigger AS $$
+    DECLARE
+        old_ids integer[];
+        new_ids integer[];
+    BEGIN
+        -- buildings moved to another site or position
+        SELECT array_agg(o.site_id), array_agg(n.site_id) INTO old_ids, new_ids
+        FROM old_buildings o JOIN new_buildings n USING (building_id)
+        WHERE (o.site_id, o.long, o.lat) IS DISTINCT FROM (n.site_id, n.long, n.lat);
+        IF old_ids IS NULL THEN
+            RETURN NULL;
+        END IF;
+        UPDATE site_summaries s SET buildings_count = s.buildings_count - d.n
+        FROM (
+            SELECT old_id AS site_id, count(*) AS n
+            FROM unnest(old_ids, new_ids) AS m (old_id, new_id)
+            WHERE old_id <> new_id GROUP BY old_id
+        ) d
+        WHERE s.site_id = d.site_id AND EXISTS (
+            SELECT 1 FROM sites p WHERE p.site_id = s.site_id
+        );
+        INSERT INTO site_summaries AS s (site_id, buildings_count)
+        SELECT new_id, count(*)
+        FROM unnest(old_ids, new_ids) AS m (old_id, new_id)
+        WHERE old_id <> new_id GROUP BY new_id
+        ON CONFLICT (site_id) DO UPDATE SET
+            buildings_count = s.buildings_count + excluded.buildings_count;
+        PERFORM site_summaries_refresh_extent(old_ids || new_ids);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION sites_inserted() RETURNS trigger AS $$
+    BEGIN
+        INSERT INTO customer_summaries AS c (customer_id, sites_count)
+        SELECT customer_id, count(*) FROM new_sites GROUP BY customer_id
+        ON CONFLICT (customer_id) DO UPDATE SET
+            sites_count = c.sites_count + excluded.sites_count;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION sites_deleted() RETURNS trigger AS $$
+    BEGIN
+        UPDATE customer_summaries c SET sites_count = c.sites_count - d.n
+        FROM (
+            SELECT customer_id, count(*) AS n FROM old_sites GROUP BY customer_id
+        ) d
+        WHERE c.customer_id = d.customer_id AND EXISTS (
+            SELECT 1 FROM customers p WHERE p.customer_id = c.customer_id
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE OR REPLACE FUNCTION sites_updated() RETURNS trigger AS $$
+    BEGIN
+        UPDATE customer_summaries c SET sites_count = c.sites_count - d.n
+        FROM (
+            SELECT o.customer_id, count(*) AS n
+            FROM old_sites o JOIN new_sites n USING (site_id)
+            WHERE o.customer_id <> n.customer_id GROUP BY o.customer_id
+        ) d
+        WHERE c.customer_id = d.customer_id AND EXISTS (
+            SELECT 1 FROM customers p WHERE p.customer_id = c.customer_id
+        );
+        INSERT INTO customer_summaries AS c (customer_id, sites_count)
+        SELECT n.customer_id, count(*)
+        FROM old_sites o JOIN new_sites n USING (site_id)
+        WHERE o.customer_id <> n.customer_id GROUP BY n.customer_id
+        ON CONFLICT (customer_id) DO UPDATE SET
+            sites_count = c.sites_count + excluded.sites_count;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+]
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER {table}_{done}_summary AFTER {event} ON {table}
+    REFERENCING {transitions}
+    FOR EACH STATEMENT EXECUTE FUNCTION {table}_{done}()
+    """
+    for table in ("buildings", "sites")
+    for event, done, transitions in (
+        ("INSERT", "inserted", f"NEW TABLE AS new_{table}"),
+        ("DELETE", "deleted", f"OLD TABLE AS old_{table}"),
+        ("UPDATE", "updated", f"OLD TABLE AS old_{table} NEW TABLE AS new_{table}"),
+    )
+]
+
+BACKFILL = [
+    """
+    INSERT INTO site_summaries
+        (site_id, buildings_count, long_1, lat_1, long_2, lat_2)
+    SELECT site_id, count(*), min(long), min(lat), max(long), max(lat)
+    FROM buildings GROUP BY site_id
+    """,
+    """
+    INSERT INTO customer_summaries (customer_id, sites_count)
+    SELECT customer_id, count(*) FROM sites GROUP BY customer_id
+    """,
+]
+
+
+def install(con, backfill=False):
+    """Create the trigger functions and the triggers, on a sync connection."""
+    for stmt in FUNCTIONS + TRIGGERS + (BACKFILL if backfill else []):
+        con.execute(text(stmt))
@@ -0,0 +1,59 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+
+def has_postgis(con):
+    stmt = text("SELECT count(*) FROM pg_available_extensions WHERE name = 'postgis'")
+    return con.execute(stmt).scalar() > 0
+
+
+def upgrade(eng, _):
+    with eng.begin() as con:
+        print("create index buildings_long_lat_idx")
+        con.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS buildings_long_lat_idx "
+                "ON buildings (long, lat)"
+            )
+        )
+        if not has_postgis(con):
+            print("postgis is not available, area search will use the b-tree index")
+            return
+        print("create column buildings.geom and index buildings_geom_idx")
+        con.execute(text("CREATE EXTENSION IF NOT EXISTS postgis"))
+        con.execute(
+            text(
+                "ALTER TABLE buildings ADD COLUMN geom geometry(Point, 4326) "
+                "GENERATED ALWAYS AS (ST_SetSRID(ST_MakePoint(long, lat), 4326)) STORED"
+            )
+        )
+        con.execute(
+            text("CREATE INDEX buildings_geom_idx ON buildings USING GIST (geom)")
+        )
+
+
+def downgrade(eng, _):
+    with eng.begin() as con:
+        print("drop spatial indexes")
+        con.execute(text("DROP INDEX IF EXISTS buildings_geom_idx"))
+        con.execute(text("ALTER TABLE buildings DROP COLUMN IF EXISTS geom"))
+        con.execute(text("DROP INDEX IF EXISTS buildings_long_lat_idx"))
+
+
+if __name__ == "__main__":
+    import sys
+    from getpass import getpass
+    from os import environ
+
+    pwd = getpass("password: ")
+    if not (db_url := environ.get("POSTGRES_URL", False)):
+        print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"connect to {db_url}")
+    eng = create_engine(db_url, connect_args={"password": pwd}, poolclass=StaticPool)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--downgrade":
+        downgrade(eng, pwd)
+    else:
+        upgrade(eng, pwd)
@@ -0,0 +1,71 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+from customers import summary
+
+
+def upgrade(eng, _):
+    with eng.begin() as con:
+        print("create index buildings_site_id_long_lat_idx")
+        con.execute(
+            text(
+                "CREATE INDEX IF NOT EXISTS buildings_site_id_long_lat_idx "
+                "ON buildings (site_id, long, lat)"
+            )
+        )
+        print("create tables site_summaries and customer_summaries")
+        con.execute(
+            text(
+                "CREATE TABLE site_summaries ("
+                "site_id integer PRIMARY KEY "
+                "REFERENCES sites (site_id) ON DELETE CASCADE, "
+                "buildings_count integer NOT NULL DEFAULT 0, "
+                "long_1 numeric(11, 8), lat_1 numeric(11, 8), "
+                "long_2 numeric(11, 8), lat_2 numeric(11, 8))"
+            )
+        )
+        con.execute(
+            text(
+                "CREATE TABLE customer_summaries ("
+                "customer_id integer PRIMARY KEY "
+                "REFERENCES customers (customer_id) ON DELETE CASCADE, "
+                "sites_count integer NOT NULL DEFAULT 0)"
+            )
+        )
+        # no write can happen between the backfill and the triggers
+        con.execute(text("LOCK TABLE sites, buildings IN SHARE MODE"))
+        print("fill summaries and create their triggers")
+        summary.install(con, backfill=True)
+
+
+def downgrade(eng, _):
+    with eng.begin() as con:
+        print("drop summaries")
+        for table in ("buildings", "sites"):
+            for done in ("inserted", "deleted", "updated"):
+                con.execute(
+                    text(f"DROP TRIGGER IF EXISTS {table}_{done}_summary ON {table}")
+                )
+                con.execute(text(f"DROP FUNCTION IF EXISTS {table}_{done}()"))
+        con.execute(text("DROP FUNCTION IF EXISTS site_summaries_refresh_extent"))
+        con.execute(text("DROP TABLE IF EXISTS site_summaries, customer_summaries"))
+        con.execute(text("DROP INDEX IF EXISTS buildings_site_id_long_lat_idx"))
+
+
+if __name__ == "__main__":
+    import sys
+    from getpass import getpass
+    from os import environ
+
+    pwd = getpass("password: ")
+    if not (db_url := environ.get("POSTGRES_URL", False)):
+        print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"connect to {db_url}")
+    eng = create_engine(db_url, connect_args={"password": pwd}, poolclass=StaticPool)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--downgrade":
+        downgrade(eng, pwd)
+    else:
+        upgrade(eng, pwd)
@@ -0,0 +1,62 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import StaticPool
+
+
+# searched columns
+COLUMNS = (("customers", "name"), ("sites", "label"), ("buildings", "label"))
+
+
+def has_pg_trgm(con):
+    stmt = text("SELECT count(*) FROM pg_available_extensions WHERE name = 'pg_trgm'")
+    return con.execute(stmt).scalar() > 0
+
+
+def upgrade(eng, _):
+    with eng.begin() as con:
+        for table, column in COLUMNS:
+            print(f"create index {table}_{column}_lower_idx")
+            con.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column}_lower_idx "
+                    f"ON {table} (lower({column}) text_pattern_ops)"
+                )
+            )
+        if not has_pg_trgm(con):
+            print("pg_trgm is not available, substring searches will scan tables")
+            return
+        con.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        for table, column in COLUMNS:
+            print(f"create index {table}_{column}_trgm_idx")
+            con.execute(
+                text(
+                    f"CREATE INDEX IF NOT EXISTS {table}_{column}_trgm_idx "
+                    f"ON {table} USING GIN (lower({column}) gin_trgm_ops)"
+                )
+            )
+
+
+def downgrade(eng, _):
+    with eng.begin() as con:
+        print("drop search indexes")
+        for table, column in COLUMNS:
+            con.execute(text(f"DROP INDEX IF EXISTS {table}_{column}_trgm_idx"))
+            con.execute(text(f"DROP INDEX IF EXISTS {table}_{column}_lower_idx"))
+
+
+if __name__ == "__main__":
+    import sys
+    from getpass import getpass
+    from os import environ
+
+    pwd = getpass("password: ")
+    if not (db_url := environ.get("POSTGRES_URL", False)):
+        print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"connect to {db_url}")
+    eng = create_engine(db_url, connect_args={"password": pwd}, poolclass=StaticPool)
+
+    if len(sys.argv) > 1 and sys.argv[1] == "--downgrade":
+        downgrade(eng, pwd)
+    else:
+        upgrade(eng, pwd)
@@ -0,0 +1,135 @@
+import asyncio
+import os
+
+import pytest
+
+from sqlalchemy import create_engine, delete, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool, StaticPool
+
+from common.database.bootstrap import create_database, drop_database
+
+
+os.environ.setdefault(
+    "CUSTOMERS_APP_CONFIG", os.path.join(os.path.dirname(__file__), "..", "config.json")
+)
+
+
+def get_test_db_url():
+    if not (db_url := os.environ.get("POSTGRES_TEST_URL", False)):
+        raise RuntimeError(
+            "cannot perform db tests without a db connexion. set POSTGRES_TEST_URL env variable"
+        )
+    return db_url
+
+
+@pytest.fixture(scope="module")
+def db():
+    from customers.model import Base
+
+    eng = create_engine(get_test_db_url(), echo=True, poolclass=StaticPool)
+    create_database(eng)
+    Base.metadata.create_all(eng)
+    yield eng
+    Base.metadata.drop_all(eng)
+    drop_database(eng)
+
+
+@pytest.fixture(scope="session")
+def asyncpg_url():
+    """Url of the test database, through the asyncpg driver of the app."""
+    return str(make_url(get_test_db_url()).set(drivername="postgresql+asyncpg"))
+
+
+@pytest.fixture(scope="module")
+def db_service(db, asyncpg_url):
+    """DbService bound to the test database through asyncpg."""
+    from customers import datalayer, spatial
+
+    # every test runs its own event loop: don't keep connections between them
+    service = datalayer.start(
+        {"db_url": asyncpg_url, "db_engine": {"poolclass": NullPool}}
+    )
+    asyncio.run(spatial.setup(service.session))
+    yield service
+    asyncio.run(datalayer.stop())
+
+
+@pytest.fixture(scope="module")
+def delete_all(db):
+    """Delete every building, site and customer of the test database."""
+    from customers.model import Building, Customer, Site
+
+    def delete_all():
+        with Session(db) as s:
+            s.execute(delete(Building))
+            s.execute(delete(Site))
+            s.execute(delete(Customer))
+            s.commit()
+
+    return delete_all
+
+
+@pytest.fixture
+def clean(db_service, delete_all):
+    """Delete the customers, sites and buildings a test wrote, once it's done."""
+    yield
+    delete_all()
+
+
+@pytest.fixture
+def execute_result():
+    """Result of an operation run on the schema, given its context and variables."""
+    from customers.api import schema
+
+    def execute_result(query, context=None, **variables):
+        return asyncio.run(
+            schema.execute(query, variable_values=variables, context_value=context)
+        )
+
+    return execute_result
+
+
+@pytest.fixture
+def execute(execute_result):
+    """Data of an operation run on the schema, which must not fail."""
+
+    def execute(query, context=None, **variables):
+        result = execute_result(query, context, **variables)
+        assert result.errors is None
+        return result.data
+
+    return execute
+
+
+@pytest.fixture(autouse=True)
+def response_cache():
+    """Fresh response cache: tests change the database behind its back."""
+    from customers import cache
+
+    return cache.configure({})
+
+
+class QueryCounter:
+    def __init__(self, eng):
+        self.eng = eng
+        self.statements = []
+
+    def _count(self, conn, cursor, statement, *_):
+        self.statements.append(statement)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def __enter__(self):
+        event.listen(self.eng, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *_):
+        event.remove(self.eng, "before_cursor_execute", self._count)
+
+
+@pytest.fixture
+def count_queries(db_service):
+    return lambda: QueryCounter(db_service.eng.sync_engine)
@@ -0,0 +1,29 @@
+"""Hypothesis strategies of the geometry tests."""
+from decimal import Decimal
+
+from hypothesis import strategies as st
+
+from customers.geo import Area, Position
+
+
+def coordinates(places=8, limit=2):
+    return st.decimals(
+        min_value=-limit, max_value=limit, places=places, allow_nan=False
+    )
+
+
+def positions(places=8):
+    """Hypothesis strategy of positions."""
+    return st.builds(Position, coordinates(places), coordinates(places))
+
+
+@st.composite
+def areas(draw):
+    """Hypothesis strategy of areas, half of them small ones."""
+    long_1, long_2 = sorted((draw(coordinates()), draw(coordinates())))
+    lat_1, lat_2 = sorted((draw(coordinates()), draw(coordinates())))
+    # sites are small: mostly keep areas within a few grid cells
+    if draw(st.booleans()):
+        long_2 = min(long_2, long_1 + Decimal("0.02"))
+        lat_2 = min(lat_2, lat_1 + Decimal("0.02"))
+    return Area(Position(long_1, lat_1), Position(long_2, lat_2))
@@ -0,0 +1,177 @@
+import pytest
+
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+
+from customers.access import get_access
+from customers.model import Building, Customer, CustomerUserRole, Role, Site, User
+
+
+READER = {"aud": "urn:user", "email": "reader@example.com"}
+WRITER = {"aud": "urn:user", "email": "writer@example.com"}
+ADMIN = {"aud": "urn:admin", "email": "admin@example.com"}
+
+
+@pytest.fixture
+def tree(db, db_service, clean):
+    """Customers a, b and c with a site and a building each.
+
+    The reader reads a and administrates b, the writer reads a and writes b.
+    """
+    with Session(db) as s:
+        customers = {name: Customer(name=name) for name in "abc"}
+        for customer in customers.values():
+            site = Site(owner=customer, label=f"{customer.name}0")
+            site.buildings.append(Building(label=f"{customer.name}0_0"))
+            s.add(site)
+        reader, writer = User(email=READER["email"]), User(email=WRITER["email"])
+        s.add_all(
+            [
+                CustomerUserRole(
+                    user=reader, customer=customers["a"], role=Role.READER
+                ),
+                CustomerUserRole(user=reader, customer=customers["b"], role=Role.ADMIN),
+                CustomerUserRole(
+                    user=writer, customer=customers["a"], role=Role.READER
+                ),
+                CustomerUserRole(
+                    user=writer, customer=customers["b"], role=Role.WRITTER
+                ),
+            ]
+        )
+        s.commit()
+        ids = {b.label: b.id for b in s.execute(select(Building)).scalars()}
+        ids.update({site.label: site.id for site in s.execute(select(Site)).scalars()})
+        ids.update({c.name: c.id for c in customers.values()})
+    yield ids
+    with Session(db) as s:
+        for entity in (CustomerUserRole, User):
+            s.execute(delete(entity))
+        s.commit()
+
+
+def context(claims):
+    return {"claims": claims}
+
+
+def test_get_access():
+    assert get_access(None) is None
+    assert get_access(ADMIN) is None
+    assert get_access(READER).email == READER["email"]
+
+
+LISTS = """
+{
+  customers { name }
+  sites { label }
+  buildings { label site { owner { name } } }
+  buildingsConnection { edges { node { label } } }
+  stats { buildingCount customerCount }
+  search(term: "0") { text }
+}
+"""
+
+
+def test_lists_are_filtered(tree, count_queries, execute):
+    with count_queries() as unrestricted:
+        result = execute(LISTS)
+    assert len(result["customers"]) == 3
+    assert execute(LISTS, context(ADMIN)) == result
+
+    with count_queries() as restricted:
+        result = execute(LISTS, context(READER))
+    assert result["customers"] == [{"name": "a"}, {"name": "b"}]
+    assert result["sites"] == [{"label": "a0"}, {"label": "b0"}]
+    assert [b["site"]["owner"]["name"] for b in result["buildings"]] == ["a", "b"]
+    assert len(result["buildingsConnection"]["edges"]) == 2
+    assert result["stats"] == {"buildingCount": 2, "customerCount": 2}
+    assert {hit["text"] for hit in result["search"]} == {"a0", "a0_0", "b0", "b0_0"}
+    # filtered by the statements themselves
+    assert len(restricted) == len(unrestricted)
+    assert all("users_customers_rel" in s for s in restricted.statements[:6])
+
+    unknown = {"aud": "urn:user", "email": "nobody@example.com"}
+    assert execute("{ customers { name } buildings { label } }", context(unknown)) == {
+        "customers": [],
+        "buildings": [],
+    }
+
+
+DELETE = "mutation ($id: Int!) { deleteBuilding(id: $id) }"
+
+
+def test_writes_need_a_writer_role(tree, execute, execute_result):
+    # read only, or not at all
+    for name in ("a0_0", "c0_0"):
+        result = execute_result(DELETE, context(WRITER), id=tree[name])
+        assert result.errors[0].message == "building does not exists."
+    result = execute_result(
+        'mutation ($site: Int!) { addNewBuildingForSite(label: "new", siteId: $site) '
+        "{ id } }",
+        context(WRITER),
+        site=tree["a0"],
+    )
+    assert result.errors[0].message == "site does not exists."
+    result = execute_result(
+        "mutation ($c: Int!) { addNewBuildingForNewSite("
+        'label: "new", site: {label: "new"}, customerId: $c) { id } }',
+        context(WRITER),
+        c=tree["c"],
+    )
+    assert result.errors[0].message == "customer does not exists."
+    result = execute_result(
+        "mutation { addNewBuildingForNewCustomer("
+        'label: "new", site: {label: "new"}, customer: {name: "d"}) { id } }',
+        context(WRITER),
+    )
+    assert result.errors[0].message == "not allowed to create customers."
+    for name in ("a", "d"):
+        result = execute_result(
+            "mutation ($name: String!) { upsertCustomerTree(customer: "
+            '{name: $name, sites: [{label: "new"}]}) { customer { id } } }',
+            context(WRITER),
+            name=name,
+        )
+        assert result.errors[0].message == "customer does not exists."
+    imported = execute(
+        "mutation ($a: Int!, $b: Int!) { importBuildings(buildings: ["
+        '{label: "x", siteId: $a}, {label: "y", siteId: $b}]) '
+        "{ imported errors { index message } } }",
+        context(WRITER),
+        a=tree["a0"],
+        b=tree["b0"],
+    )["importBuildings"]
+    assert imported == {
+        "imported": 1,
+        "errors": [{"index": 0, "message": "site does not exists."}],
+    }
+
+    execute(DELETE, context(WRITER), id=tree["b0_0"])
+    tree_data = execute(
+        "mutation { upsertCustomerTree(customer: "
+        '{name: "b", sites: [{label: "b1"}]}) { customer { id } } }',
+        context(WRITER),
+    )
+    assert tree_data["upsertCustomerTree"]["customer"]["id"] == tree["b"]
+
+
+def test_customer_ids_read_once(tree, count_queries, execute, execute_result):
+    with count_queries() as queries:
+        result = execute_result(
+            "mutation ($a: Int!, $b: Int!) { "
+            "first: deleteBuilding(id: $a) second: deleteBuilding(id: $b) }",
+            context(READER),
+            a=tree["a0_0"],
+            b=tree["b0_0"],
+        )
+    # the reader writes b, not a
+    assert [(e.path, e.message) for e in result.errors] == [
+        (["first"], "building does not exists.")
+    ]
+    roles = [s for s in queries.statements if "FROM users_customers_rel JOIN" in s]
+    assert len(roles) == 1
+
+    # b was left empty: its roles are deleted with it
+    assert execute("{ customers { name } }", context(READER)) == {
+        "customers": [{"name": "a"}]
+    }
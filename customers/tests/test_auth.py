@@ -0,0 +1,192 @@
+import asyncio
+from datetime import datetime, timedelta
+import json
+from types import SimpleNamespace
+
+import jwt
+import pytest
+
+from customers import auth, cache
+from customers.auth import (
+    AUTH_DEFAULTS,
+    AuthenticationError,
+    Authenticator,
+    auth_config,
+)
+
+
+FIRST = "first secret\n"
+SECOND = "second secret, longer\n"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def token(secret, minutes=1, aud="urn:user", email="user@example.com"):
+    payload = {
+        "exp": (datetime.utcnow() + timedelta(minutes=minutes)).timestamp(),
+        "nbf": (datetime.utcnow() - timedelta(minutes=1)).timestamp(),
+        "aud": aud,
+        "email": email,
+    }
+    return jwt.encode(payload, secret, algorithm="HS256")
+
+
+@pytest.fixture
+def secret_path(tmp_path):
+    path = tmp_path / "secret"
+    # the auth server signs with the first line, newline included
+    path.write_text(FIRST)
+    return path
+
+
+def authenticator(secret_path, clock=None, **config):
+    settings = auth_config({"secret_path": str(secret_path), **config})
+    return Authenticator(settings, clock=clock or Clock())
+
+
+def test_auth_config(secret_path, monkeypatch):
+    monkeypatch.delenv(auth.SECRET_PATH_ENV, raising=False)
+    with pytest.raises(ValueError, match="auth needs a secret_path"):
+        auth_config({})
+    monkeypatch.setenv(auth.SECRET_PATH_ENV, str(secret_path))
+    assert auth_config({}) == {**AUTH_DEFAULTS, "secret_path": str(secret_path)}
+    with pytest.raises(ValueError, match="unknown auth settings"):
+        auth_config({"secret": "s"})
+    with pytest.raises(ValueError, match="unsupported auth algorithm"):
+        auth_config({"algorithm": "none"})
+    with pytest.raises(ValueError, match="claims_ttl should be a number of at least 0"):
+        auth_config({"claims_ttl": -1})
+    with pytest.raises(ValueError, match="claims_cache_size should be an int of at"):
+        auth_config({"claims_cache_size": 1.5})
+
+
+def test_verify(secret_path):
+    verifier = authenticator(secret_path)
+    claims = verifier.verify(f"Bearer {token(FIRST)}")
+    assert claims["email"] == "user@example.com"
+    assert verifier.verify(f"bearer {token(FIRST, aud='urn:admin')}")
+
+    for authorization in (None, "", "Basic abc", "Bearer "):
+        with pytest.raises(AuthenticationError, match="bearer token required"):
+            verifier.verify(authorization)
+    for bad in (
+        token("other secret\n"),
+        token(FIRST, minutes=-2),
+        token(FIRST, aud="urn:other"),
+        "not.a.token",
+    ):
+        with pytest.raises(AuthenticationError, match="invalid token"):
+            verifier.verify(f"Bearer {bad}")
+    assert len(verifier.claims) == 2
+
+
+def test_claims_cache(secret_path, monkeypatch):
+    clock = Clock()
+    verifier = authenticator(secret_path, clock, claims_cache_size=2, claims_ttl=10)
+    decoded = []
+    decode = verifier._decode
+    monkeypatch.setattr(verifier, "_decode", lambda t: decoded.append(t) or decode(t))
+
+    first, second, third = (token(FIRST, email=f"{i}@a.b") for i in "123")
+    verifier.verify(f"Bearer {first}")
+    verifier.verify(f"Bearer {first}")
+    assert decoded == [first]
+    verifier.verify(f"Bearer {second}")
+    verifier.verify(f"Bearer {first}")
+    # least recently used is evicted
+    verifier.verify(f"Bearer {third}")
+    verifier.verify(f"Bearer {first}")
+    assert decoded == [first, second, third]
+    verifier.verify(f"Bearer {second}")
+    assert decoded == [first, second, third, second]
+
+    clock.now = 10
+    verifier.verify(f"Bearer {second}")
+    assert decoded[-1] == second and len(decoded) == 5
+
+    # cached no longer than the token is valid
+    verifier = authenticator(secret_path, clock, claims_ttl=60)
+    verifier.verify(f"Bearer {token(FIRST, minutes=0.5)}")
+    ((_, end),) = verifier.claims.values()
+    assert clock.now + 29 < end <= clock.now + 30
+
+
+def test_key_rotation(secret_path):
+    clock = Clock()
+    verifier = authenticator(secret_path, clock, key_check_interval=5)
+    old = token(FIRST)
+    verifier.verify(f"Bearer {old}")
+
+    secret_path.write_text(SECOND)
+    # a token of the new key is checked against the new key right away
+    assert verifier.verify(f"Bearer {token(SECOND)}")
+    assert verifier.key.key == SECOND
+    # and claims verified with the old one are dropped
+    with pytest.raises(AuthenticationError, match="invalid token"):
+        verifier.verify(f"Bearer {old}")
+
+
+def test_caller_identity():
+    def context(claims=None, authorization=None):
+        headers = {"authorization": authorization} if authorization else {}
+        return {"claims": claims, "request": SimpleNamespace(headers=headers)}
+
+    claims = {"aud": "urn:user", "email": "user@example.com"}
+    assert cache.caller_identity(context(claims, "Bearer a")) == cache.caller_identity(
+        context(dict(claims, exp=1), "Bearer b")
+    )
+    assert cache.caller_identity(context(claims)) != cache.caller_identity(
+        context(dict(claims, aud="urn:admin"))
+    )
+    assert cache.caller_identity(context()) is None
+    assert cache.caller_identity(context(authorization="Bearer a"))
+
+
+def test_app_authentication(db_service, secret_path):
+    from customers.app import app
+
+    async def post(authorization=None, path="/graphql"):
+        headers = [(b"content-type", b"application/json")]
+        if authorization:
+            headers.append((b"authorization", authorization.encode()))
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": path,
+            "query_string": b"",
+            "headers": headers,
+        }
+        body = json.dumps({"query": "{ customers { name } }"}).encode()
+        messages = [{"type": "http.request", "body": body}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent[0]["status"], json.loads(sent[1]["body"])
+
+    auth.configure({"secret_path": str(secret_path)})
+    try:
+        status, body = asyncio.run(post())
+        assert status == 401
+        assert body == {"errors": [{"message": "bearer token required."}]}
+        status, _ = asyncio.run(post(f"Bearer {token('other')}"))
+        assert status == 401
+        status, body = asyncio.run(post(f"Bearer {token(FIRST)}"))
+        assert status == 200
+        assert body == {"data": {"customers": []}}
+        # pool metrics aren't public either
+        assert asyncio.run(post(path="/metrics"))[0] == 401
+    finally:
+        auth.configure(None)
+    assert asyncio.run(post())[0] == 200
@@ -0,0 +1,210 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy.orm import Session
+
+from customers import cache
+from customers.cache import MemoryCache, RedisCache
+from customers.model import Customer, Site, Building
+
+
+class FakeRedis:
+    """The part of the redis.asyncio client the cache uses, in a dict."""
+
+    def __init__(self):
+        self.data = {}
+        self.expires = {}
+        self.round_trips = 0
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value.encode()
+        self.expires[key] = ex
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Commands queued until `execute`, counted as one round trip."""
+
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        pass
+
+    def incr(self, key):
+        self.commands.append(key)
+
+    async def execute(self):
+        self.redis.round_trips += 1
+        data = self.redis.data
+        for key in self.commands:
+            data[key] = str(int(data.get(key, 0)) + 1).encode()
+        self.commands = []
+
+
+class Clock:
+    now = 0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.mark.parametrize(
+    "backend", [lambda: MemoryCache(), lambda: RedisCache(FakeRedis(), ttl=10)]
+)
+def test_invalidation(backend):
+    async def scenario(backend):
+        versions = await backend.versions(["Building", "Site"])
+        await backend.set("key", {"buildings": []}, versions)
+        assert await backend.get("key") == {"buildings": []}
+        await backend.invalidate(["Customer"])
+        assert await backend.get("key") == {"buildings": []}
+        await backend.invalidate(["Customer", "Site"])
+        assert await backend.get("key") is None
+
+        # written after a concurrent invalidation: never served
+        versions = await backend.versions(["Building"])
+        await backend.invalidate(["Building"])
+        await backend.set("key", {"buildings": []}, versions)
+        assert await backend.get("key") is None
+
+    asyncio.run(scenario(backend()))
+
+
+def test_redis_invalidation_round_trip():
+    redis = FakeRedis()
+    asyncio.run(RedisCache(redis).invalidate(["Building", "Site", "Customer"]))
+    assert redis.round_trips == 1
+
+
+def test_memory_lru_and_ttl():
+    clock = Clock()
+    backend = MemoryCache(max_size=2, ttl=10, clock=clock)
+
+    async def scenario():
+        await backend.set("a", 1, {})
+        await backend.set("b", 2, {})
+        assert await backend.get("a") == 1
+        await backend.set("c", 3, {})
+        assert await backend.get("b") is None
+        assert await backend.get("a") == 1
+        clock.now = 11
+        assert await backend.get("a") is None
+        assert await backend.get("c") is None
+        assert not backend.entries
+
+    asyncio.run(scenario())
+
+
+def test_key():
+    from graphql import parse
+
+    key = cache.make_key(parse("{ sites { id } }"), None, {"a": 1}, None)
+    assert key == cache.make_key(parse("{sites{\n  id}}"), None, {"a": 1}, None)
+    assert key != cache.make_key(parse("{ sites { id } }"), None, {"a": 2}, None)
+    assert key != cache.make_key(parse("{ sites { id } }"), None, {"a": 1}, "me")
+
+
+@pytest.fixture
+def site(db, db_service, clean):
+    with Session(db) as s:
+        site = Site(owner=Customer(name="cached"), label="site")
+        site.buildings.append(Building(label="building"))
+        s.add(site)
+        s.commit()
+        site_id = site.id
+    return site_id
+
+
+def caller(token):
+    return {"request": SimpleNamespace(headers={"authorization": f"Bearer {token}"})}
+
+
+ADD_BUILDING = """
+mutation ($site: Int!) { addNewBuildingForSite(label: "new", siteId: $site) { id } }
+"""
+
+
+def test_cached_until_mutation(site, count_queries, execute):
+    query = "{ sites { label buildings { label } } }"
+    with count_queries() as queries:
+        assert execute(query)["sites"][0]["buildings"] == [{"label": "building"}]
+        assert len(queries) == 2
+        assert execute(query)["sites"][0]["buildings"] == [{"label": "building"}]
+        assert len(queries) == 2
+        # another caller has its own entry
+        execute(query, caller("a"))
+        assert len(queries) == 4
+        execute(query, caller("a"))
+        assert len(queries) == 4
+
+    execute(ADD_BUILDING, site=site)
+    buildings = execute(query)["sites"][0]["buildings"]
+    assert [b["label"] for b in buildings] == ["building", "new"]
+
+
+def test_unrelated_write_keeps_entry(site, count_queries, execute):
+    execute("{ customers { name } }")
+    execute(ADD_BUILDING, site=site)
+    with count_queries() as queries:
+        assert execute("{ customers { name } }") == {"customers": [{"name": "cached"}]}
+    assert len(queries) == 0
+
+
+def test_cascading_delete_invalidates(site, execute):
+    query = "{ customers { name } }"
+    execute(query)
+    buildings = execute("{ buildings { id } }")["buildings"]
+    execute(
+        "mutation ($ids: [Int!]!) { deleteBuildings(ids: $ids) { buildings } }",
+        ids=[buildings[0]["id"]],
+    )
+    # the last building of the site: site and customer are deleted too
+    assert execute(query) == {"customers": []}
+    assert execute("{ buildings { id } }") == {"buildings": []}
+
+
+def test_tags_are_types(site, execute):
+    execute(
+        "mutation ($site: Int!) { importBuildings(buildings: ["
+        '{label: "x", siteId: $site}, {label: "y", siteId: $site}]) { imported } }',
+        site=site,
+    )
+    execute("{ customers { name } }")
+    buildings = [b["id"] for b in execute("{ buildings { id } }")["buildings"]]
+    execute(
+        "mutation ($ids: [Int!]!) { deleteBuildings(ids: $ids) { buildings } }",
+        ids=buildings,
+    )
+    # however many rows were written
+    assert cache.get_cache().tag_versions == {"Building": 2, "Site": 2, "Customer": 1}
+
+
+def test_mutations_are_not_cached(site, execute):
+    first = execute(ADD_BUILDING, site=site)["addNewBuildingForSite"]["id"]
+    second = execute(ADD_BUILDING, site=site)["addNewBuildingForSite"]["id"]
+    assert first != second
+
+
+def test_no_cache(site, count_queries, execute):
+    from customers import cache
+
+    cache.configure({"backend": "none"})
+    with count_queries() as queries:
+        execute("{ customers { name } }")
+        execute("{ customers { name } }")
+    assert len(queries) == 2
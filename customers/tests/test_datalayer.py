@@ -0,0 +1,278 @@
+import asyncio
+import json
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from sqlalchemy import text
+
+from customers.datalayer import (
+    DbService,
+    POOL_DEFAULTS,
+    ROUTING_DEFAULTS,
+    pool_config,
+    routing_config,
+)
+
+
+def test_pool_config():
+    assert pool_config({}) == POOL_DEFAULTS
+    assert pool_config({"pool_size": 2, "pool_timeout": 0.5})["pool_size"] == 2
+    with pytest.raises(ValueError, match="unknown db_pool settings"):
+        pool_config({"size": 2})
+    with pytest.raises(ValueError, match="pool_size should be an int of at least 1"):
+        pool_config({"pool_size": 0})
+    with pytest.raises(ValueError, match="pool_size should be an int"):
+        pool_config({"pool_size": "2"})
+    with pytest.raises(ValueError, match="pool_recycle should be an int"):
+        pool_config({"pool_recycle": True})
+    with pytest.raises(ValueError, match="pool_pre_ping should be a bool"):
+        pool_config({"pool_pre_ping": 1})
+    with pytest.raises(ValueError, match="pool_timeout should be a number"):
+        pool_config({"pool_timeout": None})
+
+
+def test_pool_metrics(db, asyncpg_url):
+    service = DbService(
+        {"db_url": asyncpg_url, "db_pool": {"pool_size": 1, "max_overflow": 1}}
+    )
+
+    async def query(duration):
+        async with service.session() as s:
+            await s.execute(text("SELECT pg_sleep(:duration)"), {"duration": duration})
+
+    async def scenario():
+        await query(0)
+        await asyncio.gather(query(0.1), query(0.1))
+        metrics = service.metrics()
+        await service.dispose()
+        return metrics
+
+    metrics = asyncio.run(scenario())
+    assert metrics["size"] == 1
+    assert metrics["checked_out"] == 0
+    assert metrics["checkouts"] == 3
+    assert metrics["overflows"] == 1
+    assert metrics["timeouts"] == 0
+    assert metrics["wait_seconds_buckets"][5] == 3
+    assert 0 < metrics["wait_seconds_max"] <= metrics["wait_seconds_total"]
+
+
+def test_no_metrics_without_metered_pool(db, asyncpg_url):
+    from sqlalchemy.pool import NullPool
+
+    service = DbService({"db_url": asyncpg_url, "db_engine": {"poolclass": NullPool}})
+    assert service.metrics() == {}
+
+
+def test_app_lifespan(db, tmp_path, monkeypatch, asyncpg_url):
+    from customers import datalayer
+    from customers.app import app
+
+    config = tmp_path / "config.json"
+    logging_config = {
+        "version": 1,
+        "disable_existing_loggers": False,
+        "loggers": {"customers.lifespan_test": {"level": "DEBUG"}},
+    }
+    config.write_text(
+        json.dumps(
+            {
+                "db_url": asyncpg_url,
+                "db_pool": {"pool_size": 2},
+                "logging": logging_config,
+            }
+        )
+    )
+    monkeypatch.setenv("CUSTOMERS_APP_CONFIG", str(config))
+
+    async def call(scope, messages):
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await app(scope, receive, send)
+        return sent
+
+    def http(method, path, body=b""):
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": path,
+            "query_string": b"",
+            "headers": [(b"content-type", b"application/json")],
+        }
+        return call(scope, [{"type": "http.request", "body": body}])
+
+    async def scenario():
+        # no pool before startup, nothing to export
+        response = await http("GET", "/metrics")
+        assert response[0]["status"] == 200
+        assert response[1]["body"] == b""
+
+        events, sent = asyncio.Queue(), asyncio.Queue()
+        lifespan = asyncio.create_task(app({"type": "lifespan"}, events.get, sent.put))
+        await events.put({"type": "lifespan.startup"})
+        assert await sent.get() == {"type": "lifespan.startup.complete"}
+        assert datalayer.get_db_service().metrics()["size"] == 2
+        # configured from the app config, uvicorn doesn't
+        assert logging.getLogger("customers.lifespan_test").level == logging.DEBUG
+
+        body = json.dumps({"query": "{ customers { name } }"}).encode()
+        response = await http("POST", "/graphql", body)
+        assert json.loads(response[1]["body"]) == {"data": {"customers": []}}
+
+        response = await http("GET", "/metrics")
+        metrics = response[1]["body"].decode()
+
+        await events.put({"type": "lifespan.shutdown"})
+        assert await sent.get() == {"type": "lifespan.shutdown.complete"}
+        await lifespan
+        return metrics
+
+    metrics = asyncio.run(scenario())
+    assert "db_pool_size 2\n" in metrics
+    assert "db_pool_checked_out 0\n" in metrics
+    assert 'db_pool_wait_seconds_bucket{le="+Inf"} ' in metrics
+    with pytest.raises(RuntimeError, match="db service is not started."):
+        datalayer.get_db_service()
+
+
+def test_routing_config():
+    assert routing_config({}) == ROUTING_DEFAULTS
+    assert routing_config({"read_your_writes": 2.5})["read_your_writes"] == 2.5
+    with pytest.raises(ValueError, match="unknown db_routing settings"):
+        routing_config({"window": 2})
+    with pytest.raises(ValueError, match="balance should be one of"):
+        routing_config({"balance": "random"})
+    assert routing_config({"read_your_writes": 0})["read_your_writes"] == 0
+    with pytest.raises(ValueError, match="read_your_writes should be a number of at"):
+        routing_config({"read_your_writes": -1})
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def bound(factory):
+    return factory.kw["bind"]
+
+
+def test_reader_routing():
+    url = "postgresql+asyncpg://localhost/customers"
+    clock = Clock()
+    service = DbService(
+        {
+            "db_url": url,
+            "db_replicas": [url, url],
+            "db_routing": {"read_your_writes": 5},
+        },
+        clock=clock,
+    )
+    first, second = (replica.eng for replica in service.replicas)
+    assert [bound(service.reader()) for _ in range(3)] == [first, second, first]
+    assert bound(service.session) is service.eng
+
+    service.wrote("a")
+    assert bound(service.reader("a")) is service.eng
+    assert bound(service.reader("b")) is second
+    clock.now = 5
+    assert bound(service.reader("a")) is first
+    assert service.writes == {"a": 5}
+    service.wrote("b")
+    assert service.writes == {"b": 10}
+    # anonymous callers all share None: their writes aren't recorded
+    service.wrote(None)
+    assert service.writes == {"b": 10}
+    assert bound(service.reader()) is second
+
+    # without replicas everything goes to the primary
+    service = DbService({"db_url": url})
+    assert bound(service.reader()) is service.eng
+    service.wrote("a")
+    assert service.writes == {}
+
+
+def test_least_connections():
+    url = "postgresql+asyncpg://localhost/customers"
+    service = DbService(
+        {
+            "db_url": url,
+            "db_replicas": [url, url],
+            "db_routing": {"balance": "least_connections"},
+        }
+    )
+    first, second = service.replicas
+    assert bound(service.reader()) is first.eng
+    first.in_use = 2
+    second.in_use = 1
+    assert bound(service.reader()) is second.eng
+    assert bound(service.reader()) is second.eng
+
+
+def test_schema_routing(db, asyncpg_url, execute):
+    from sqlalchemy import event
+    from sqlalchemy.pool import NullPool
+
+    from customers import datalayer
+
+    service = datalayer.start(
+        {
+            "db_url": asyncpg_url,
+            "db_replicas": [asyncpg_url],
+            "db_engine": {"poolclass": NullPool},
+            "db_routing": {"read_your_writes": 60},
+        }
+    )
+    replica = service.replicas[0]
+    statements = []
+
+    def counter(name):
+        def count(*_):
+            statements.append(name)
+
+        return count
+
+    event.listen(service.eng.sync_engine, "before_cursor_execute", counter("primary"))
+    event.listen(replica.eng.sync_engine, "before_cursor_execute", counter("replica"))
+
+    def caller(token):
+        headers = {"authorization": f"Bearer {token}"}
+        return {"request": SimpleNamespace(headers=headers)}
+
+    query = "{ customers { name } sites { owner { name } } }"
+    try:
+        execute(query, caller("a"))
+        assert set(statements) == {"replica"}
+        assert replica.in_use == 0
+
+        statements.clear()
+        execute(
+            "mutation { upsertCustomerTree(customer: "
+            '{name: "routed", sites: [{label: "site"}]}) { customer { id } } }',
+            caller("a"),
+        )
+        assert set(statements) == {"primary"}
+
+        # the writer reads its writes, others keep reading replicas
+        statements.clear()
+        data = execute(query, caller("a"))
+        assert data == {
+            "customers": [{"name": "routed"}],
+            "sites": [{"owner": {"name": "routed"}}],
+        }
+        assert statements == ["primary"] * 3
+        statements.clear()
+        execute(query, caller("b"))
+        assert set(statements) == {"replica"}
+    finally:
+        asyncio.run(datalayer.stop())
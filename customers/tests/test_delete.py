@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from customers import mutations
+from customers.model import Customer, Site, Building
+
+
+@pytest.fixture
+def tree(db, db_service, clean):
+    """Two customers: a with sites a0 (2 buildings) and a1 (1), b with b0 (1)."""
+    with Session(db) as s:
+        a, b = Customer(name="a"), Customer(name="b")
+        for customer, counts in ((a, (2, 1)), (b, (1,))):
+            for i, count in enumerate(counts):
+                site = Site(owner=customer, label=f"{customer.name}{i}")
+                for j in range(count):
+                    site.buildings.append(Building(label=f"{site.label}_{j}"))
+                s.add(site)
+        s.commit()
+        ids = {b.label: b.id for b in s.execute(select(Building)).scalars()}
+        ids.update({site.label: site.id for site in s.execute(select(Site)).scalars()})
+        ids.update({c.name: c.id for c in (a, b)})
+    return ids
+
+
+def remaining(db):
+    with Session(db) as s:
+        return (
+            sorted(s.execute(select(Building.label)).scalars()),
+            sorted(s.execute(select(Site.label)).scalars()),
+            sorted(s.execute(select(Customer.name)).scalars()),
+        )
+
+
+def run(delete, id, db_service):
+    async def _run():
+        async with db_service.session() as s:
+            counts = await delete(s, id)
+            await s.commit()
+            return counts
+
+    return asyncio.run(_run())
+
+
+def test_delete_building_keeps_site(db, db_service, tree, count_queries):
+    with count_queries() as queries:
+        counts = run(mutations.delete_building, tree["a0_0"], db_service)
+    assert len(queries) == 1
+    assert counts == (1, 0, 0)
+    assert remaining(db) == (["a0_1", "a1_0", "b0_0"], ["a0", "a1", "b0"], ["a", "b"])
+
+
+def test_delete_last_building_cascades(db, db_service, tree):
+    assert run(mutations.delete_building, tree["a1_0"], db_service) == (1, 1, 0)
+    assert remaining(db) == (["a0_0", "a0_1", "b0_0"], ["a0", "b0"], ["a", "b"])
+    assert run(mutations.delete_building, tree["b0_0"], db_service) == (1, 1, 1)
+    assert remaining(db) == (["a0_0", "a0_1"], ["a0"], ["a"])
+
+
+def test_delete_site_and_customer(db, db_service, tree):
+    assert run(mutations.delete_site, tree["a0"], db_service) == (2, 1, 0)
+    assert remaining(db) == (["a1_0", "b0_0"], ["a1", "b0"], ["a", "b"])
+    assert run(mutations.delete_customer, tree["a"], db_service) == (1, 1, 1)
+    assert remaining(db) == (["b0_0"], ["b0"], ["b"])
+    with pytest.raises(RuntimeError, match="site does not exists."):
+        run(mutations.delete_site, tree["a0"], db_service)
+    with pytest.raises(RuntimeError, match="customer does not exists."):
+        run(mutations.delete_customer, tree["a"], db_service)
+
+
+def test_delete_buildings_mutation(db, tree, execute_result):
+    query = """
+    mutation ($ids: [Int!]!) {
+      deleteBuildings(ids: $ids) { buildings sites customers }
+    }
+    """
+    result = execute_result(query, ids=[tree["a0_0"], tree["a0_1"], tree["b0_0"]])
+    assert result.errors is None
+    assert result.data["deleteBuildings"] == {
+        "buildings": 3,
+        "sites": 2,
+        "customers": 1,
+    }
+    assert remaining(db) == (["a1_0"], ["a1"], ["a"])
+
+    result = execute_result(query, ids=[tree["a1_0"], -1])
+    assert result.errors[0].message == "building does not exists."
+    assert remaining(db) == (["a1_0"], ["a1"], ["a"])
@@ -0,0 +1,141 @@
+import asyncio
+import json
+from urllib.parse import urlencode
+
+import pytest
+
+from customers import documents
+from customers.documents import (
+    DocumentCache,
+    PersistedQueryError,
+    query_hash,
+    resolve_persisted_query,
+)
+
+
+QUERY = "{ customers { name } }"
+
+
+def persisted(key, query=None, version=1):
+    data = {
+        "extensions": {"persistedQuery": {"version": version, "sha256Hash": key}},
+        "variables": {},
+    }
+    if query:
+        data["query"] = query
+    return data
+
+
+@pytest.fixture(autouse=True)
+def document_cache(monkeypatch):
+    cache = DocumentCache(max_size=2)
+    monkeypatch.setattr(documents, "documents", cache)
+    return cache
+
+
+def test_lru():
+    cache = DocumentCache(max_size=2)
+    cache.add("a", "query a")
+    cache.add("b", "query b")
+    assert cache.query("a") == "query a"
+    cache.add("c", "query c")
+    assert cache.query("b") is None
+    assert cache.query("a") == "query a"
+    assert len(cache) == 2
+
+
+def test_resolve_persisted_query(document_cache):
+    key = query_hash(QUERY)
+    with pytest.raises(PersistedQueryError, match="PersistedQueryNotFound"):
+        resolve_persisted_query(persisted(key))
+    with pytest.raises(PersistedQueryError, match="does not match"):
+        resolve_persisted_query(persisted(key, "{ sites { id } }"))
+    with pytest.raises(PersistedQueryError) as e:
+        resolve_persisted_query(persisted(key, version=2))
+    assert e.value.code == "PERSISTED_QUERY_NOT_SUPPORTED"
+
+    assert resolve_persisted_query(persisted(key, QUERY))["query"] == QUERY
+    data = persisted(key)
+    assert resolve_persisted_query(data)["query"] == QUERY
+    assert "query" not in data
+    # GET requests give the extensions as JSON
+    data = {"extensions": json.dumps(persisted(key)["extensions"])}
+    assert resolve_persisted_query(data)["query"] == QUERY
+    assert resolve_persisted_query({"query": QUERY}) == {"query": QUERY}
+
+
+@pytest.mark.usefixtures("db_service")
+def test_documents_parsed_and_validated_once(document_cache, monkeypatch):
+    from strawberry.schema import execute as strawberry_execute
+    from customers.api import schema
+
+    calls = []
+    for name in ("parse_document", "validate_document"):
+        original = getattr(strawberry_execute, name)
+
+        def counted(*args, original=original, name=name):
+            calls.append(name)
+            return original(*args)
+
+        monkeypatch.setattr(strawberry_execute, name, counted)
+
+    query = "{ __typename }"
+    for _ in range(3):
+        result = asyncio.run(schema.execute(query))
+        assert result.errors is None
+        assert result.data == {"__typename": "Query"}
+    assert calls == ["parse_document", "validate_document"]
+    assert document_cache.document(query_hash(query)) is not None
+
+    # invalid documents are not kept
+    for _ in range(2):
+        result = asyncio.run(schema.execute("{ unknown }"))
+        assert result.errors
+    assert document_cache.document(query_hash("{ unknown }")) is None
+
+
+def request(app, body, method="POST"):
+    async def call():
+        query_string = b""
+        if method == "GET":
+            # GET requests give the variables and extensions as JSON
+            params = {
+                k: v if isinstance(v, str) else json.dumps(v) for k, v in body.items()
+            }
+            query_string, body_bytes = urlencode(params).encode(), b""
+        else:
+            body_bytes = json.dumps(body).encode()
+        messages = [{"type": "http.request", "body": body_bytes}]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": method,
+            "path": "/",
+            "query_string": query_string,
+            "headers": [(b"content-type", b"application/json")],
+        }
+        await app(scope, receive, send)
+        return json.loads(b"".join(m.get("body", b"") for m in sent[1:]))
+
+    return asyncio.run(call())
+
+
+@pytest.mark.usefixtures("db_service")
+def test_app_persisted_queries():
+    from customers.app import app
+
+    query = "{ __typename }"
+    key = query_hash(query)
+    response = request(app, persisted(key))
+    assert response["errors"][0]["extensions"]["code"] == "PERSISTED_QUERY_NOT_FOUND"
+    assert request(app, persisted(key, query)) == {"data": {"__typename": "Query"}}
+    assert request(app, persisted(key)) == {"data": {"__typename": "Query"}}
+    assert request(app, {"query": query}) == {"data": {"__typename": "Query"}}
+    assert request(app, persisted(key), "GET") == {"data": {"__typename": "Query"}}
@@ -1,6 +1,18 @@
 from decimal import Decimal
 
-from customers.geo import Position, Area
+from hypothesis import given, strategies as st
+
+from customers.geo import (
+    Area,
+    Position,
+    contains_mask,
+    locate,
+    nearest,
+    pairwise_contains,
+    within,
+)
+
+from strategies import areas, positions
 
 
 def test_position_syntax():
@@ -50,3 +62,78 @@ def test_area_inclusion():
     assert not area.contains(Position("3.9", "9.800000001"))
     assert area.contains(Position("4.1", "7.2"))
     assert not area.contains(Position("4.11", "9.7"))
+
+
+def test_position_fixed_point():
+    p = Position(Decimal("3.14000000"), Decimal("-7.2"))
+    assert p.long == Decimal("3.14000000")
+    assert str(p.long) == "3.14000000"
+    assert p.fixed() == (314000000, 314000000, -720000000, -720000000)
+    assert Position("0.000000001", "-0.000000001").fixed() == (0, 1, -1, 0)
+    assert Position(6.0, 1.6) != Position("6.0", "1.6")
+    assert not hasattr(p, "__dict__")
+    # read with the 8 decimals of the columns, whatever the given ones
+    assert str(Position("1.5", "2").long) == "1.50000000"
+    assert str(Position(-5, 0).long) == "-5.00000000"
+    assert str(Position("0.000000001", 0).long) == "1E-9"
+
+
+def test_position_hash():
+    assert hash(Position("3.1", "7.2")) == hash(Position(Decimal("3.10000000"), "7.2"))
+    assert (
+        len({Position("3.1", "7.2"), Position("3.10", "7.20"), Position("3", "7")}) == 2
+    )
+    area = Area(Position("3.1", "7.2"), Position("4", "8"))
+    assert area == Area(Position("3.10", "7.2"), Position("4.0", "8"))
+    assert {area: 1}[Area(Position("3.1", "7.2"), Position("4", "8"))] == 1
+
+
+def box(long_1, lat_1, long_2, lat_2):
+    return Area(Position(long_1, lat_1), Position(long_2, lat_2))
+
+
+@given(
+    st.lists(st.one_of(st.none(), positions(), positions(places=12)), max_size=20),
+    st.lists(st.one_of(st.none(), areas()), max_size=20),
+)
+def test_batch_matches_area_contains(positions, areas):
+    expected = [
+        [area is not None and area.contains(p) for area in areas] for p in positions
+    ]
+    assert contains_mask(positions, areas).tolist() == (
+        expected if areas else [[] for _ in positions]
+    )
+    first = [row.index(True) if True in row else -1 for row in expected]
+    assert locate(positions, areas).tolist() == first
+    for area in areas:
+        assert within(area, positions).tolist() == [
+            area is not None and area.contains(p) for p in positions
+        ]
+    pairs = list(zip(positions, areas))
+    assert pairwise_contains([p for p, _ in pairs], [a for _, a in pairs]).tolist() == [
+        a is not None and a.contains(p) for p, a in pairs
+    ]
+
+
+def test_locate_large_areas():
+    areas = [box("0", "0", "1", "1"), box("-10", "-10", "10", "10")]
+    areas += [box(f"0.0{i}", "0", f"0.0{i}1", "0.01") for i in range(1, 9)]
+    points = [Position("0.5", "0.5"), Position("5", "5"), Position("0.0505", "0")]
+    assert locate(points, areas).tolist() == [0, 1, 0]
+    # large areas come first, the small ones are found through the grid
+    assert locate(points, areas[1:]).tolist() == [0, 0, 0]
+    assert locate(points, areas[2:]).tolist() == [-1, -1, 4]
+    assert locate([Position("1e15", "0")], areas).tolist() == [-1]
+
+
+def test_nearest():
+    areas = [box("0", "0", "1", "1"), None, box("3", "0", "4", "1")]
+    points = [
+        Position("0.5", "0.5"),
+        Position("1.9", "0.5"),
+        Position("2.1", "5"),
+        Position("4", "1"),
+        None,
+    ]
+    assert nearest(points, areas).tolist() == [0, 0, 2, 2, -1]
+    assert nearest(points, [None]).tolist() == [-1] * 5
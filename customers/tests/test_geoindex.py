@@ -0,0 +1,80 @@
+from decimal import Decimal
+
+from hypothesis import given, strategies as st
+
+from customers.geo import Area, Position, to_fixed
+from customers.geoindex import AreaIndex
+
+from strategies import areas, positions
+
+
+def test_to_fixed():
+    assert to_fixed("1.5") == (150000000, True)
+    assert to_fixed("-1.5") == (-150000000, True)
+    assert to_fixed("0.000000001") == (0, False)
+    assert to_fixed("-0.000000001") == (-1, False)
+    assert to_fixed(1.6) == (160000000, False)
+    assert to_fixed(Decimal("1E+2")) == (10000000000, True)
+
+
+def test_search():
+    index = AreaIndex.from_areas(
+        [
+            ("a", Area(Position("5.6", "1.3"), Position("6.2", "1.6"))),
+            ("b", Area(Position("6.0", "1.5"), Position("7.0", "2.0"))),
+        ]
+    )
+    assert index.search(Position("6.0", "1.6")) == ["a", "b"]
+    assert index.search(Position("5.6", "1.3")) == ["a"]
+    assert index.search(Position(6.0, 1.6)) == ["b"]
+    assert index.search(Position("6.201", "1.4")) == []
+    assert index.locate([Position("6.1", "1.55"), None, Position("0", "0")]) == [
+        "a",
+        None,
+        None,
+    ]
+
+
+def test_overlaps():
+    index = AreaIndex.from_areas(
+        [
+            ("a", Area(Position("5.6", "1.3"), Position("6.2", "1.6"))),
+            ("world", Area(Position("-180", "-90"), Position("180", "90"))),
+        ]
+    )
+    assert index.overlaps(Area(Position("6.2", "1.6"), Position("7", "2"))) == [
+        "a",
+        "world",
+    ]
+    assert index.overlaps(Area(Position("6.21", "1.6"), Position("7", "2"))) == [
+        "world"
+    ]
+
+
+@given(st.lists(areas(), max_size=20), st.lists(positions(), max_size=20))
+def test_search_matches_area_contains(areas, positions):
+    index = AreaIndex.from_areas(enumerate(areas), cell_size=10**7)
+    for position in positions:
+        expected = [i for i, area in enumerate(areas) if area.contains(position)]
+        assert index.search(position) == expected
+    assert index.locate(positions) == [
+        next((i for i, area in enumerate(areas) if area.contains(position)), None)
+        for position in positions
+    ]
+
+
+@given(st.lists(areas(), max_size=10), st.lists(positions(places=12), max_size=20))
+def test_search_finer_positions(areas, positions):
+    index = AreaIndex.from_areas(enumerate(areas))
+    for position in positions:
+        expected = [i for i, area in enumerate(areas) if area.contains(position)]
+        assert index.search(position) == expected
+
+
+@given(areas(), st.lists(positions(), min_size=1, max_size=10))
+def test_corners_and_inner_points(area, positions):
+    index = AreaIndex.from_areas([("area", area)])
+    assert index.search(area.bottom_corner) == ["area"]
+    assert index.search(area.top_corner) == ["area"]
+    for position in positions:
+        assert (index.search(position) == ["area"]) == area.contains(position)
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from customers.model import Customer, Site, Building, Area, Position
+
+
+@pytest.fixture
+def sites(db, db_service, clean):
+    with Session(db) as s:
+        c = Customer(name="importer")
+        with_area = Site(
+            owner=c,
+            label="with_area",
+            area=Area(Position("1.0", "1.0"), Position("2.0", "2.0")),
+        )
+        without_area = Site(owner=c, label="without_area")
+        s.add_all((with_area, without_area))
+        s.commit()
+        ids = with_area.id, without_area.id
+    return ids
+
+
+IMPORT = """
+mutation ($buildings: [BuildingImportInput!]!) {
+  importBuildings(buildings: $buildings) {
+    imported
+    buildingIds
+    errors { index message }
+  }
+}
+"""
+
+
+def test_import_buildings(db, sites, execute):
+    with_area, without_area = sites
+    buildings = [
+        {"label": "in", "siteId": with_area, "position": {"long": 1.5, "lat": 1.5}},
+        {"label": "out", "siteId": with_area, "position": {"long": 2.5, "lat": 1.5}},
+        {"label": "nowhere", "siteId": with_area},
+        {"label": "border", "siteId": with_area, "position": {"long": 2, "lat": 1}},
+        {"label": "no_site", "siteId": -1},
+        {"label": "free", "siteId": without_area},
+    ]
+    data = execute(IMPORT, buildings=buildings)["importBuildings"]
+    assert data["imported"] == 3
+    assert data["errors"] == [
+        {"index": 1, "message": "building coordinates are not in site area."},
+        {"index": 2, "message": "building coordinates are not in site area."},
+        {"index": 4, "message": "site does not exists."},
+    ]
+    ids = data["buildingIds"]
+    assert [i is None for i in ids] == [False, True, True, False, True, False]
+    with Session(db) as s:
+        imported = {
+            b.id: (b.label, b.site_id, b.position)
+            for b in s.execute(select(Building)).scalars()
+        }
+    assert imported == {
+        ids[0]: ("in", with_area, Position("1.5", "1.5")),
+        ids[3]: ("border", with_area, Position("2", "1")),
+        ids[5]: ("free", without_area, None),
+    }
+
+
+def test_import_many_buildings(db, sites, execute):
+    with_area, _ = sites
+    buildings = [
+        {
+            "label": f"b_{i}",
+            "siteId": with_area,
+            "position": {"long": f"1.{i:05}", "lat": "1.5"},
+        }
+        for i in range(2000)
+    ]
+    buildings[1000]["position"]["lat"] = "3"
+    data = execute(IMPORT, buildings=buildings)["importBuildings"]
+    assert data["imported"] == 1999
+    assert data["errors"] == [
+        {"index": 1000, "message": "building coordinates are not in site area."}
+    ]
+    with Session(db) as s:
+        assert len(s.execute(select(Building.id)).all()) == 1999
+
+
+def test_import_file(db, db_service, sites, tmp_path, capsys):
+    from tools.import_buildings import import_file
+
+    with_area, without_area = sites
+    path = tmp_path / "buildings.csv"
+    path.write_text(
+        "label,site_id,long,lat\n"
+        f"a,{with_area},1.1,1.2\n"
+        f"b,{with_area},x,1.2\n"
+        f"c,{with_area},3,1.2\n"
+        f"d,{without_area},,\n"
+        # sites found from the position
+        "e,,1.5,2\n"
+        "f,,2.5,2\n"
+    )
+    assert asyncio.run(import_file(db_service.eng, path)) == 3
+    err = capsys.readouterr().err
+    assert "line 3: cannot parse" in err
+    assert "line 4: building coordinates are not in site area." in err
+    nearest = (
+        f"line 7: position is in no site area, the nearest one is of site {with_area}."
+    )
+    assert nearest in err
+    with Session(db) as s:
+        rows = s.execute(
+            select(Building.label, Building.site_id).order_by(Building.label)
+        )
+        assert rows.all() == [("a", with_area), ("d", without_area), ("e", with_area)]
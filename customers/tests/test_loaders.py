@@ -0,0 +1,75 @@
+import pytest
+
+from sqlalchemy.orm import Session
+
+from customers.model import Customer, Site, Building, Area, Position
+
+
+@pytest.fixture(scope="module")
+def load_buildings(db, delete_all):
+    with Session(db) as s:
+        for i in range(4):
+            c = Customer(name=f"customer_{i}")
+            for j in range(25):
+                site = Site(
+                    owner=c,
+                    label=f"site_{i}_{j}",
+                    area=Area(Position("1.0", "1.0"), Position("2.0", "2.0")),
+                )
+                for k in range(10):
+                    site.buildings.append(
+                        Building(
+                            label=f"building_{i}_{j}_{k}",
+                            position=Position("1.5", "1.5"),
+                        )
+                    )
+                s.add(site)
+        s.commit()
+    yield
+    delete_all()
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_nested_site_owner_is_batched(count_queries, execute):
+    with count_queries() as queries:
+        data = execute("{ buildings { id site { id label owner { id name } } } }")
+    assert len(data["buildings"]) == 1000
+    assert data["buildings"][0]["site"]["owner"]["name"] == "customer_0"
+    assert data["buildings"][-1]["site"]["label"] == "site_3_24"
+    # buildings, then sites IN (...), then customers IN (...)
+    assert len(queries) == 3
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_fragments_and_aliases_are_batched(count_queries, execute):
+    query = """
+    {
+        buildings { ...buildingFields }
+    }
+
+    fragment buildingFields on Building {
+        label
+        place: site { label }
+        site {
+            owner { name }
+            ... on Site { buildings { id } }
+        }
+    }
+    """
+    with count_queries() as queries:
+        data = execute(query)
+    assert len(data["buildings"]) == 1000
+    assert data["buildings"][0]["place"]["label"] == "site_0_0"
+    assert len(data["buildings"][0]["site"]["buildings"]) == 10
+    assert len(queries) == 4
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_sites_owner_is_batched(count_queries, execute):
+    with count_queries() as queries:
+        data = execute("{ sites { label owner { name } } }")
+    assert len(data["sites"]) == 100
+    assert {site["owner"]["name"] for site in data["sites"]} == {
+        f"customer_{i}" for i in range(4)
+    }
+    assert len(queries) == 2
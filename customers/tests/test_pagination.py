@@ -0,0 +1,96 @@
+import pytest
+
+from sqlalchemy.orm import Session
+
+from customers import model
+from customers.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor():
+    cursor = encode_cursor(model.Building, 42)
+    assert decode_cursor(model.Building, cursor) == 42
+    with pytest.raises(ValueError):
+        decode_cursor(model.Site, cursor)
+    with pytest.raises(ValueError):
+        decode_cursor(model.Site, "not a cursor")
+
+
+@pytest.fixture(scope="module")
+def load_buildings(db, delete_all):
+    with Session(db) as s:
+        c = model.Customer(name="paginated")
+        site = model.Site(owner=c, label="paginated_site")
+        for i in range(25):
+            site.buildings.append(model.Building(label=f"building_{i:02}"))
+        s.add(site)
+        s.commit()
+    yield
+    delete_all()
+
+
+PAGE_QUERY = """
+query ($after: String) {
+    buildingsConnection(first: 10, after: $after) {
+        edges { cursor node { label site { label } } }
+        pageInfo { hasNextPage hasPreviousPage endCursor }
+    }
+}
+"""
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_buildings_pages(count_queries, execute_result):
+    labels = []
+    after = None
+    pages = 0
+    while True:
+        with count_queries() as queries:
+            result = execute_result(PAGE_QUERY, after=after)
+        assert result.errors is None
+        assert len(queries) == 2
+        assert "LIMIT" in queries.statements[0]
+        connection = result.data["buildingsConnection"]
+        labels.extend(edge["node"]["label"] for edge in connection["edges"])
+        assert connection["pageInfo"]["hasPreviousPage"] == (after is not None)
+        pages += 1
+        if not connection["pageInfo"]["hasNextPage"]:
+            break
+        after = connection["pageInfo"]["endCursor"]
+        assert after == connection["edges"][-1]["cursor"]
+    assert pages == 3
+    assert labels == [f"building_{i:02}" for i in range(25)]
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_sites_and_customers_connections(execute_result):
+    result = execute_result(
+        """
+        {
+            sitesConnection(first: 1) { edges { node { label } } pageInfo { hasNextPage } }
+            customersConnection { edges { node { name } } pageInfo { hasNextPage } }
+        }
+        """
+    )
+    assert result.errors is None
+    assert result.data == {
+        "sitesConnection": {
+            "edges": [{"node": {"label": "paginated_site"}}],
+            "pageInfo": {"hasNextPage": False},
+        },
+        "customersConnection": {
+            "edges": [{"node": {"name": "paginated"}}],
+            "pageInfo": {"hasNextPage": False},
+        },
+    }
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_bad_page_arguments(execute_result):
+    result = execute_result(
+        "{ buildingsConnection(first: 0) { pageInfo { hasNextPage } } }"
+    )
+    assert result.errors
+    result = execute_result(
+        '{ buildingsConnection(after: "foo") { pageInfo { hasNextPage } } }'
+    )
+    assert result.errors
@@ -0,0 +1,101 @@
+import pytest
+
+from sqlalchemy.orm import Session
+from strawberry.types.nodes import FragmentSpread, InlineFragment, SelectedField
+
+from customers import model
+from customers.planner import Plan
+
+
+def field(name, *selections, alias=None):
+    return SelectedField(
+        name=name,
+        directives={},
+        arguments={},
+        selections=list(selections),
+        alias=alias,
+    )
+
+
+def test_plan_fields():
+    plan = Plan().add(model.Building, [field("label"), field("position")])
+    assert plan.columns == {model.Building: {"id", "label", "long", "lat"}}
+    assert model.Site not in plan.columns
+    assert plan.options(model.Site) == ()
+
+
+def test_plan_follows_relations_fragments_and_aliases():
+    selections = [
+        field("label", alias="name"),
+        FragmentSpread(
+            name="buildingSite",
+            type_condition="Building",
+            directives={},
+            selections=[
+                field(
+                    "site",
+                    field("area"),
+                    InlineFragment(
+                        type_condition="Site",
+                        directives={},
+                        selections=[field("owner", field("name"))],
+                    ),
+                    alias="place",
+                )
+            ],
+        ),
+    ]
+    plan = Plan().add(model.Building, selections)
+    assert plan.columns == {
+        model.Building: {"id", "label", "site_id"},
+        model.Site: {
+            "id",
+            "bottom_corner_long",
+            "bottom_corner_lat",
+            "top_corner_long",
+            "top_corner_lat",
+            "customer_id",
+        },
+        model.Customer: {"id", "name"},
+    }
+
+
+def test_plan_update():
+    plan = Plan().add(model.Site, [field("label")])
+    plan.update(Plan().add(model.Site, [field("city")]))
+    assert plan.columns[model.Site] == {"id", "label", "city"}
+
+
+@pytest.fixture(scope="module")
+def load_sites(db, delete_all):
+    with Session(db) as s:
+        c = model.Customer(name="planned", location={"country": "fr"})
+        site = model.Site(owner=c, label="planned_site", address=["1 rue du lac"])
+        site.buildings.append(model.Building(label="planned_building"))
+        s.add(site)
+        s.commit()
+    yield
+    delete_all()
+
+
+@pytest.mark.usefixtures("load_sites")
+def test_unused_jsonb_columns_are_not_selected(count_queries, execute):
+    with count_queries() as queries:
+        data = execute("{ buildings { label site { label owner { name } } } }")
+    assert data["buildings"] == [
+        {
+            "label": "planned_building",
+            "site": {"label": "planned_site", "owner": {"name": "planned"}},
+        }
+    ]
+    assert len(queries) == 3
+    for statement in queries.statements:
+        assert "address" not in statement
+        assert "location" not in statement
+        assert "zip_code" not in statement
+
+    with count_queries() as queries:
+        data = execute("{ sites { address } }")
+    assert data["sites"] == [{"address": ["1 rue du lac"]}]
+    assert "sites.address" in queries.statements[0]
+    assert "sites.label" not in queries.statements[0]
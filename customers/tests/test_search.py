@@ -0,0 +1,116 @@
+import pytest
+
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from customers import model
+from customers.model import Customer, Site, Building
+from customers.search import EXACT, PATTERN, PREFIX, match, match_mode
+
+
+def test_match_mode():
+    assert match_mode("north") == EXACT
+    assert match_mode("north\\_1") == EXACT
+    assert match_mode("north%") == PREFIX
+    assert match_mode("north\\%") == EXACT
+    assert match_mode("%north%") == PATTERN
+    assert match_mode("site_%") == PATTERN
+    assert match_mode("n%th") == PATTERN
+
+
+def compile(clause):
+    return str(
+        clause.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+
+
+def test_match():
+    assert compile(match(model.Site.label, "North\\_1")) == (
+        "lower(sites.label) = lower('North_1')"
+    )
+    assert compile(match(model.Site.label, "Nor%")).startswith(
+        "lower(sites.label) LIKE lower('Nor%"
+    )
+
+
+@pytest.fixture
+def tree(db, db_service, clean):
+    with Session(db) as s:
+        north = Customer(name="North")
+        sites = [
+            Site(owner=north, label="north_site"),
+            Site(owner=Customer(name="Southern"), label="Southern 100%"),
+        ]
+        sites[0].buildings = [
+            Building(label="Northgate"),
+            Building(label="tower"),
+        ]
+        sites[1].buildings = [Building(label="far north")]
+        s.add_all(sites)
+        s.commit()
+
+
+def test_filters(tree, execute):
+    query = """query ($name: String, $label: String) {
+      customers(name: $name) { name }
+      buildings(label: $label) { label }
+    }"""
+    data = execute(query, name="NORTH", label="north%")
+    assert data == {
+        "customers": [{"name": "North"}],
+        "buildings": [{"label": "Northgate"}],
+    }
+    data = execute(query, name="%th%", label="%NORTH")
+    assert data["customers"] == [{"name": "North"}, {"name": "Southern"}]
+    assert data["buildings"] == [{"label": "far north"}]
+
+
+SEARCH = """query ($term: String!, $first: Int) {
+  search(term: $term, first: $first) {
+    kind text
+    customer { name }
+    site { label owner { name } }
+    building { label }
+  }
+}"""
+
+
+def test_search(tree, count_queries, execute):
+    with count_queries() as queries:
+        hits = execute(SEARCH, term="north")["search"]
+    # hits, then one query per kind; owners are already loaded
+    assert len(queries) == 4
+    assert [(hit["kind"], hit["text"]) for hit in hits] == [
+        ("CUSTOMER", "North"),
+        ("BUILDING", "Northgate"),
+        ("SITE", "north_site"),
+        ("BUILDING", "far north"),
+    ]
+    assert hits[0]["customer"] == {"name": "North"}
+    assert hits[0]["site"] is None and hits[0]["building"] is None
+    assert hits[1]["building"] == {"label": "Northgate"}
+    assert hits[2]["site"] == {"label": "north_site", "owner": {"name": "North"}}
+
+    assert len(execute(SEARCH, term="north", first=2)["search"]) == 2
+    # wildcards are searched as such
+    assert [hit["text"] for hit in execute(SEARCH, term="0%")["search"]] == [
+        "Southern 100%"
+    ]
+    assert execute(SEARCH, term="_")["search"] == [
+        {
+            "kind": "SITE",
+            "text": "north_site",
+            "customer": None,
+            "site": {"label": "north_site", "owner": {"name": "North"}},
+            "building": None,
+        }
+    ]
+
+
+def test_search_bounds(db_service, execute_result):
+    result = execute_result('{ search(term: "a", first: 0) { id } }')
+    assert "first must be between 1 and 100." in result.errors[0].message
+    result = execute_result('{ search(term: "") { id } }')
+    assert "search term is empty." in result.errors[0].message
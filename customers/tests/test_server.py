@@ -0,0 +1,138 @@
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from sqlalchemy import delete
+
+from customers.model import Customer
+from customers.server import SERVER_DEFAULTS, server_config, worker_config
+
+
+def test_server_config():
+    settings = server_config({"workers": 2})
+    assert settings == {**SERVER_DEFAULTS, "workers": 2}
+    assert server_config({})["workers"] == (os.cpu_count() or 1)
+    with pytest.raises(ValueError, match="unknown server settings"):
+        server_config({"threads": 2})
+    with pytest.raises(ValueError, match="workers should be an int of at least 1"):
+        server_config({"workers": 0})
+    with pytest.raises(
+        ValueError, match="drain_timeout should be a number of at least 0"
+    ):
+        server_config({"drain_timeout": -1})
+
+
+def test_worker_config():
+    config = {"db_url": "postgresql+asyncpg://localhost/customers"}
+    assert worker_config(config, 1) == config
+    assert worker_config(config, 2) == {**config, "cache": {"backend": "none"}}
+    redis = {**config, "cache": {"backend": "redis", "url": "redis://localhost"}}
+    assert worker_config(redis, 2) == redis
+    routing = {
+        **config,
+        "db_replicas": ["postgresql+asyncpg://replica/customers"],
+        "db_routing": {"read_your_writes": 5},
+    }
+    assert worker_config(routing, 1) == routing
+    with pytest.raises(ValueError, match="read_your_writes is tracked per process"):
+        worker_config(routing, 2)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(tmp_path, **config):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps(config))
+    root = os.path.join(os.path.dirname(__file__), "..")
+    env = {
+        **os.environ,
+        "CUSTOMERS_APP_CONFIG": str(path),
+        "PYTHONPATH": os.pathsep.join([root, os.path.join(root, "..")]),
+    }
+    return subprocess.Popen([sys.executable, "-m", "customers.server"], env=env)
+
+
+def post(port, query, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{port}/graphql",
+            data=json.dumps({"query": query}).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read())
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+def test_workers_serve_and_drain(db, tmp_path, asyncpg_url):
+    port = free_port()
+    server = start_server(
+        tmp_path,
+        db_url=asyncpg_url,
+        server={"host": "127.0.0.1", "port": port, "workers": 2},
+    )
+    try:
+        for _ in range(4):
+            assert post(port, "{ customers { name } }") == {"data": {"customers": []}}
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=10) == 0
+    finally:
+        server.kill()
+        server.wait()
+
+
+def test_workers_read_mutations(db, tmp_path, asyncpg_url):
+    port = free_port()
+    server = start_server(
+        tmp_path,
+        db_url=asyncpg_url,
+        server={"host": "127.0.0.1", "port": port, "workers": 2},
+    )
+    query = "{ customers { name } }"
+    try:
+        # both workers have read the list, whichever got each request
+        for _ in range(8):
+            assert post(port, query) == {"data": {"customers": []}}
+        created = post(
+            port,
+            'mutation { upsertCustomerTree(customer: {name: "new"}) '
+            "{ customer { name } } }",
+        )
+        assert created["data"]["upsertCustomerTree"] == {"customer": {"name": "new"}}
+        for _ in range(8):
+            assert post(port, query) == {"data": {"customers": [{"name": "new"}]}}
+    finally:
+        server.kill()
+        server.wait()
+        with db.begin() as conn:
+            conn.execute(delete(Customer))
+
+
+def test_worker_boot_error_stops_the_server(tmp_path):
+    server = start_server(
+        tmp_path,
+        db_url="postgresql+asyncpg://localhost/customers",
+        db_pool={"pool_size": 0},
+        server={"host": "127.0.0.1", "port": free_port(), "workers": 2},
+    )
+    try:
+        assert server.wait(timeout=10) == 1
+    finally:
+        server.kill()
+        server.wait()
@@ -0,0 +1,105 @@
+import asyncio
+from decimal import Decimal
+
+import pytest
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from customers import model, spatial
+from customers.schema import AreaInput, PositionInput
+
+
+AREA = AreaInput(
+    bottom_corner=PositionInput(long=Decimal("1.0"), lat=Decimal("2.0")),
+    top_corner=PositionInput(long=Decimal("3.0"), lat=Decimal("4.0")),
+)
+
+
+def compile(clause):
+    return str(clause.compile(dialect=postgresql.dialect()))
+
+
+def test_btree_filter():
+    sql = compile(spatial.BTreeBackend().area_filter(AREA))
+    assert "buildings.long >" in sql
+    assert "buildings.lat <" in sql
+    assert "&&" not in sql
+
+
+def test_btree_filter_without_summaries():
+    assert "site_summaries" in compile(spatial.BTreeBackend().area_filter(AREA))
+    sql = compile(spatial.BTreeBackend(prune_sites=False).area_filter(AREA))
+    assert "site_summaries" not in sql
+    assert "buildings.long >" in sql
+
+
+def test_postgis_filter_keeps_exact_recheck():
+    sql = compile(spatial.PostgisBackend().area_filter(AREA))
+    assert "buildings.geom && ST_MakeEnvelope(" in sql
+    assert "buildings.long >" in sql
+    assert "buildings.lat <" in sql
+
+
+@pytest.fixture(scope="module")
+def load_buildings(db, delete_all):
+    with Session(db) as s:
+        c = model.Customer(name="spatial")
+        site = model.Site(owner=c, label="spatial_site")
+        for long, lat in (("1.5", "2.5"), ("2.5", "3.5"), ("3.5", "3.5"), ("1.0", "3")):
+            site.buildings.append(
+                model.Building(
+                    label=f"building_{long}_{lat}", position=model.Position(long, lat)
+                )
+            )
+        s.add(site)
+        s.commit()
+    yield
+    delete_all()
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_area_search(db_service, execute):
+    backend = asyncio.run(spatial.setup(db_service.session))
+    assert backend.name == "btree"
+    assert spatial.get_backend() is backend
+
+    data = execute(
+        """
+        {
+            buildings(area: {
+                bottomCorner: {long: "1.0", lat: "2.0"},
+                topCorner: {long: "3.0", lat: "4.0"}
+            }) { label }
+        }
+        """
+    )
+    assert data["buildings"] == [
+        {"label": "building_1.5_2.5"},
+        {"label": "building_2.5_3.5"},
+    ]
+
+
+@pytest.mark.usefixtures("load_buildings")
+def test_area_search_without_summaries(db, db_service, execute):
+    # a database the 0004 migration wasn't applied to
+    with db.begin() as conn:
+        conn.execute(text("ALTER TABLE site_summaries RENAME TO site_summaries_off"))
+    try:
+        backend = asyncio.run(spatial.setup(db_service.session))
+        assert not backend.prune_sites
+        data = execute(
+            '{ buildings(area: {bottomCorner: {long: "1.0", lat: "2.0"}, '
+            'topCorner: {long: "3.0", lat: "4.0"}}) { label } }'
+        )
+        assert [b["label"] for b in data["buildings"]] == [
+            "building_1.5_2.5",
+            "building_2.5_3.5",
+        ]
+    finally:
+        with db.begin() as conn:
+            conn.execute(
+                text("ALTER TABLE site_summaries_off RENAME TO site_summaries")
+            )
+        asyncio.run(spatial.setup(db_service.session))
@@ -0,0 +1,90 @@
+import pytest
+
+from sqlalchemy.orm import Session
+
+from customers.model import Customer, Site, Building, Position
+
+
+@pytest.fixture
+def tree(db, db_service, clean):
+    """Customer a: sites a0 (buildings at (1, 1), (2, 3)) and a1 (at (5, 5)).
+
+    Customer b: site b0 (a building without position), and b1 (no building).
+    """
+    with Session(db) as s:
+        a, b = Customer(name="a"), Customer(name="b")
+        a0, a1 = Site(owner=a, label="a0"), Site(owner=a, label="a1")
+        a0.buildings = [
+            Building(label="a0_0", position=Position(1, 1)),
+            Building(label="a0_1", position=Position(2, 3)),
+        ]
+        a1.buildings = [Building(label="a1_0", position=Position(5, 5))]
+        b0 = Site(owner=b, label="b0")
+        b0.buildings = [Building(label="b0_0")]
+        s.add_all([a0, a1, b0, Site(owner=b, label="b1")])
+        s.commit()
+
+
+def test_counts(tree, count_queries, execute):
+    query = """{
+      customers { name siteCount buildingCount sites: buildingCount }
+      sites { label buildingCount owner { siteCount } }
+    }"""
+    with count_queries() as queries:
+        data = execute(query)
+    # customers, sites, then one GROUP BY per aggregate and an owners query
+    assert len(queries) == 6
+    assert data["customers"] == [
+        {"name": "a", "siteCount": 2, "buildingCount": 3, "sites": 3},
+        {"name": "b", "siteCount": 2, "buildingCount": 1, "sites": 1},
+    ]
+    assert [(site["label"], site["buildingCount"]) for site in data["sites"]] == [
+        ("a0", 2),
+        ("a1", 1),
+        ("b0", 1),
+        ("b1", 0),
+    ]
+    assert [site["owner"]["siteCount"] for site in data["sites"]] == [2, 2, 2, 2]
+
+
+STATS = """
+  stats {fields}
+  around: stats(area: {{bottomCorner: {{long: 0, lat: 0}}, topCorner: {{long: 3, lat: 4}}}}) {fields}
+  empty: stats(area: {{bottomCorner: {{long: 10, lat: 10}}, topCorner: {{long: 11, lat: 11}}}}) {fields}
+"""
+FIELDS = """{
+  buildingCount siteCount customerCount
+  boundingBox { bottomCorner { long lat } topCorner { long lat } }
+}"""
+
+
+def box(bottom, top):
+    return {
+        "bottomCorner": {"long": f"{bottom[0]:.8f}", "lat": f"{bottom[1]:.8f}"},
+        "topCorner": {"long": f"{top[0]:.8f}", "lat": f"{top[1]:.8f}"},
+    }
+
+
+def test_stats(tree, count_queries, execute):
+    with count_queries() as queries:
+        data = execute("{" + STATS.format(fields=FIELDS) + "}")
+    # every area in a single statement
+    assert len(queries) == 1
+    assert data["stats"] == {
+        "buildingCount": 4,
+        "siteCount": 3,
+        "customerCount": 2,
+        "boundingBox": box((1, 1), (5, 5)),
+    }
+    assert data["around"] == {
+        "buildingCount": 2,
+        "siteCount": 1,
+        "customerCount": 1,
+        "boundingBox": box((1, 1), (2, 3)),
+    }
+    assert data["empty"] == {
+        "buildingCount": 0,
+        "siteCount": 0,
+        "customerCount": 0,
+        "boundingBox": None,
+    }
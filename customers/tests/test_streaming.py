@@ -0,0 +1,127 @@
+import asyncio
+import json
+
+import pytest
+
+from sqlalchemy.orm import Session
+
+from customers.model import Customer, Site, Building
+from customers.streaming import execute_stream, streamed_field
+
+
+@pytest.fixture
+def buildings(db, db_service, clean):
+    """25 buildings, on 3 sites."""
+    with Session(db) as s:
+        customer = Customer(name="streamed")
+        sites = [Site(owner=customer, label=f"site_{i}") for i in range(3)]
+        for i in range(25):
+            sites[i % 3].buildings.append(Building(label=f"building_{i:02}"))
+        s.add_all(sites)
+        s.commit()
+
+
+def stream(query, chunk_size, **variables):
+    async def lines():
+        from customers.api import schema
+
+        return [
+            json.loads(line)
+            async for line in execute_stream(
+                schema, query, variables, chunk_size=chunk_size
+            )
+        ]
+
+    return asyncio.run(lines())
+
+
+def test_streamed_field():
+    assert streamed_field("{ buildings { id } }") == "buildings"
+    assert streamed_field("query Q { all: sites { id } }") == "sites"
+    assert streamed_field("{ customers { id } }") is None
+    assert streamed_field("{ buildings { id } sites { id } }") is None
+    assert streamed_field("mutation { deleteBuilding(id: 1) }") is None
+    assert streamed_field("{ buildings") is None
+
+
+QUERY = "{ buildings { label site { label } } }"
+BUILDINGS = [
+    {"label": f"building_{i:02}", "site": {"label": f"site_{i % 3}"}} for i in range(25)
+]
+
+
+def test_stream_by_chunks(buildings, count_queries):
+    with count_queries() as queries:
+        lines = stream(QUERY, 10)
+    # the cursor, then one query of sites per chunk
+    assert len(queries) == 4
+    assert [line["hasNext"] for line in lines] == [True, True, False]
+    assert len(lines[0]["data"]["buildings"]) == 10
+    assert [line["incremental"][0]["path"] for line in lines[1:]] == [
+        ["buildings", 10],
+        ["buildings", 20],
+    ]
+    items = lines[0]["data"]["buildings"]
+    for line in lines[1:]:
+        items += line["incremental"][0]["items"]
+    assert sorted(items, key=lambda item: item["label"]) == BUILDINGS
+
+
+def test_stream_exact_chunks(buildings):
+    query = "query ($label: String) { all: sites(label: $label) { label } }"
+    assert stream(query, 3, label="site_%") == [
+        {
+            "data": {"all": [{"label": f"site_{i}"} for i in range(3)]},
+            "hasNext": True,
+        },
+        {"hasNext": False},
+    ]
+
+
+def test_single_line(buildings):
+    assert stream("{ customers { name } }", 10) == [
+        {"data": {"customers": [{"name": "streamed"}]}, "hasNext": False}
+    ]
+    lines = stream("{ buildings { unknown } }", 10)
+    assert lines[0]["data"] is None
+    assert "unknown" in lines[0]["errors"][0]["message"]
+
+
+def test_app_stream(buildings):
+    from customers.app import app
+
+    async def call():
+        body = json.dumps({"query": QUERY}).encode()
+        messages = [{"type": "http.request", "body": body}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # the client stays connected
+            await asyncio.Future()
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http",
+            "method": "POST",
+            "path": "/graphql",
+            "query_string": b"",
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"accept", b"application/x-ndjson"),
+            ],
+        }
+        await app(scope, receive, send)
+        return sent
+
+    sent = asyncio.run(call())
+    assert (b"content-type", b"application/x-ndjson") in sent[0]["headers"]
+    body = b"".join(message.get("body", b"") for message in sent[1:])
+    (line,) = [json.loads(line) for line in body.splitlines()]
+    assert line["hasNext"] is False
+    assert (
+        sorted(line["data"]["buildings"], key=lambda item: item["label"]) == BUILDINGS
+    )
@@ -0,0 +1,120 @@
+import asyncio
+
+import pytest
+
+from sqlalchemy import delete, select, text, update
+from sqlalchemy.orm import Session
+
+from customers import mutations
+from customers.model import Customer, Site, Building, Position
+
+
+EXPECTED_SITES = """
+SELECT site_id, count(*), min(long), min(lat), max(long), max(lat)
+FROM buildings GROUP BY site_id ORDER BY site_id
+"""
+SITE_SUMMARIES = """
+SELECT site_id, buildings_count, long_1, lat_1, long_2, lat_2
+FROM site_summaries WHERE buildings_count > 0 ORDER BY site_id
+"""
+EXPECTED_CUSTOMERS = """
+SELECT customer_id, count(*) FROM sites GROUP BY customer_id ORDER BY customer_id
+"""
+CUSTOMER_SUMMARIES = """
+SELECT customer_id, sites_count FROM customer_summaries
+WHERE sites_count > 0 ORDER BY customer_id
+"""
+
+
+def check(db):
+    """Summaries match the counts and extents computed from scratch."""
+    with Session(db) as s:
+        sites = s.execute(text(SITE_SUMMARIES)).all()
+        assert sites == s.execute(text(EXPECTED_SITES)).all()
+        customers = s.execute(text(CUSTOMER_SUMMARIES)).all()
+        assert customers == s.execute(text(EXPECTED_CUSTOMERS)).all()
+        return {row[0]: row[1:] for row in sites}
+
+
+@pytest.fixture
+def tree(db, db_service, clean):
+    with Session(db) as s:
+        a, b = Customer(name="a"), Customer(name="b")
+        a0, a1, b0 = (
+            Site(owner=a, label="a0"),
+            Site(owner=a, label="a1"),
+            Site(owner=b, label="b0"),
+        )
+        a0.buildings = [
+            Building(label="a0_0", position=Position(1, 1)),
+            Building(label="a0_1", position=Position(2, 3)),
+        ]
+        a1.buildings = [Building(label="a1_0")]
+        b0.buildings = [Building(label="b0_0", position=Position(5, 5))]
+        s.add_all([a0, a1, b0])
+        s.commit()
+        ids = {entity.name: entity.id for entity in (a, b)}
+        ids.update({site.label: site.id for site in (a0, a1, b0)})
+        for building in s.execute(select(Building)).scalars():
+            ids[building.label] = building.id
+    return ids
+
+
+def run(coroutine_function, *args):
+    from customers.datalayer import get_db_service
+
+    async def scenario():
+        async with get_db_service().session() as s:
+            result = await coroutine_function(s, *args)
+            await s.commit()
+            return result
+
+    return asyncio.run(scenario())
+
+
+def test_inserts(db, tree):
+    extents = check(db)
+    assert extents[tree["a0"]] == (2, 1, 1, 2, 3)
+    assert extents[tree["a1"]] == (1, None, None, None, None)
+
+    # COPY import
+    rows = [("a1_1", tree["a1"], 7, 8), ("a0_2", tree["a0"], 0, 4)]
+    run(mutations.import_buildings, rows)
+    extents = check(db)
+    assert extents[tree["a0"]] == (3, 0, 1, 2, 4)
+    assert extents[tree["a1"]] == (2, 7, 8, 7, 8)
+
+
+def test_updates(db, tree):
+    with Session(db) as s:
+        # labels only: the extents are not computed again
+        s.execute(update(Building).values(label=Building.label + "_"))
+        # the building at the extent corner moves to another site
+        s.execute(
+            update(Building)
+            .where(Building.id == tree["a0_1"])
+            .values(site_id=tree["b0"], long=6, lat=6)
+        )
+        s.execute(
+            update(Site).where(Site.id == tree["b0"]).values(customer_id=tree["a"])
+        )
+        s.commit()
+    extents = check(db)
+    assert extents[tree["a0"]] == (1, 1, 1, 1, 1)
+    assert extents[tree["b0"]] == (2, 5, 5, 6, 6)
+
+
+def test_deletes(db, tree):
+    with Session(db) as s:
+        s.execute(delete(Building).where(Building.id == tree["a0_1"]))
+        s.commit()
+    assert check(db)[tree["a0"]] == (1, 1, 1, 1, 1)
+
+    # cascades decided from the summaries
+    assert run(mutations.delete_buildings, [tree["a0_0"], tree["b0_0"]]) == (2, 2, 1)
+    assert check(db) == {tree["a1"]: (1, None, None, None, None)}
+    with Session(db) as s:
+        assert s.execute(select(Customer.name)).scalars().all() == ["a"]
+        assert s.execute(text("SELECT count(*) FROM site_summaries")).scalar() == 1
+    assert run(mutations.delete_site, tree["a1"]) == (1, 1, 1)
+    assert check(db) == {}
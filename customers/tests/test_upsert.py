@@ -0,0 +1,195 @@
+import pytest
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from customers.model import Area, Customer, Site, Building, Position
+
+
+UPSERT = """
+mutation ($customer: CustomerTreeInput!) {
+  upsertCustomerTree(customer: $customer) {
+    customer { id name }
+    sites { id label area { bottomCorner { long } } }
+    buildings { id label position { long lat } }
+  }
+}
+"""
+
+AREA = {
+    "bottomCorner": {"long": "1.0", "lat": "1.0"},
+    "topCorner": {"long": "2.0", "lat": "2.0"},
+}
+AREA_MODEL = Area(Position("1.0", "1.0"), Position("2.0", "2.0"))
+
+
+def tree(sites=10, buildings=20):
+    return {
+        "name": "tree",
+        "sites": [
+            {
+                "label": f"site_{i}",
+                "area": AREA,
+                "buildings": [
+                    {
+                        "label": f"building_{i}_{j}",
+                        "position": {"long": "1.5", "lat": f"1.{j:02}"},
+                    }
+                    for j in range(buildings)
+                ],
+            }
+            for i in range(sites)
+        ],
+    }
+
+
+@pytest.mark.usefixtures("clean")
+def test_create_tree(db, count_queries, monkeypatch, execute_result):
+    monkeypatch.setattr("customers.mutations.UPSERT_ROWS", 150)
+    with count_queries() as queries:
+        result = execute_result(UPSERT, customer=tree())
+    assert result.errors is None
+    # customer, sites, then buildings by 150
+    assert len(queries) == 4
+    data = result.data["upsertCustomerTree"]
+    assert [site["label"] for site in data["sites"]] == [f"site_{i}" for i in range(10)]
+    assert len(data["buildings"]) == 200
+    with Session(db) as s:
+        customer = s.execute(select(Customer)).scalar_one()
+        assert customer.id == data["customer"]["id"]
+        sites = s.execute(select(Site).order_by(Site.id)).scalars().all()
+        assert [site.id for site in sites] == [site["id"] for site in data["sites"]]
+        assert all(site.customer_id == customer.id for site in sites)
+        buildings = {
+            b.id: (b.site_id, b.label, b.position)
+            for b in s.execute(select(Building)).scalars()
+        }
+    assert buildings[data["buildings"][21]["id"]] == (
+        data["sites"][1]["id"],
+        "building_1_1",
+        Position("1.5", "1.01"),
+    )
+    assert len(buildings) == 200
+
+
+@pytest.mark.usefixtures("clean")
+def test_update_tree(db, execute_result):
+    data = execute_result(UPSERT, customer=tree(2, 2)).data["upsertCustomerTree"]
+    site = data["sites"][0]
+    building = data["buildings"][0]
+    result = execute_result(
+        UPSERT,
+        customer={
+            "id": data["customer"]["id"],
+            "name": "renamed",
+            "sites": [
+                {
+                    "id": site["id"],
+                    "label": "renamed_site",
+                    "city": None,
+                    "buildings": [
+                        {"id": building["id"], "label": "renamed_building"},
+                        {
+                            "label": "new_building",
+                            "position": {"long": "1.5", "lat": "1.5"},
+                        },
+                    ],
+                },
+                {"label": "new_site"},
+            ],
+        },
+    )
+    assert result.errors is None
+    with Session(db) as s:
+        assert s.execute(select(Customer.name)).scalars().all() == ["renamed"]
+        updated = s.get(Site, site["id"])
+        assert updated.label == "renamed_site"
+        # left out: kept, null: cleared
+        assert updated.area == AREA_MODEL
+        assert updated.city is None
+        assert s.get(Building, building["id"]).label == "renamed_building"
+        assert s.get(Building, building["id"]).position == Position("1.5", "1.00")
+        assert len(s.execute(select(Site.id)).all()) == 3
+        labels = s.execute(select(Building.label).filter_by(site_id=site["id"]))
+        assert sorted(labels.scalars()) == [
+            "building_0_1",
+            "new_building",
+            "renamed_building",
+        ]
+
+
+@pytest.mark.usefixtures("clean")
+def test_upsert_errors_write_nothing(db, execute_result):
+    data = execute_result(UPSERT, customer=tree(1, 1)).data["upsertCustomerTree"]
+    other = execute_result(
+        UPSERT, customer={"name": "other", "sites": [{"label": "s"}]}
+    )
+    other_site = other.data["upsertCustomerTree"]["sites"][0]["id"]
+
+    # the site belongs to another customer
+    result = execute_result(
+        UPSERT,
+        customer={
+            "id": data["customer"]["id"],
+            "name": "tree",
+            "sites": [{"label": "new"}, {"id": other_site, "label": "stolen"}],
+        },
+    )
+    assert result.errors[0].message == "site does not exists."
+
+    result = execute_result(
+        UPSERT,
+        customer={
+            "name": "tree",
+            "sites": [
+                {
+                    "label": "new",
+                    "area": AREA,
+                    "buildings": [
+                        {"label": "out", "position": {"long": "3", "lat": "1.5"}}
+                    ],
+                }
+            ],
+        },
+    )
+    assert result.errors[0].message == "building coordinates are not in site area."
+
+    result = execute_result(UPSERT, customer={"id": -1, "name": "nobody"})
+    assert result.errors[0].message == "customer does not exists."
+
+    with Session(db) as s:
+        assert sorted(s.execute(select(Site.label)).scalars()) == ["s", "site_0"]
+        assert len(s.execute(select(Building.id)).all()) == 1
+
+
+@pytest.mark.usefixtures("clean")
+def test_area_change_checks_all_buildings(db, execute_result):
+    data = execute_result(UPSERT, customer=tree(1, 2)).data["upsertCustomerTree"]
+    site = data["sites"][0]
+    smaller = {
+        "bottomCorner": {"long": "1.0", "lat": "1.0"},
+        "topCorner": {"long": "2.0", "lat": "1.005"},
+    }
+    # building_0_1, at lat 1.01, isn't in the tree but left out of the area
+    result = execute_result(
+        UPSERT,
+        customer={
+            "name": "tree",
+            "sites": [{"id": site["id"], "label": "site_0", "area": smaller}],
+        },
+    )
+    assert result.errors[0].message == "building coordinates are not in site area."
+    with Session(db) as s:
+        assert s.get(Site, site["id"]).area == AREA_MODEL
+
+
+@pytest.mark.usefixtures("clean")
+def test_tree_without_id_merges_by_name(db, execute_result):
+    first = execute_result(UPSERT, customer=tree(1, 0)).data["upsertCustomerTree"]
+    result = execute_result(
+        UPSERT, customer={"name": "tree", "sites": [{"label": "more"}]}
+    )
+    merged = result.data["upsertCustomerTree"]
+    assert merged["customer"] == first["customer"]
+    with Session(db) as s:
+        assert sorted(s.execute(select(Site.label)).scalars()) == ["more", "site_0"]
@@ -9,6 +9,20 @@ from sqlalchemy.orm import Session
 from sqlalchemy.pool import StaticPool
 
 from customers import model
+from customers.geoindex import AreaIndex
+
+
+def random_area(index):
+    """Random site area which doesn't overlap an already indexed one."""
+    while True:
+        x_pos = Decimal(str(round(random() * 177 * choice((1, -1)), 5)))
+        y_pos = Decimal(str(round(random() * 65 * choice((1, -1)), 5)))
+        area = model.Area(
+            model.Position(x_pos, y_pos),
+            model.Position(x_pos + Decimal("0.0002"), y_pos + Decimal("0.0002")),
+        )
+        if not index.overlaps(area):
+            return x_pos, y_pos, area
 
 
 if __name__ == "__main__":
@@ -23,20 +37,15 @@ if __name__ == "__main__":
         db_url, connect_args={"password": db_password}, poolclass=StaticPool
     )
     with Session(eng) as s:
+        index = AreaIndex.from_areas(
+            (site.id, site.area) for site in s.query(model.Site) if site.area
+        )
         for customer in s.query(model.Customer):
             print(customer)
             for i in range(randint(1, 4)):
-                x_pos = Decimal(str(round(random() * 177 * choice((1, -1)), 5)))
-                y_pos = Decimal(str(round(random() * 65 * choice((1, -1)), 5)))
-                site = model.Site(
-                    label=f"{customer.name}_site_{i + 1}",
-                    area=model.Area(
-                        model.Position(x_pos, y_pos),
-                        model.Position(
-                            x_pos + Decimal("0.0002"), y_pos + Decimal("0.0002")
-                        ),
-                    ),
-                )
+                x_pos, y_pos, area = random_area(index)
+                site = model.Site(label=f"{customer.name}_site_{i + 1}", area=area)
+                index.add(site.label, area)
                 customer.sites.append(site)
                 s.add(site)
                 print(site, site.area)
@@ -0,0 +1,123 @@
+"""Import buildings from a CSV file with a `label,site_id,long,lat` header.
+
+Rows which can't be parsed or don't fit their site are reported with their
+line number, the other ones are imported. Rows without `site_id` go to the
+first site whose area contains their position: those in no site area are
+reported with the site whose area is the nearest.
+
+    % POSTGRES_URL=postgresql+psycopg2://postgres@localhost:5432/customers_2 PYTHONPATH=.:.. python tools/import_buildings.py buildings.csv
+"""
+from decimal import Decimal, InvalidOperation
+from getpass import getpass
+import asyncio
+import csv
+import os
+import sys
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+
+from customers import model, mutations
+from customers.geo import Position, locate, nearest
+
+
+# rows imported in each transaction
+BATCH_SIZE = 50_000
+
+
+def parse(row):
+    label, site_id, long, lat = (row + [""] * 4)[:4]
+    long, lat = (Decimal(long) if long else None), (Decimal(lat) if lat else None)
+    return label or None, int(site_id) if site_id else None, long, lat
+
+
+def read_batches(lines):
+    """Yield lists of `(line number, building)`, reporting unparsable rows."""
+    batch = []
+    for row in lines:
+        try:
+            batch.append((lines.line_num, parse(row)))
+        except (ValueError, InvalidOperation):
+            print(f"line {lines.line_num}: cannot parse {row}", file=sys.stderr)
+            continue
+        if len(batch) == BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def site_areas(eng):
+    """Ids and areas of the sites having an area."""
+    async with AsyncSession(eng) as s:
+        sites = (await s.execute(select(model.Site).order_by(model.Site.id))).scalars()
+        sites = [site for site in sites if site.area]
+    return [site.id for site in sites], [site.area for site in sites]
+
+
+def assign_sites(batch, site_ids, areas):
+    """Give the rows of `batch` with a position but no site the first site
+    whose area contains it.
+
+    Return the nearest site of the rows left without site, by row index.
+    """
+    missing = [
+        i
+        for i, (_, (_, site_id, long, lat)) in enumerate(batch)
+        if site_id is None and long is not None and lat is not None
+    ]
+    positions = [Position(*batch[i][1][2:]) for i in missing]
+    found = locate(positions, areas).tolist()
+    for i, j in zip(missing, found):
+        if j >= 0:
+            line, (label, _, long, lat) = batch[i]
+            batch[i] = line, (label, site_ids[j], long, lat)
+    outside = [k for k, j in enumerate(found) if j < 0]
+    near = nearest([positions[k] for k in outside], areas).tolist()
+    return {missing[k]: site_ids[j] for k, j in zip(outside, near) if j >= 0}
+
+
+async def import_file(eng, path):
+    imported = 0
+    site_ids, areas = await site_areas(eng)
+    with open(path, newline="") as f:
+        lines = csv.reader(f)
+        next(lines, None)
+        for batch in read_batches(lines):
+            nearest_sites = assign_sites(batch, site_ids, areas)
+            async with AsyncSession(eng) as s:
+                ids, errors = await mutations.import_buildings(
+                    s, (building for _, building in batch)
+                )
+                await s.commit()
+            imported += len(ids) - len(errors)
+            for i, message in errors:
+                if i in nearest_sites:
+                    message = (
+                        "position is in no site area,"
+                        f" the nearest one is of site {nearest_sites[i]}."
+                    )
+                print(f"line {batch[i][0]}: {message}", file=sys.stderr)
+    return imported
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print(f"usage: {sys.argv[0]} buildings.csv", file=sys.stderr)
+        sys.exit(1)
+
+    db_password = getpass("db password:")
+
+    if not (db_url := os.environ.get("POSTGRES_URL", False)):
+        print("Don't know where db is. Fill POSTGRES_URL.", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"connect to {db_url}")
+    eng = create_async_engine(
+        make_url(db_url).set(drivername="postgresql+asyncpg"),
+        connect_args={"password": db_password},
+        poolclass=NullPool,
+    )
+    print(f"{asyncio.run(import_file(eng, sys.argv[1]))} buildings imported")